@@ -1,8 +1,23 @@
-from .amplicon_coverage import amplicon_coverage, gc_depth
-from .analyze import find_mutants
-from .cmds import aa, nt
-from .lineages import find_lineages
-# from .consensus import consensus_from_bam
+# Subcommands are imported when they run so that light commands like nt and aa
+# don't load numpy, the mutation catalogue or the plotting libraries
+_exports = {
+    'amplicon_coverage': '.amplicon_coverage',
+    'gc_depth': '.amplicon_coverage',
+    'find_mutants': '.analyze',
+    'aa': '.cmds',
+    'nt': '.cmds',
+    'find_lineages': '.lineages',
+    'find_lineages_in_bams': '.lineages',
+    'consensus': '.consensus',
+}
+
+
+def __getattr__(name):
+    # Keeps `from alcov import find_lineages` etc. working
+    if name in _exports:
+        from importlib import import_module
+        return getattr(import_module(_exports[name], __name__), name)
+    raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
 
 
 class CovBreakdown(object):
@@ -11,20 +26,48 @@ class CovBreakdown(object):
     def __str__(self):
         return "Identify frequencies of concerning mutations from aligned reads"
 
-    def aa(self, mut):
-        aa(mut)
+    def aa(self, mut=None, file=None):
+        from .cmds import aa
+        aa(mut, file=file)
+
+    def nt(self, mut=None, file=None):
+        from .cmds import nt
+        nt(mut, file=file)
+
+    def find_mutants(self, samples_path, mutations_path=None, min_depth=40, save_img=False, csv=False, cache_dir=None, workers=1, store=None, no_plot=False, mask_primers=None, threads=1, profile=None, profile_sample=None):
+        from . import profiling
+        from .analyze import find_mutants
+        with profiling.command(profile, profile_sample):
+            find_mutants(samples_path, mutations_path=mutations_path, min_depth=min_depth, save_img=save_img, csv=csv, cache_dir=cache_dir, workers=workers, store=store, no_plot=no_plot, mask_primers=mask_primers, threads=threads)
+
+    def find_lineages(self, samples_path, lineages_path=None, ts=False, csv=False, min_depth=40, show_stacked=False, unique=False, save_img=False, l2=False, cache_dir=None, workers=1, solver='glop', time_limit=None, min_support=1, min_support_freq=0, min_support_fraction=0.9, hierarchical=False, clade_threshold=0.02, num_clades=50, store=None, no_plot=False, mask_primers=None, threads=1, profile=None, profile_sample=None):
+        from . import profiling
+        from .lineages import find_lineages
+        with profiling.command(profile, profile_sample):
+            find_lineages(samples_path, lineages_path=lineages_path, ts=ts, csv=csv, min_depth=min_depth, show_stacked=show_stacked, unique=unique, save_img=save_img, l2=l2, cache_dir=cache_dir, workers=workers, solver=solver, time_limit=time_limit, min_support=min_support, min_support_freq=min_support_freq, min_support_fraction=min_support_fraction, hierarchical=hierarchical, clade_threshold=clade_threshold, num_clades=num_clades, store=store, no_plot=no_plot, mask_primers=mask_primers, threads=threads)
 
-    def nt(self, mut):
-        nt(mut)
+    def watch(self, directory, output=None, mutations_path=None, min_depth=40, l2=False, solver='glop', cache_dir=None, workers=1, interval=1, settle=2, once=False, mask_primers=None, threads=1):
+        from .watch import watch
+        watch(directory, output=output, mutations_path=mutations_path, min_depth=min_depth, l2=l2, solver=solver, cache_dir=cache_dir, workers=workers, interval=interval, settle=settle, once=once, mask_primers=mask_primers, threads=threads)
 
-    def find_mutants(self, samples_path, mutations_path=None, min_depth=40, save_img=False, csv=False):
-        find_mutants(samples_path, mutations_path=mutations_path, min_depth=min_depth, save_img=save_img, csv=csv)
+    def consensus(self, samples_path, output=None, threshold=None, min_depth=10, ambiguity=True, gaps=False, cache_dir=None, workers=1, mask_primers=None, threads=1, profile=None, profile_sample=None):
+        from . import profiling
+        from .consensus import consensus
+        with profiling.command(profile, profile_sample):
+            consensus(samples_path, output=output, threshold=threshold, min_depth=min_depth, ambiguity=ambiguity, gaps=gaps, cache_dir=cache_dir, workers=workers, mask_primers=mask_primers, threads=threads)
 
-    def find_lineages(self, samples_path, lineages_path=None, ts=False, csv=False, min_depth=40, show_stacked=False, unique=False, save_img=False, l2=False):
-        find_lineages(samples_path, lineages_path=lineages_path, ts=ts, csv=csv, min_depth=min_depth, show_stacked=show_stacked, unique=unique, save_img=save_img, l2=l2)
+    def plot(self, results_path, save_img=False):
+        from .results import plot_results
+        plot_results(results_path, save_img=save_img)
 
-    def amplicon_coverage(self, samples_path):
-        amplicon_coverage(samples_path)
+    def amplicon_coverage(self, samples_path, scheme='artic-v3', min_depth=40, csv=False, workers=1, store=None, no_plot=False, threads=1, profile=None, profile_sample=None):
+        from . import profiling
+        from .amplicon_coverage import amplicon_coverage
+        with profiling.command(profile, profile_sample):
+            amplicon_coverage(samples_path, scheme=scheme, min_depth=min_depth, csv=csv, workers=workers, store=store, no_plot=no_plot, threads=threads)
 
-    def gc_depth(self, samples_path):
-        gc_depth(samples_path)
+    def gc_depth(self, samples_path, scheme='artic-v3', min_depth=40, csv=False, workers=1, store=None, no_plot=False, threads=1, profile=None, profile_sample=None):
+        from . import profiling
+        from .amplicon_coverage import gc_depth
+        with profiling.command(profile, profile_sample):
+            gc_depth(samples_path, scheme=scheme, min_depth=min_depth, csv=csv, workers=workers, store=store, no_plot=no_plot, threads=threads)
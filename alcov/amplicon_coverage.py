@@ -1,9 +1,16 @@
-from .artic_amplicons import inserts
+from functools import partial
+
+from .batch import map_samples, read_samples
 from .convert_mutations import aa, nt
+from .profiling import profiled
+from .schemes import DEFAULT_SCHEME, load_scheme
+
 
+# Reads an amplicon's bases need to count as covered
+MIN_DEPTH = 40
 
-# inserts = inserts[1:98]
 
+@profiled('plot')
 def plot_depths(sample_results, sample_names):
     import numpy as np
     import pandas as pd
@@ -13,7 +20,7 @@ def plot_depths(sample_results, sample_names):
     # sns.set_theme(style="whitegrid")
     # samples = sum([98*[name] for name in sample_names], [])
     # samples = [s[71:85] for s in samples]
-    samples = sum([len(inserts)*[name] for name in sample_names], [])
+    samples = sum([len(amplicon)*[name] for name, amplicon in zip(sample_names, sample_results)], [])
     amplicons = sum([list(amplicon.keys()) for amplicon in sample_results], [])
     # pools = ['Pool 1' if int(a) % 2 == 0 else 'Pool 2' for a in amplicons]
     pools = ['Pool 1' if True else 'Pool 2' for a in amplicons]
@@ -29,14 +36,15 @@ def plot_depths(sample_results, sample_names):
     df.to_csv('depth_results.csv', index=False)
     # Plotting code
     g = sns.FacetGrid(df, row="Sample", hue="Pool", height=1.7, aspect=8)
-    g.map(sns.barplot, "Amplicon number", "Log depth", order=[str(i) for i in range(1,99)], hue_order=['Pool 1', 'Pool 2'])
+    g.map(sns.barplot, "Amplicon number", "Log depth", order=sorted(set(amplicons), key=int), hue_order=['Pool 1', 'Pool 2'])
     # plt.locator_params(axis='x', nbins=20)
     plt.locator_params(axis='x')
     plt.savefig('SA_coverage.png')
     plt.show()
 
 
-def plot_depths_gc(sample_results, sample_names):
+@profiled('plot')
+def plot_depths_gc(sample_results, sample_names, schemes=None):
     import numpy as np
     import pandas as pd
     import matplotlib.pyplot as plt
@@ -45,12 +53,15 @@ def plot_depths_gc(sample_results, sample_names):
     from scipy import stats
     # sns.set_theme(style="whitegrid")
     depths = sample_results[0]
-    samples = sum([98*[name] for name in sample_names], [])
+    if schemes is None:
+        schemes = [DEFAULT_SCHEME] * len(sample_names)
+    samples = sum([len(amplicon)*[name] for name, amplicon in zip(sample_names, sample_results)], [])
     # for i in range(len(samples)):
     #     samples[i] = 'Test'
     amplicons = sum([list(amplicon.keys()) for amplicon in sample_results], [])
-    gcs = [inserts[int(a)-1][6] for a in amplicons]
-    pools = ['Pool 1' if int(a) % 2 == 0 else 'Pool 2' for a in amplicons]
+    sample_schemes = sum([len(amplicon)*[load_scheme(scheme)] for scheme, amplicon in zip(schemes, sample_results)], [])
+    gcs = [scheme.gc[int(a)-1] for scheme, a in zip(sample_schemes, amplicons)]
+    pools = ['Pool {}'.format(scheme.pools[int(a)-1]) for scheme, a in zip(sample_schemes, amplicons)]
     depths = sum([[np.log(a+1) for a in amplicon.values()] for amplicon in sample_results], [])
     d = {
         'Sample': samples,
@@ -80,7 +91,7 @@ def plot_amplified_fraction(sample_results, sample_names):
     # sns.set_theme(style="whitegrid")
     depths = sample_results[0]
     d = {
-        'Sample': sum([98*[name] for name in sample_names], []),
+        'Sample': sum([len(amplicon)*[name] for name, amplicon in zip(sample_names, sample_results)], []),
         'Amplicon': sum([list(amplicon.keys()) for amplicon in sample_results], []),
         'Depth': sum([[min(d, 1) for d in amplicon.values()] for amplicon in sample_results], [])
     }
@@ -91,66 +102,155 @@ def plot_amplified_fraction(sample_results, sample_names):
     plt.show()
 
 
-def find_depths_in_bam(bam_path, max_depth=50000):
-    import pysam
+def amplicon_stats(depth, scheme, min_depth=MIN_DEPTH):
+    """
+    Depth at the midpoint of each amplicon's insert, mean and median depth across the
+    insert, and the fraction of its bases covered by at least min_depth reads, from the
+    depth at every 0-based position
+    """
+    import numpy as np
 
-    samfile = pysam.Samfile(bam_path, "rb")
+    starts = scheme.starts
+    stops = scheme.stops
+    lengths = stops - starts
+    # One row of positions per amplicon, padded to the longest
+    idx = starts[:, None] + np.arange(lengths.max())
+    inside = (idx < stops[:, None]) & (idx < len(depth))
+    values = np.where(inside, depth[np.minimum(idx, len(depth) - 1)], np.nan)
+    mids = (starts + stops) // 2
+    return {
+        'amplicon': scheme.labels,
+        'midpoint': np.where(mids < len(depth), depth[np.minimum(mids, len(depth) - 1)], 0),
+        'mean': np.nan_to_num(np.nanmean(values, axis=1)),
+        'median': np.nan_to_num(np.nanmedian(values, axis=1)),
+        'covered': (values >= min_depth).sum(axis=1) / lengths,
+    }
 
-    amp_mids = {int((int(i[1]) + int(i[2])) / 2): i[3] for i in inserts}
-    amplified = {i[3]: 0 for i in inserts}
 
-    for pileupcolumn in samfile.pileup(max_depth=max_depth):
-        pos = pileupcolumn.pos
-        if pos in amp_mids:
-            depth = pileupcolumn.get_num_aligned()
-            amplified[amp_mids[pos]] = depth
-    samfile.close()
+def find_depths_in_bam(bam_path, min_depth=MIN_DEPTH, scheme=DEFAULT_SCHEME, threads=1):
+    # {amplicon: {'midpoint', 'mean', 'median', 'covered'}}, reading only the amplicons
+    from .counts import count_depth
 
-    # SAMPLE_NUM = '2'
+    scheme = load_scheme(scheme)
+    depth = count_depth(bam_path, regions=scheme.regions(), contig=scheme.contig, threads=threads)
+    stats = amplicon_stats(depth, scheme, min_depth)
+    return {
+        amplicon: {
+            'midpoint': int(stats['midpoint'][i]),
+            'mean': round(float(stats['mean'][i]), 2),
+            'median': float(stats['median'][i]),
+            'covered': round(float(stats['covered'][i]), 4),
+        }
+        for i, amplicon in enumerate(stats['amplicon'])
+    }
 
-    # with open('s{}_mixed.csv'.format(SAMPLE_NUM), 'w') as f:
-    #     f.write('\n'.join(['{},{}'.format(insert_name, amplified[insert_name]) for insert_name in amplified.keys()]))
 
-    return amplified
+def read_schemes(file_path, scheme=DEFAULT_SCHEME):
+    """
+    The primer scheme of each sample in a samples file, given by an optional third
+    column, e.g.
+    s1.bam  Sample 1  artic-v3
+    s2.bam  Sample 2  /path/to/V5.3.2/SARS-CoV-2.insert.bed
+    and scheme for samples without one
+    """
+    if file_path.endswith('.bam'):
+        return [scheme]
+    with open(file_path, 'r') as f:
+        samples = [line.rstrip('\r').split('\t') for line in f.read().split('\n')]
+    return [sample[2] if len(sample) > 2 and sample[2] else scheme for sample in samples if sample[0].endswith('.bam')]
 
 
-def amplicon_coverage(file_path):
+def midpoint_depths(sample_stats):
+    # The depths plotted, at each amplicon's midpoint
+    return [{amplicon: stats['midpoint'] for amplicon, stats in amplicons.items()} for amplicons in sample_stats]
+
+
+def write_depths_csv(path, sample_stats, sample_names):
+    with open(path, 'w') as f:
+        f.write('Sample,Amplicon,Midpoint depth,Mean depth,Median depth,Fraction covered\n')
+        for name, amplicons in zip(sample_names, sample_stats):
+            for amplicon, stats in amplicons.items():
+                f.write('{},{},{},{},{},{}\n'.format(name, amplicon, stats['midpoint'], stats['mean'], stats['median'], stats['covered']))
+    print('Amplicon depths written to {}'.format(path))
+
+
+def sample_depths(samples, schemes, min_depth=MIN_DEPTH, workers=1, store=None, threads=1):
+    # Amplicon depths of each sample with its primer scheme, from the store (path of a
+    # SQLite file) if given, so that only the samples it doesn't have yet are read
+    def compute(samples, scheme):
+        find_depths = partial(find_depths_in_bam, min_depth=min_depth, scheme=scheme, threads=threads)
+        return map_samples(find_depths, [(sample[0],) for sample in samples], workers, [sample[1] for sample in samples])
+
+    sample_results = [None] * len(samples)
+    if store is not None:
+        from .store import ResultStore, stored_results
+        store = ResultStore(store)
+    # Samples of one scheme at a time, each scheme being an analysis of its own in the store
+    for scheme in sorted(set(schemes), key=schemes.index):
+        idxs = [i for i in range(len(samples)) if schemes[i] == scheme]
+        group = [samples[i] for i in idxs]
+        if store is None:
+            results = compute(group, scheme)
+        else:
+            analysis = store.analysis('amplicon_depths', {'min_depth': min_depth, 'scheme': load_scheme(scheme).checksum})
+            results = stored_results(store, group, partial(compute, scheme=scheme),
+                                     has=partial(store.is_computed, analysis=analysis),
+                                     put=lambda fingerprint, result, analysis=analysis: store.put_depths(fingerprint, analysis, result),
+                                     get=partial(store.get_depths, analysis=analysis))
+        for i, result in zip(idxs, results):
+            sample_results[i] = result
+    if store is not None:
+        store.close()
+    return sample_results
+
+
+def amplicon_coverage(file_path, scheme=DEFAULT_SCHEME, min_depth=MIN_DEPTH, csv=False, workers=1, store=None, no_plot=False, threads=1):
     """
     Accepts either a bam file or a tab delimited  txt file like
     s1.bam  Sample 1
     s2.bam  Sample 2
+    Amplicons are those of scheme (see schemes.py), unless the file gives each sample's
+    scheme in a third column.
+    With csv, the midpoint, mean and median depth of each amplicon and the fraction of
+    it covered by min_depth reads are written to a CSV file.
+    With no_plot, depths are saved as JSON for `alcov plot` instead of plotted. BAMs
+    are decompressed in threads threads.
     """
-    sample_results = []
-    sample_names = []
-    if file_path.endswith('.bam'):
-        sample_results.append(find_depths_in_bam(file_path))
-        sample_names.append('')
-    else:
-        with open(file_path, 'r') as f:
-            samples = [line.split('\t') for line in f.read().split('\n')]
-        for sample in samples:
-            if sample[0].endswith('.bam'): # Mostly for filtering empty
-                sample_results.append(find_depths_in_bam(sample[0]))
-                sample_names.append(sample[1])
+    samples = read_samples(file_path)
+    schemes = read_schemes(file_path, scheme)
+    sample_stats = sample_depths(samples, schemes, min_depth, workers, store, threads)
+    sample_names = [sample[1] for sample in samples]
+    if csv:
+        write_depths_csv('{}_amplicon_depths.csv'.format(file_path.replace('.txt', '')), sample_stats, sample_names)
+    sample_results = midpoint_depths(sample_stats)
+    if no_plot:
+        from .results import save_results
+        save_results('{}_depths.json'.format(file_path.replace('.txt', '')), 'amplicon_coverage', sample_names, sample_results, schemes=schemes)
+        return
     plot_depths(sample_results, sample_names)
 
 
-def gc_depth(file_path):
+def gc_depth(file_path, scheme=DEFAULT_SCHEME, min_depth=MIN_DEPTH, csv=False, workers=1, store=None, no_plot=False, threads=1):
     """
     Accepts either a bam file or a tab delimited  txt file like
     s1.bam  Sample 1
     s2.bam  Sample 2
+    Amplicons are those of scheme (see schemes.py), unless the file gives each sample's
+    scheme in a third column.
+    With csv, the midpoint, mean and median depth of each amplicon and the fraction of
+    it covered by min_depth reads are written to a CSV file.
+    With no_plot, depths are saved as JSON for `alcov plot` instead of plotted. BAMs
+    are decompressed in threads threads.
     """
-    sample_results = []
-    sample_names = []
-    if file_path.endswith('.bam'):
-        sample_results.append(find_depths_in_bam(file_path))
-        sample_names.append('')
-    else:
-        with open(file_path, 'r') as f:
-            samples = [line.split('\t') for line in f.read().split('\n')]
-        for sample in samples:
-            if sample[0].endswith('.bam'): # Mostly for filtering empty
-                sample_results.append(find_depths_in_bam(sample[0]))
-                sample_names.append(sample[1])
-    plot_depths_gc(sample_results, sample_names)
+    samples = read_samples(file_path)
+    schemes = read_schemes(file_path, scheme)
+    sample_stats = sample_depths(samples, schemes, min_depth, workers, store, threads)
+    sample_names = [sample[1] for sample in samples]
+    if csv:
+        write_depths_csv('{}_amplicon_depths.csv'.format(file_path.replace('.txt', '')), sample_stats, sample_names)
+    sample_results = midpoint_depths(sample_stats)
+    if no_plot:
+        from .results import save_results
+        save_results('{}_gc_depth.json'.format(file_path.replace('.txt', '')), 'gc_depth', sample_names, sample_results, schemes=schemes)
+        return
+    plot_depths_gc(sample_results, sample_names, schemes)
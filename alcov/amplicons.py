@@ -1 +0,0 @@
-inserts = [['MN908947.3', '50', '408', '1', '+', '1'], ['MN908947.3', '344', '705', '2', '+', '2'], ['MN908947.3', '666', '1017', '1', '+', '3'], ['MN908947.3', '966', '1337', '2', '+', '4'], ['MN908947.3', '1266', '1623', '1', '+', '5'], ['MN908947.3', '1562', '1925', '2', '+', '6'], ['MN908947.3', '1875', '2228', '1', '+', '7'], ['MN908947.3', '2180', '2544', '2', '+', '8'], ['MN908947.3', '2508', '2861', '1', '+', '9'], ['MN908947.3', '2850', '3156', '2', '+', '0'], ['MN908947.3', '3102', '3470', '1', '+', '1'], ['MN908947.3', '3412', '3769', '2', '+', '2'], ['MN908947.3', '3705', '4067', '1', '+', '3'], ['MN908947.3', '4018', '4387', '2', '+', '4'], ['MN908947.3', '4339', '4685', '1', '+', '5'], ['MN908947.3', '4648', '4995', '2', '+', '6'], ['MN908947.3', '4953', '5302', '1', '+', '7'], ['MN908947.3', '5259', '5620', '2', '+', '8'], ['MN908947.3', '5584', '5932', '1', '+', '9'], ['MN908947.3', '5894', '6247', '2', '+', '0'], ['MN908947.3', '6210', '6553', '1', '+', '1'], ['MN908947.3', '6507', '6859', '2', '+', '2'], ['MN908947.3', '6776', '7122', '1', '+', '3'], ['MN908947.3', '7084', '7440', '2', '+', '4'], ['MN908947.3', '7403', '7747', '1', '+', '5'], ['MN908947.3', '7695', '8063', '2', '+', '6'], ['MN908947.3', '8019', '8367', '1', '+', '7'], ['MN908947.3', '8326', '8691', '2', '+', '8'], ['MN908947.3', '8619', '8990', '1', '+', '9'], ['MN908947.3', '8944', '9306', '2', '+', '0'], ['MN908947.3', '9192', '9535', '1', '+', '1'], ['MN908947.3', '9497', '9842', '2', '+', '2'], ['MN908947.3', '9805', '10150', '1', '+', '3'], ['MN908947.3', '10099', '10465', '2', '+', '4'], ['MN908947.3', '10419', '10785', '1', '+', '5'], ['MN908947.3', '10742', '11092', '2', '+', '6'], ['MN908947.3', '11023', '11388', '1', '+', '7'], ['MN908947.3', '11330', '11689', '2', '+', '8'], ['MN908947.3', '11651', '12011', '1', '+', '9'], ['MN908947.3', '11963', '12317', '2', '+', '0'], ['MN908947.3', '12255', '12618', '1', '+', '1'], ['MN908947.3', '12546', '12895', '2', '+', '2'], ['MN908947.3', '12856', '13218', '1', '+', '3'], ['MN908947.3', '13148', '13506', '2', '+', '4'], ['MN908947.3', '13485', '13833', '1', '+', '5'], ['MN908947.3', '13775', '14120', '2', '+', '6'], ['MN908947.3', '14075', '14428', '1', '+', '7'], ['MN908947.3', '14362', '14717', '2', '+', '8'], ['MN908947.3', '14674', '15023', '1', '+', '9'], ['MN908947.3', '14983', '15336', '2', '+', '0'], ['MN908947.3', '15237', '15596', '1', '+', '1'], ['MN908947.3', '15557', '15917', '2', '+', '2'], ['MN908947.3', '15881', '16239', '1', '+', '3'], ['MN908947.3', '16137', '16483', '2', '+', '4'], ['MN908947.3', '16408', '16767', '1', '+', '5'], ['MN908947.3', '16714', '17082', '2', '+', '6'], ['MN908947.3', '17013', '17381', '1', '+', '7'], ['MN908947.3', '17345', '17688', '2', '+', '8'], ['MN908947.3', '17642', '17997', '1', '+', '9'], ['MN908947.3', '17939', '18307', '2', '+', '0'], ['MN908947.3', '18267', '18624', '1', '+', '1'], ['MN908947.3', '18578', '18936', '2', '+', '2'], ['MN908947.3', '18891', '19252', '1', '+', '3'], ['MN908947.3', '19208', '19558', '2', '+', '4'], ['MN908947.3', '19513', '19877', '1', '+', '5'], ['MN908947.3', '19836', '20186', '2', '+', '6'], ['MN908947.3', '20117', '20472', '1', '+', '7'], ['MN908947.3', '20405', '20766', '2', '+', '8'], ['MN908947.3', '20699', '21050', '1', '+', '9'], ['MN908947.3', '21013', '21358', '2', '+', '0'], ['MN908947.3', '21316', '21675', '1', '+', '1'], ['MN908947.3', '21561', '21904', '2', '+', '2'], ['MN908947.3', '21889', '22247', '1', '+', '3'], ['MN908947.3', '22113', '22474', '2', '+', '4'], ['MN908947.3', '22428', '22785', '1', '+', '5'], ['MN908947.3', '22774', '23028', '2', '+', '6'], ['MN908947.3', '22974', '23327', '1', '+', '7'], ['MN908947.3', '23246', '23611', '2', '+', '8'], ['MN908947.3', '23575', '23914', '1', '+', '9'], ['MN908947.3', '23876', '24233', '2', '+', '0'], ['MN908947.3', '24194', '24545', '1', '+', '1'], ['MN908947.3', '24448', '24814', '2', '+', '2'], ['MN908947.3', '24772', '25122', '1', '+', '3'], ['MN908947.3', '25076', '25438', '2', '+', '4'], ['MN908947.3', '25353', '25711', '1', '+', '5'], ['MN908947.3', '25672', '26026', '2', '+', '6'], ['MN908947.3', '25979', '26338', '1', '+', '7'], ['MN908947.3', '26277', '26635', '2', '+', '8'], ['MN908947.3', '26621', '26956', '1', '+', '9'], ['MN908947.3', '26895', '27218', '2', '+', '0'], ['MN908947.3', '27177', '27534', '1', '+', '1'], ['MN908947.3', '27473', '27826', '2', '+', '2'], ['MN908947.3', '27726', '28082', '1', '+', '3'], ['MN908947.3', '28021', '28394', '2', '+', '4'], ['MN908947.3', '28214', '28572', '1', '+', '5'], ['MN908947.3', '28536', '28893', '2', '+', '6'], ['MN908947.3', '28849', '29206', '1', '+', '7'], ['MN908947.3', '29161', '29512', '2', '+', '8'], ['MN908947.3', '29475', '29827', '1', '+', '9']]
@@ -1,5 +1,10 @@
-from .convert_mutations import aa, nt
-from .mutations import mutations as mut_lins
+from functools import partial
+
+from .batch import map_samples, read_samples
+from .convert_mutations import aa, aa_many
+from .heatmap import is_annotated, plot_raster_heatmap
+from .mutation_matrix import load_mutation_matrix
+from .profiling import profiled, stage
 
 
 def parse_snv(snv):
@@ -20,27 +25,12 @@ def parse_mutation(mut):
     return [parse_snv(m) for m in muts]
 
 
-def mut_in_col(pileupcolumn, mut):
-    muts = 0
-    not_muts = 0
-    if mut == '-':
-        for pileupread in pileupcolumn.pileups:
-            if pileupread.is_del:
-                muts += 1
-            else:
-                not_muts += 1
-    else:
-        for pileupread in pileupcolumn.pileups:
-            qpos = pileupread.query_position
-            if qpos is None:
-                not_muts += 1
-                continue
-            base = pileupread.alignment.query_sequence[qpos]
-            if base == mut:
-                muts += 1
-            else:
-                not_muts += 1
-    return muts, not_muts
+@profiled('parse_mutations')
+def parse_mutation_list(mutations):
+    # SNVs of each mutation, with all amino acid mutations converted in one batch
+    aas = [mut for mut in mutations if ':' in mut]
+    nt_muts = dict(zip(aas, aa_many(aas)))
+    return {mut: [parse_snv(m) for m in nt_muts.get(mut, [mut])] for mut in mutations}
 
 
 def print_mut_results(mut_results, min_depth):
@@ -75,6 +65,7 @@ def print_mut_results(mut_results, min_depth):
     print('{}/{} mutations covered'.format(cov, len(mut_results)))
     print('{}/{} mutations detected'.format(mut_cov, len(mut_results)))
 
+@profiled('plot')
 def plot_mutations(sample_results, sample_names, min_depth, img_path):
     import numpy as np
     import matplotlib.pyplot as plt
@@ -102,6 +93,10 @@ def plot_mutations(sample_results, sample_names, min_depth, img_path):
             mut_fractions[i].append(round(fraction, 4))
 
     no_reads = np.array([[f == -1 for f in fractions] for fractions in mut_fractions])
+    if not is_annotated(num_mutations, len(sample_names)):
+        plot_raster_heatmap(mut_fractions, list(names), sample_names, img_path, vmin=0, vmax=1, mask=no_reads,
+                            xlabel='Sample', ylabel='Mutation')
+        return
 
 # get the tick label font size
     fontsize_pt = plt.rcParams['ytick.labelsize']
@@ -167,25 +162,30 @@ def write_csv(sample_results, sample_names, min_depth, home_lab, mutants_name):
     with open('{0}_{1}_mutations.csv'.format(home_lab, mutants_name), 'w') as f:
         f.write('\n'.join(','.join(row) for row in [csv_headers] + csv_rows))
 
-def find_mutants_in_bam(bam_path, mutations):
-    import pysam
+def merge_positions(positions, max_gap=1000):
+    # Merge 1-based positions into 0-based half-open regions for the BAM index
+    # Nearby sites share a region so overlapping reads are only decoded once
+    regions = []
+    for pos in sorted(positions):
+        if len(regions) and pos - 1 - regions[-1][1] <= max_gap:
+            regions[-1][1] = pos
+        else:
+            regions.append([pos - 1, pos])
+    return regions
 
-    samfile = pysam.Samfile(bam_path, "rb")
+
+def find_mutants_in_bam(bam_path, mutations, cache_dir=None, mask_primers=None, threads=1):
+    from .cache import load_counts
 
     # parsed_muts = [parse_snv(mut) for mut in mutations]
-    parsed_muts = {}
-    for mut in mutations:
-        parsed_muts[mut] = parse_mutation(mut)
-    mut_results = {mut: {snv_name(m): [0,0] for m in parsed_muts[mut]} for mut in mutations}
-
-    for pileupcolumn in samfile.pileup(stepper='nofilter'):
-        pos = pileupcolumn.pos + 1
-        for mut in parsed_muts:
-            for m in parsed_muts[mut]:
-                if pos == m[1]:
-                    muts, not_muts = mut_in_col(pileupcolumn, m[2])
-                    mut_results[mut][snv_name(m)] = [muts, not_muts]
-    samfile.close()
+    parsed_muts = parse_mutation_list(mutations)
+    snvs = [m for mut in mutations for m in parsed_muts[mut]]
+
+    # Only reads overlapping a target site are decoded (unless cached)
+    counts = load_counts(bam_path, cache_dir, regions=merge_positions(set(m[1] for m in snvs)), mask_primers=mask_primers, threads=threads)
+    muts, not_muts = counts.snv_counts([m[1] for m in snvs], [m[2] for m in snvs])
+    snv_counts = {snv_name(snvs[i]): [int(muts[i]), int(not_muts[i])] for i in range(len(snvs))}
+    mut_results = {mut: {snv_name(m): snv_counts[snv_name(m)] for m in parsed_muts[mut]} for mut in mutations}
 
     for mut in mut_results:
         max_freq = -1
@@ -201,6 +201,15 @@ def find_mutants_in_bam(bam_path, mutations):
     return mut_results
 
 
+def find_mutants_in_sample(bam_path, name, mutations, min_depth, cache_dir=None, mask_primers=None, threads=1):
+    # One samples.txt entry, with its output grouped under the sample name
+    print('{}:'.format(name))
+    mut_results = find_mutants_in_bam(bam_path, mutations, cache_dir, mask_primers, threads)
+    print_mut_results(mut_results, min_depth)
+    print()
+    return mut_results
+
+
 def mut_idx(mut):
     # Sort by genomic index of mutations
     snvs = parse_mutation(mut)
@@ -209,45 +218,65 @@ def mut_idx(mut):
     return snvs[0][1]
 
 
+def read_mutations(mutations_path):
+    # The mutations of a lineage in the catalogue, or those listed in a file
+    with stage('load_catalogue'):
+        mut_mat = load_mutation_matrix()
+    lineages = mut_mat.lineages
+    print(lineages)
+    if mutations_path in mut_mat.lin_index:
+        lin = mutations_path
+        print('Searcing for {} mutations'.format(lin))
+        mutations = [mut for mut in mut_mat.lineage_mutations(lin) if mut_idx(mut) != -1]
+        # Unique
+        # sums = mut_mat.mutation_sums()
+        # mutations = [mut for mut in mutations if sums[mut_mat.mut_index[mut]] == 1]
+        mutations.sort(key=mut_idx)
+    else:
+        print('Searching for mutations in {}'.format(mutations_path))
+        with open(mutations_path, 'r') as f:
+            mutations = [mut for mut in f.read().split('\n') if len(mut)]
+    return mutations
+
+
 # def find_mutants(file_path, mutations_path, min_depth, not_in): #TODO: not in lineage
-def find_mutants(file_path, mutations_path, min_depth, save_img, csv):
+def find_mutants(file_path, mutations_path, min_depth, save_img, csv, cache_dir=None, workers=1, store=None, no_plot=False, mask_primers=None, threads=1):
     """
     Accepts either a bam file or a tab delimited  txt file like
     s1.bam  Sample 1
     s2.bam  Sample 2
+    With a store (path of a SQLite file), counts are kept in the store and only the
+    samples missing some of the mutations are counted. With no_plot, counts are saved
+    as JSON for `alcov plot` instead of plotted. With mask_primers (a primer scheme,
+    see schemes.py), bases in primers are not counted. Each BAM is counted with threads
+    processes or threads (see count_alleles).
     """
 
     sample_results = []
     sample_names = []
     home_lab = file_path.replace('.txt', '')
-    lineages = list(mut_lins['C241T'].keys()) # arbitrary
-    print(lineages)
-    if mutations_path in lineages:
-        lin = mutations_path
-        print('Searcing for {} mutations'.format(lin))
-        mutations = [mut for mut in mut_lins if mut_lins[mut][lin] > 0 and mut_idx(mut) != -1]
-        # Unique
-        # mutations = [mut for mut in mutations if all(mut_lins[mut][l] == 0 for l in lineages if l != lin)]
-        # mutations = [mut for mut in mutations if sum(mut_lins[mut][l] for l in lineages) == 1]
-        mutations.sort(key=mut_idx)
-    else:
-        print('Searching for mutations in {}'.format(mutations_path))
-        with open(mutations_path, 'r') as f:
-            mutations = [mut for mut in f.read().split('\n') if len(mut)]
+    mutations = read_mutations(mutations_path)
 
-    if file_path.endswith('.bam'):
-        sample_results.append(find_mutants_in_bam(file_path, mutations))
+    if file_path.endswith('.bam') and store is None:
+        sample_results.append(find_mutants_in_bam(file_path, mutations, cache_dir, mask_primers, threads))
         sample_names.append('')
     else:
-        with open(file_path, 'r') as f:
-            samples = [line.split('\t') for line in f.read().split('\n')]
-        for sample in samples:
-            if sample[0].endswith('.bam'): # Mostly for filtering empty
-                print('{}:'.format(sample[1]))
-                sample_results.append(find_mutants_in_bam(sample[0], mutations))
-                sample_names.append(sample[1])
-                print_mut_results(sample_results[-1], min_depth)
-                print()
+        samples = read_samples(file_path)
+        find_in_sample = partial(find_mutants_in_sample, mutations=mutations, min_depth=min_depth, cache_dir=cache_dir, mask_primers=mask_primers, threads=threads)
+        if store is None:
+            sample_results += map_samples(find_in_sample, samples, workers, [sample[1] for sample in samples])
+        else:
+            from .schemes import load_scheme
+            from .store import ResultStore, stored_results
+            store = ResultStore(store)
+            primers = load_scheme(mask_primers).checksum if mask_primers is not None else ''
+            compute = lambda samples: map_samples(find_in_sample, samples, workers, [sample[1] for sample in samples])
+            sample_results += stored_results(store, samples, compute,
+                                             has=lambda fingerprint: store.get_mutations(fingerprint, mutations, primers) is not None,
+                                             put=partial(store.put_mutations, primers=primers),
+                                             get=partial(store.get_mutations, mutations=mutations, primers=primers))
+            store.close()
+        sample_names += [sample[1] for sample in samples]
 
     mutants_name = mutations_path.replace('.txt', '').replace('.', '')
   #  img_path = file_path.replace('.bam', '_{}_mutants.png'.format(mutants_name)) if save_img else None
@@ -258,5 +287,9 @@ def find_mutants(file_path, mutations_path, min_depth, save_img, csv):
 
     if csv:
         write_csv(sample_results, sample_names, min_depth, home_lab, mutants_name)
+    if no_plot:
+        from .results import save_results
+        save_results('{}_{}_mutations.json'.format(home_lab, mutants_name), 'find_mutants', sample_names, sample_results, min_depth=min_depth)
+        return
 
     plot_mutations(sample_results, sample_names, min_depth, img_path)
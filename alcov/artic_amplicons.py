@@ -1 +0,0 @@
-inserts = [['MN908947.3', '54', '385', '1', '1', '+', 0.48338368580060426], ['MN908947.3', '342', '704', '2', '2', '+', 0.49171270718232046], ['MN908947.3', '664', '1004', '3', '1', '+', 0.46176470588235297], ['MN908947.3', '965', '1312', '4', '2', '+', 0.3861671469740634], ['MN908947.3', '1264', '1623', '5', '1', '+', 0.42618384401114207], ['MN908947.3', '1595', '1942', '6', '2', '+', 0.3573487031700288], ['MN908947.3', '1897', '2242', '7', '1', '+', 0.391304347826087], ['MN908947.3', '2205', '2568', '8', '2', '+', 0.371900826446281], ['MN908947.3', '2529', '2880', '9', '1', '+', 0.396011396011396], ['MN908947.3', '2850', '3183', '10', '2', '+', 0.3993993993993994], ['MN908947.3', '3166', '3507', '11', '1', '+', 0.36950146627565983], ['MN908947.3', '3482', '3826', '12', '2', '+', 0.36627906976744184], ['MN908947.3', '3795', '4142', '13', '1', '+', 0.3371757925072046], ['MN908947.3', '4077', '4402', '14', '2', '+', 0.38153846153846155], ['MN908947.3', '4322', '4666', '15', '1', '+', 0.36046511627906974], ['MN908947.3', '4658', '4995', '16', '2', '+', 0.3590504451038576], ['MN908947.3', '4966', '5296', '17', '1', '+', 0.3606060606060606], ['MN908947.3', '5287', '5620', '18', '2', '+', 0.38738738738738737], ['MN908947.3', '5586', '5932', '19', '1', '+', 0.35260115606936415], ['MN908947.3', '5894', '6247', '20', '2', '+', 0.32294617563739375], ['MN908947.3', '6197', '6526', '21', '1', '+', 0.3617021276595745], ['MN908947.3', '6495', '6846', '22', '2', '+', 0.3162393162393162], ['MN908947.3', '6745', '7092', '23', '1', '+', 0.30547550432276654], ['MN908947.3', '7058', '7389', '24', '2', '+', 0.3293051359516616], ['MN908947.3', '7332', '7671', '25', '1', '+', 0.3274336283185841], ['MN908947.3', '7651', '7997', '26', '2', '+', 0.3468208092485549], ['MN908947.3', '7968', '8319', '27', '1', '+', 0.3561253561253561], ['MN908947.3', '8275', '8635', '28', '2', '+', 0.3388888888888889], ['MN908947.3', '8619', '8954', '29', '1', '+', 0.3880597014925373], ['MN908947.3', '8913', '9245', '30', '2', '+', 0.3855421686746988], ['MN908947.3', '9226', '9557', '31', '1', '+', 0.3564954682779456], ['MN908947.3', '9502', '9834', '32', '2', '+', 0.3102409638554217], ['MN908947.3', '9806', '10146', '33', '1', '+', 0.37941176470588234], ['MN908947.3', '10099', '10437', '34', '2', '+', 0.3816568047337278], ['MN908947.3', '10384', '10737', '35', '1', '+', 0.3909348441926346], ['MN908947.3', '10688', '11048', '36', '2', '+', 0.3611111111111111], ['MN908947.3', '11022', '11372', '37', '1', '+', 0.3457142857142857], ['MN908947.3', '11331', '11668', '38', '2', '+', 0.35311572700296734], ['MN908947.3', '11584', '11927', '39', '1', '+', 0.36151603498542273], ['MN908947.3', '11889', '12234', '40', '2', '+', 0.391304347826087], ['MN908947.3', '12133', '12465', '41', '1', '+', 0.39457831325301207], ['MN908947.3', '12439', '12779', '42', '2', '+', 0.37941176470588234], ['MN908947.3', '12732', '13074', '43', '1', '+', 0.39766081871345027], ['MN908947.3', '13029', '13363', '44', '2', '+', 0.40119760479041916], ['MN908947.3', '13344', '13660', '45', '1', '+', 0.4208860759493671], ['MN908947.3', '13625', '13961', '46', '2', '+', 0.3244047619047619], ['MN908947.3', '13946', '14271', '47', '1', '+', 0.38153846153846155], ['MN908947.3', '14232', '14579', '48', '2', '+', 0.36023054755043227], ['MN908947.3', '14570', '14898', '49', '1', '+', 0.375], ['MN908947.3', '14895', '15224', '50', '2', '+', 0.3677811550151976], ['MN908947.3', '15193', '15538', '51', '1', '+', 0.39710144927536234], ['MN908947.3', '15503', '15861', '52', '2', '+', 0.3463687150837989], ['MN908947.3', '15851', '16186', '53', '1', '+', 0.3701492537313433], ['MN908947.3', '16144', '16485', '54', '2', '+', 0.3812316715542522], ['MN908947.3', '16444', '16804', '55', '1', '+', 0.3611111111111111], ['MN908947.3', '16770', '17130', '56', '2', '+', 0.375], ['MN908947.3', '17087', '17430', '57', '1', '+', 0.3848396501457726], ['MN908947.3', '17406', '17738', '58', '2', '+', 0.4036144578313253], ['MN908947.3', '17697', '18036', '59', '1', '+', 0.3775811209439528], ['MN908947.3', '17993', '18324', '60', '2', '+', 0.39274924471299094], ['MN908947.3', '18275', '18650', '61', '1', '+', 0.3893333333333333], ['MN908947.3', '18618', '18957', '62', '2', '+', 0.3952802359882006], ['MN908947.3', '18918', '19275', '63', '1', '+', 0.36134453781512604], ['MN908947.3', '19232', '19591', '64', '2', '+', 0.3593314763231198], ['MN908947.3', '19570', '19911', '65', '1', '+', 0.3519061583577713], ['MN908947.3', '19866', '20231', '66', '2', '+', 0.36164383561643837], ['MN908947.3', '20200', '20542', '67', '1', '+', 0.30994152046783624], ['MN908947.3', '20496', '20867', '68', '2', '+', 0.31266846361185985], ['MN908947.3', '20813', '21146', '69', '1', '+', 0.36036036036036034], ['MN908947.3', '21104', '21427', '70', '2', '+', 0.3622291021671827], ['MN908947.3', '21386', '21716', '71', '1', '+', 0.3242424242424242], ['MN908947.3', '21682', '22013', '72', '2', '+', 0.34441087613293053], ['MN908947.3', '21990', '22324', '73', '1', '+', 0.33532934131736525], ['MN908947.3', '22290', '22626', '74', '2', '+', 0.36904761904761907], ['MN908947.3', '22542', '22877', '75', '1', '+', 0.35522388059701493], ['MN908947.3', '22821', '23189', '76', '2', '+', 0.33695652173913043], ['MN908947.3', '23144', '23500', '77', '1', '+', 0.3848314606741573], ['MN908947.3', '23466', '23822', '78', '2', '+', 0.3960674157303371], ['MN908947.3', '23812', '24145', '79', '1', '+', 0.35135135135135137], ['MN908947.3', '24100', '24443', '80', '2', '+', 0.3935860058309038], ['MN908947.3', '24416', '24765', '81', '1', '+', 0.3839541547277937], ['MN908947.3', '24721', '25052', '82', '2', '+', 0.38368580060422963], ['MN908947.3', '25003', '25347', '83', '1', '+', 0.3808139534883721], ['MN908947.3', '25301', '25646', '84', '2', '+', 0.42028985507246375], ['MN908947.3', '25623', '25969', '85', '1', '+', 0.3699421965317919], ['MN908947.3', '25924', '26290', '86', '2', '+', 0.3879781420765027], ['MN908947.3', '26219', '26566', '87', '1', '+', 0.3659942363112392], ['MN908947.3', '26542', '26890', '88', '2', '+', 0.3994252873563218], ['MN908947.3', '26860', '27190', '89', '1', '+', 0.45151515151515154], ['MN908947.3', '27164', '27511', '90', '2', '+', 0.3227665706051873], ['MN908947.3', '27471', '27825', '91', '1', '+', 0.3644067796610169], ['MN908947.3', '27808', '28145', '92', '2', '+', 0.35311572700296734], ['MN908947.3', '28104', '28442', '93', '1', '+', 0.4230769230769231], ['MN908947.3', '28416', '28756', '94', '2', '+', 0.47352941176470587], ['MN908947.3', '28699', '29041', '95', '1', '+', 0.49122807017543857], ['MN908947.3', '29007', '29356', '96', '2', '+', 0.4498567335243553], ['MN908947.3', '29316', '29665', '97', '1', '+', 0.40114613180515757], ['MN908947.3', '29510', '29836', '98', '2', '+', 0.4171779141104294]]
\ No newline at end of file
@@ -0,0 +1,62 @@
+import io
+from contextlib import redirect_stdout
+
+from . import profiling
+
+
+def read_samples(file_path):
+    """
+    Accepts either a bam file or a tab delimited txt file like
+    s1.bam  Sample 1
+    s2.bam  Sample 2
+    and returns a list of (bam path, sample name) pairs
+    """
+    if file_path.endswith('.bam'):
+        return [(file_path, '')]
+    with open(file_path, 'r') as f:
+        samples = [line.split('\t') for line in f.read().split('\n')]
+    # Mostly for filtering empty
+    return [(sample[0], sample[1]) for sample in samples if sample[0].endswith('.bam')]
+
+
+def _run_captured(func, args):
+    out = io.StringIO()
+    with redirect_stdout(out):
+        result = func(*args)
+    return result, out.getvalue()
+
+
+def map_samples(func, args_list, workers=1, names=None):
+    """
+    Call func(*args) for each sample's args and return the results in input order.
+    With workers > 1 samples run in a process pool; each sample's printed output is
+    collected in its worker and printed as one block, in input order.
+    names label each sample's stages when profiling (see profiling.py).
+    """
+    if names is None:
+        names = [None] * len(args_list)
+    if workers is None or workers <= 1 or len(args_list) <= 1:
+        results = []
+        for args, name in zip(args_list, names):
+            with profiling.sample(name):
+                results.append(func(*args))
+        return results
+
+    from concurrent.futures import ProcessPoolExecutor
+
+    results = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        if profiling.enabled():
+            # Stages are recorded in the workers and merged here
+            options = profiling.worker_options()
+            futures = [pool.submit(_run_captured, profiling.run_in_worker, (func, args, name, options)) for args, name in zip(args_list, names)]
+        else:
+            futures = [pool.submit(_run_captured, func, args) for args in args_list]
+        for future in futures:
+            result, log = future.result()
+            print(log, end='')
+            if profiling.enabled():
+                result, worker_profile = result
+                profiling.merge(worker_profile)
+            results.append(result)
+    return results
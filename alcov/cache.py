@@ -0,0 +1,101 @@
+import hashlib
+import json
+import os
+
+import numpy as np
+
+from .counts import AlleleCounts, MIN_BASE_QUALITY, count_alleles
+from .profiling import stage
+
+
+# Bump when the counting engine changes what it stores
+CACHE_VERSION = 2
+MAX_CACHE_BYTES = 2 * 1024 ** 3
+
+
+def index_path(bam_path):
+    for path in [bam_path + '.bai', bam_path[:-4] + '.bai', bam_path + '.csi']:
+        if os.path.exists(path):
+            return path
+    return None
+
+
+def bam_fingerprint(bam_path, **params):
+    """
+    Key identifying the allele counts of a BAM: its path, size and modification time,
+    a checksum of its index and the counting parameters
+    """
+    stat = os.stat(bam_path)
+    idx = index_path(bam_path)
+    idx_sum = None
+    if idx is not None:
+        with open(idx, 'rb') as f:
+            idx_sum = hashlib.md5(f.read()).hexdigest()
+    key = {
+        'version': CACHE_VERSION,
+        'path': os.path.abspath(bam_path),
+        'size': stat.st_size,
+        'mtime': stat.st_mtime_ns,
+        'index': idx_sum,
+        'params': params,
+    }
+    return hashlib.sha1(json.dumps(key, sort_keys=True).encode()).hexdigest()
+
+
+def evict(cache_dir, max_bytes=MAX_CACHE_BYTES):
+    # Remove least recently used entries until the cache fits in max_bytes
+    entries = []
+    for fn in os.listdir(cache_dir):
+        if fn.endswith('.npz') and not fn.endswith('.tmp.npz'):
+            path = os.path.join(cache_dir, fn)
+            stat = os.stat(path)
+            entries.append((stat.st_mtime, stat.st_size, path))
+    entries.sort()
+    total = sum(e[1] for e in entries)
+    for mtime, size, path in entries:
+        if total <= max_bytes:
+            break
+        os.remove(path)
+        total -= size
+
+
+def load_counts(bam_path, cache_dir=None, regions=None, min_base_quality=MIN_BASE_QUALITY, max_depth=0, max_bytes=MAX_CACHE_BYTES, mask_primers=None, threads=1):
+    """
+    Allele counts for a BAM, read from the cache in cache_dir (or $ALCOV_CACHE_DIR) when possible.
+    Cached counts always cover the whole genome so they can answer any later catalogue;
+    without a cache only the given regions are counted.
+    With mask_primers (a primer scheme name or insert BED, see schemes.py), bases in
+    the primers of each read's amplicon are not counted. threads are those counting one
+    BAM (see count_alleles).
+    """
+    scheme = None
+    params = {'min_base_quality': min_base_quality, 'max_depth': max_depth}
+    if mask_primers is not None:
+        from .schemes import load_scheme
+        scheme = load_scheme(mask_primers)
+        params['mask_primers'] = scheme.checksum
+    if cache_dir is None:
+        cache_dir = os.environ.get('ALCOV_CACHE_DIR')
+    if cache_dir is None:
+        return count_alleles(bam_path, regions=regions, min_base_quality=min_base_quality, max_depth=max_depth, scheme=scheme, threads=threads)
+
+    key = bam_fingerprint(bam_path, **params)
+    path = os.path.join(cache_dir, '{}.npz'.format(key))
+    if os.path.exists(path):
+        try:
+            with stage('read_cache'), np.load(path) as data:
+                counts = AlleleCounts(data['counts'], str(data['contig']))
+            # Mark as recently used for eviction
+            os.utime(path)
+            return counts
+        except (OSError, ValueError, KeyError):
+            print('Ignoring unreadable cache entry {}'.format(path))
+
+    counts = count_alleles(bam_path, min_base_quality=min_base_quality, max_depth=max_depth, scheme=scheme, threads=threads)
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp_path = '{}.{}.tmp.npz'.format(path[:-4], os.getpid())
+    with stage('write_cache'):
+        np.savez_compressed(tmp_path, counts=counts.counts, contig=counts.contig)
+    os.replace(tmp_path, path)
+    evict(cache_dir, max_bytes)
+    return counts
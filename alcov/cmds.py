@@ -1,13 +1,34 @@
 from .convert_mutations import aa as convert_aa, nt as convert_nt
 
 
-def aa(mut):
-    nt_muts = convert_aa(mut)
-    for nt_mut in nt_muts:
-        print('{} causes {}'.format(nt_mut, mut))
+def read_mutations(file_path):
+    # One mutation per line
+    with open(file_path, 'r') as f:
+        return [mut.strip() for mut in f.read().split('\n') if len(mut.strip())]
 
 
-def nt(mut):
-    aa_mut = convert_nt(mut)
-    print('{} causes {}'.format(mut, aa_mut))
+def aa(mut=None, file=None):
+    if file is not None:
+        from .convert_mutations import aa_many
 
+        muts = read_mutations(file)
+        nt_muts = aa_many(muts)
+    else:
+        muts = [mut]
+        nt_muts = [convert_aa(mut)]
+    for mut, nt_mut_list in zip(muts, nt_muts):
+        for nt_mut in nt_mut_list:
+            print('{} causes {}'.format(nt_mut, mut))
+
+
+def nt(mut=None, file=None):
+    if file is not None:
+        from .convert_mutations import nt_many
+
+        muts = read_mutations(file)
+        aa_muts = nt_many(muts)
+    else:
+        muts = [mut]
+        aa_muts = [convert_nt(mut)]
+    for mut, aa_mut in zip(muts, aa_muts):
+        print('{} causes {}'.format(mut, aa_mut))
@@ -1,21 +1,104 @@
-# Note: Still in active development
+import os
+from functools import partial
 
-def consensus_from_bam(bam_path):
-    import pysam
+import numpy as np
 
-    samfile = pysam.Samfile(bam_path, "rb")
+from .batch import map_samples, read_samples
+from .counts import DEL
+from .profiling import profiled
 
-    seq = ['N' for _ in range(29903)]
 
-    for pileupcolumn in samfile.pileup():
-        pos = pileupcolumn.pos
-        bases = {}
-        for pileupread in pileupcolumn.pileups:
-            qpos = pileupread.query_position
-            if qpos is None:
-                continue
-            base = pileupread.alignment.query_sequence[qpos]
-            seq[pos] = base
-    samfile.close()
+# Reads needed to call a base, and the ambiguity code of each set of bases, indexed by
+# a bit mask with A=1, C=2, G=4, T=8
+MIN_DEPTH = 10
+IUPAC = np.array(list('NACMGRSVTWYHKDBN'))
+BASE_BITS = np.array([1, 2, 4, 8])
 
-    print(''.join(seq))
+
+@profiled('call_consensus')
+def call_consensus(counts, threshold=None, min_depth=MIN_DEPTH, ambiguity=True, gaps=False):
+    """
+    The consensus sequence of an allele count matrix (see counts.py), over the whole
+    reference. Alleles are A, C, G, T and deletions; bases outside ACGT are not counted.
+
+    Without threshold, each position is called as its most common allele. With a
+    threshold (a fraction), it is called from the fewest alleles whose reads add up to
+    at least threshold of its depth, as with ivar consensus. Alleles tied with the last
+    one needed are always taken too, so ties don't depend on the order of ACGT. More
+    than one base is written as its IUPAC code, or N without ambiguity.
+
+    Positions with fewer than min_depth reads are N. A position is a deletion when the
+    deletion is its most common allele and is one of the alleles called; deletions are
+    left out of the sequence, or written as '-' with gaps so that the sequence stays
+    aligned to the reference.
+    """
+    alleles = counts.counts[:, :DEL + 1].astype(np.int64)
+    depth = alleles.sum(axis=1)
+    top = alleles.max(axis=1)
+    if threshold is None:
+        called = (alleles == top[:, None]) & (top[:, None] > 0)
+    else:
+        if not 0 < threshold <= 1:
+            raise ValueError('threshold must be a fraction in (0, 1], got {}'.format(threshold))
+        # Counts in decreasing order, and the smallest of those needed to reach threshold
+        ranked = -np.sort(-alleles, axis=1)
+        reached = ranked.cumsum(axis=1) >= threshold * depth[:, None]
+        needed = np.minimum(reached.argmax(axis=1), DEL)
+        least = ranked[np.arange(len(ranked)), needed]
+        called = (alleles >= least[:, None]) & (alleles > 0)
+
+    bits = (called[:, :DEL] * BASE_BITS).sum(axis=1)
+    if not ambiguity:
+        # Only single bases, and bit masks with one bit set are powers of two
+        bits[(bits & (bits - 1)) != 0] = 0
+    seq = IUPAC[bits]
+    deleted = called[:, DEL] & (alleles[:, DEL] == top) & (depth >= min_depth)
+    seq[deleted] = '-'
+    seq[depth < min_depth] = 'N'
+    if not gaps:
+        seq = seq[~deleted]
+    return ''.join(seq)
+
+
+def consensus_from_bam(bam_path, threshold=None, min_depth=MIN_DEPTH, ambiguity=True, gaps=False, cache_dir=None, mask_primers=None, threads=1):
+    from .cache import load_counts
+
+    counts = load_counts(bam_path, cache_dir, mask_primers=mask_primers, threads=threads)
+    return call_consensus(counts, threshold, min_depth, ambiguity, gaps)
+
+
+def consensus_in_sample(bam_path, name, **kwargs):
+    seq = consensus_from_bam(bam_path, **kwargs)
+    called = len(seq) - seq.count('N') - seq.count('-')
+    print('{}: {} bases, {} called ({:.1f}%)'.format(name, len(seq), called, 100 * called / len(seq) if len(seq) else 0))
+    return seq
+
+
+def write_fasta(path, sample_names, seqs, width=60):
+    with open(path, 'w') as f:
+        for name, seq in zip(sample_names, seqs):
+            f.write('>{}\n'.format(name))
+            for i in range(0, len(seq), width):
+                f.write(seq[i:i + width] + '\n')
+    print('Consensus sequences written to {}'.format(path))
+
+
+def consensus(file_path, output=None, threshold=None, min_depth=MIN_DEPTH, ambiguity=True, gaps=False, cache_dir=None, workers=1, mask_primers=None, threads=1):
+    """
+    Accepts either a bam file or a tab delimited  txt file like
+    s1.bam  Sample 1
+    s2.bam  Sample 2
+    and writes the consensus sequence of each sample (see call_consensus) to a
+    multi-FASTA file, samples_consensus.fasta by default. With mask_primers (a primer
+    scheme, see schemes.py), bases in primers are not counted. threads is passed on to
+    count_alleles.
+    """
+    samples = read_samples(file_path)
+    # A lone BAM is named after its file
+    sample_names = [name if name else os.path.basename(bam_path)[:-len('.bam')] for bam_path, name in samples]
+    if output is None:
+        output = '{}_consensus.fasta'.format(file_path[:-len('.bam')] if file_path.endswith('.bam') else file_path.replace('.txt', ''))
+    find_consensus = partial(consensus_in_sample, threshold=threshold, min_depth=min_depth, ambiguity=ambiguity, gaps=gaps,
+                             cache_dir=cache_dir, mask_primers=mask_primers, threads=threads)
+    seqs = map_samples(find_consensus, [(bam_path, name) for (bam_path, _), name in zip(samples, sample_names)], workers, sample_names)
+    write_fasta(output, sample_names, seqs)
@@ -1,4 +1,6 @@
 import re
+from collections import namedtuple
+from functools import lru_cache
 
 from .sars_cov_2 import genes, seq
 
@@ -24,15 +26,22 @@ codons = {
 
 nts = 'ACGT'
 
+number = re.compile(r'\d+')
+
+# Annotation of every single nucleotide change on the reference, indexed by 0-based
+# position: gene (index into gene_names, -1 outside of genes), aa_idx (codon number in
+# that gene), ref_acid and alt_acid (one column per base in nts) as ASCII codes
+SnvTable = namedtuple('SnvTable', ['gene_names', 'gene', 'aa_idx', 'ref_acid', 'alt_acid'])
+
 
 def aa(mut):
     gene = mut[:mut.find(':')]
     if gene == 'DEL':
-        nt_idx, length = re.findall(r'\d+', mut)
+        nt_idx, length = number.findall(mut)
         nt_idx = int(nt_idx)
         length = int(length)
         return ['{}{}-'.format(seq[nt_idx+i], nt_idx+i) for i in range(length)]
-    aa_idx = int(re.findall(r'\d+', mut)[-1])
+    aa_idx = int(number.findall(mut)[-1])
     nt_idx = genes[gene][0] + (aa_idx - 1) * 3
     codon = seq[nt_idx:nt_idx+3]
     if mut[mut.find(':')+1:].startswith('DEL') or mut[-1] == '-':
@@ -78,7 +87,7 @@ def aa(mut):
 def nt(mut):
     base = mut[0]
     new_base = mut[-1]
-    nt_idx = int(re.findall(r'\d+', mut)[0]) - 1
+    nt_idx = int(number.findall(mut)[0]) - 1
     for gene in genes:
         l = genes[gene]
         if l[0] < nt_idx and l[1] > nt_idx:
@@ -94,3 +103,144 @@ def nt(mut):
             new_acid = codons[''.join(codon)]
             return '{}:{}{}{}'.format(gene, acid, aa_idx, new_acid)
 
+
+
+def snv_position(mut):
+    # 1-based position of a nucleotide mutation like A23063T
+    pos = mut[1:-1]
+    if pos.isdigit() and not mut[0].isdigit() and not mut[-1].isdigit():
+        return int(pos)
+    return int(number.findall(mut)[0])
+
+
+def is_aa_deletion(mut):
+    return mut.startswith('DEL:') or mut[mut.find(':')+1:].startswith('DEL') or mut[-1] == '-'
+
+
+@lru_cache(maxsize=None)
+def codon_table():
+    # Amino acid (ASCII) of each codon, indexed by 16 * first + 4 * second + third base
+    import numpy as np
+
+    return np.array([ord(codons[a + b + c]) for a in nts for b in nts for c in nts], dtype=np.uint8)
+
+
+def base_codes(bases):
+    import numpy as np
+
+    codes = np.full(256, 255, dtype=np.uint8)
+    for i, b in enumerate(nts):
+        codes[ord(b)] = i
+    return codes[np.frombuffer(bases.encode('ascii'), dtype=np.uint8)]
+
+
+@lru_cache(maxsize=None)
+def snv_table():
+    """
+    Precomputed annotation of every possible single nucleotide change, following nt:
+    a position belongs to the first gene in genes that strictly contains it
+    """
+    import numpy as np
+
+    gene_names = list(genes.keys())
+    pos = np.arange(len(seq))
+    gene = np.full(len(seq), -1, dtype=np.int16)
+    start = np.zeros(len(seq), dtype=np.int64)
+    # Earlier genes overwrite later ones
+    for i in reversed(range(len(gene_names))):
+        l = genes[gene_names[i]]
+        inside = (pos > l[0]) & (pos < l[1])
+        gene[inside] = i
+        start[inside] = l[0]
+
+    in_gene = gene >= 0
+    aa_idx = np.where(in_gene, (pos - start) // 3 + 1, 0).astype(np.int32)
+    offset = (pos - start) % 3
+    codon_start = start + (aa_idx - 1) * 3
+    ref = base_codes(seq).astype(np.int64)
+    padded = np.concatenate((ref, [0, 0, 0]))
+    codon = np.stack([padded[np.where(in_gene, codon_start + k, 0)] for k in range(3)], axis=1)
+    table = codon_table()
+    weights = np.array([16, 4, 1])
+    ref_acid = np.where(in_gene, table[codon @ weights], 0).astype(np.uint8)
+    alt_acid = np.zeros((len(seq), len(nts)), dtype=np.uint8)
+    for b in range(len(nts)):
+        alt = codon.copy()
+        alt[pos, offset] = b
+        alt_acid[:, b] = np.where(in_gene, table[alt @ weights], 0)
+    return SnvTable(gene_names, gene, aa_idx, ref_acid, alt_acid)
+
+
+def nt_many(muts):
+    """
+    Amino acid change caused by each nucleotide mutation, like nt, as array lookups
+    into snv_table (None for changes outside of genes)
+    """
+    import numpy as np
+
+    table = snv_table()
+    nt_idxs = np.array([snv_position(mut) - 1 for mut in muts], dtype=np.int64)
+    new_bases = ''.join(mut[-1] for mut in muts)
+    deletion = np.array([b == '-' for b in new_bases], dtype=bool)
+    codes = base_codes(new_bases.replace('-', nts[0]))
+    valid = (nt_idxs >= 0) & (nt_idxs < len(seq))
+    idxs = np.where(valid, nt_idxs, 0)
+    gene = np.where(valid, table.gene[idxs], -1)
+    unknown = np.nonzero((gene >= 0) & (codes == 255))[0]
+    if len(unknown):
+        raise KeyError(muts[unknown[0]])
+    codes = np.where(codes == 255, 0, codes)
+    aa_idx = table.aa_idx[idxs]
+    ref_acid = table.ref_acid[idxs]
+    alt_acid = table.alt_acid[idxs, codes]
+
+    names = table.gene_names
+    aa_muts = []
+    for g, i, r, a, d in zip(gene.tolist(), aa_idx.tolist(), ref_acid.tolist(), alt_acid.tolist(), deletion.tolist()):
+        if g < 0:
+            aa_muts.append(None)
+        elif d:
+            aa_muts.append('{}:DEL{}'.format(names[g], i))
+        else:
+            aa_muts.append('{}:{}{}{}'.format(names[g], chr(r), i, chr(a)))
+    return aa_muts
+
+
+def aa_many(muts):
+    """
+    Nucleotide changes that can cause each amino acid mutation, like aa. Substitutions
+    are translated together; deletions go through aa.
+    """
+    import numpy as np
+
+    nt_muts = [None] * len(muts)
+    subs = []
+    for i, mut in enumerate(muts):
+        if is_aa_deletion(mut):
+            nt_muts[i] = aa(mut)
+        else:
+            subs.append(i)
+    if len(subs) == 0:
+        return nt_muts
+
+    sub_muts = [muts[i] for i in subs]
+    nt_idx = np.array([
+        genes[mut[:mut.find(':')]][0] + (int(number.findall(mut)[-1]) - 1) * 3 for mut in sub_muts
+    ], dtype=np.int64)
+    new_acids = np.frombuffer(''.join(mut[-1] for mut in sub_muts).encode('ascii'), dtype=np.uint8)
+    ref = base_codes(seq).astype(np.int64)
+    codon = np.stack([ref[nt_idx + k] for k in range(3)], axis=1)
+    # Amino acid of every single base change: (mutation, codon position, base)
+    weights = np.array([16, 4, 1])
+    alts = np.repeat(codon[:, None, None, :], 3, axis=1).repeat(len(nts), axis=2)
+    for k in range(3):
+        alts[:, k, :, k] = np.arange(len(nts))
+    hits = codon_table()[alts @ weights] == new_acids[:, None, None]
+
+    mut_idx, k, b = np.nonzero(hits)
+    pos = nt_idx[mut_idx] + k
+    names = ['{}{}{}'.format(seq[p], p + 1, nts[c]) for p, c in zip(pos.tolist(), b.tolist())]
+    bounds = np.searchsorted(mut_idx, np.arange(len(subs) + 1)).tolist()
+    for j, i in enumerate(subs):
+        nt_muts[i] = names[bounds[j]:bounds[j+1]]
+    return nt_muts
@@ -0,0 +1,688 @@
+import heapq
+from math import ceil
+
+import numpy as np
+
+from .profiling import profiled
+
+
+# Columns of the allele count matrix
+ALLELES = 'ACGT-N'
+DEL = ALLELES.index('-')
+OTHER = ALLELES.index('N')
+
+# Bases outside ACGT (N, IUPAC codes, '=') are all counted as N
+BASE_CODES = np.full(256, OTHER, dtype=np.uint8)
+for i, b in enumerate('ACGT'):
+    BASE_CODES[ord(b)] = i
+    BASE_CODES[ord(b.lower())] = i
+
+# Defaults match pysam's pileup
+MIN_BASE_QUALITY = 13
+BATCH_SIZE = 20000
+
+# With threads, regions are split into about this many shards per thread. A read is
+# counted in the shard its mate starts in when the mates start less than SHARD_MARGIN
+# apart, so overlapping mates meet in one shard as long as no read is longer than that
+SHARDS_PER_THREAD = 2
+SHARD_MARGIN = 1000
+
+
+class AlleleCounts(object):
+    """Number of reads supporting each allele in ALLELES at every reference position"""
+
+    def __init__(self, counts, contig=None):
+        # Row i holds 1-based position i+1
+        self.counts = counts
+        self.contig = contig
+
+    def __len__(self):
+        return len(self.counts)
+
+    def _rows(self, positions):
+        # Rows for 1-based positions, with out of range positions left empty
+        idx = np.asarray(positions, dtype=np.int64) - 1
+        valid = (idx >= 0) & (idx < len(self.counts))
+        rows = np.zeros((len(idx), len(ALLELES)), dtype=self.counts.dtype)
+        rows[valid] = self.counts[idx[valid]]
+        return rows
+
+    def depth(self, positions=None):
+        # Reads covering each position, deletions included
+        if positions is None:
+            return self.counts.sum(axis=1)
+        return self._rows(positions).sum(axis=1)
+
+    def snv_counts(self, positions, alleles):
+        # Reads with and without each (1-based position, allele) pair
+        rows = self._rows(positions)
+        cols = np.array([ALLELES.find(a) for a in alleles], dtype=np.int64)
+        known = cols >= 0
+        muts = np.zeros(len(rows), dtype=rows.dtype)
+        muts[known] = rows[np.nonzero(known)[0], cols[known]]
+        return muts, rows.sum(axis=1) - muts
+
+    def frequencies(self, positions, alleles):
+        muts, not_muts = self.snv_counts(positions, alleles)
+        total = muts + not_muts
+        return np.divide(muts, total, out=np.zeros(len(total)), where=total > 0)
+
+
+class _Tally(object):
+    # Buffers reads and bins their bases into the count matrix a batch at a time
+    # Mirrors pysam's pileup: bases below min_base_quality are skipped (deletions use
+    # the quality of the following base) and overlapping mates are only counted once,
+    # with qualities lowered the way and at the point htslib does, so that without a
+    # scheme the counts are those of pileup(stepper='nofilter') (benchmarks/pileup_check.py)
+    # With a primer scheme, bases outside the insert of each read's amplicon (its
+    # primers, or all of a read outside every amplicon) are skipped as well
+
+    def __init__(self, length, min_base_quality, max_depth, scheme=None):
+        self.counts = np.zeros((length, len(ALLELES)), dtype=np.int32)
+        self.min_base_quality = min_base_quality
+        self.max_depth = max_depth
+        self.scheme = scheme
+        self.records = []
+        self.carried = 0
+        self.pending = {}
+        self.next_pair = 0
+        self.active = []
+        self.last_start = -1
+        self.prev = -1
+
+    def add(self, read, start, stop):
+        flag = read.flag
+        if flag & 4:
+            return
+        pos = read.reference_start
+        # Start of the last mapped read before this one: htslib has piled up every
+        # position before it by the time this read is pushed
+        prev = self.prev
+        self.prev = pos
+        cigar = read.cigartuples
+        seq = read.query_sequence
+        if not cigar or seq is None:
+            return
+        if self.max_depth:
+            # Same rule as htslib: drop reads piling onto one start once the cap is hit
+            while len(self.active) and self.active[0] < pos:
+                heapq.heappop(self.active)
+            if pos == self.last_start and len(self.active) >= self.max_depth:
+                # and forget its mate, if any, as htslib's overlap_remove does
+                if flag & 2:
+                    self.pending.pop(read.query_name, None)
+                return
+            heapq.heappush(self.active, read.reference_end)
+            self.last_start = pos
+        pair = -1
+        rank = 0
+        favoured = 0
+        # Span of the read's fragment, which gives its amplicon
+        span = (pos, read.reference_end) if self.scheme is not None else None
+        if span is not None and flag & 2 and read.template_length != 0:
+            fragment_start = min(pos, read.next_reference_start)
+            span = (fragment_start, fragment_start + abs(read.template_length))
+        mtid = read.next_reference_id
+        mpos = read.next_reference_start
+        # Same pairs as htslib's overlap_push, the wild cigar check included
+        if (flag & 2 and not flag & 8 and (mtid < 0 or mtid == read.reference_id)
+                and not (abs(read.template_length) >= 2 * len(seq) and mpos >= read.reference_end)):
+            name = read.query_name
+            if name in self.pending:
+                pair, favoured = self.pending.pop(name)
+                rank = 1
+                favoured = 1 - favoured
+            elif mpos >= pos or (flag & 1 and mpos == -1):
+                pair = self.next_pair
+                self.next_pair += 1
+                favoured = _favours_first(name)
+                self.pending[name] = (pair, favoured)
+        quals = read.query_qualities
+        if quals is None:
+            quals = b'\xff' * len(seq)
+        self.records.append((seq, quals, pos, cigar, pair, rank, favoured, span, prev))
+        if len(self.records) - self.carried >= BATCH_SIZE:
+            self.flush(start, stop)
+
+    def flush(self, start, stop, final=False):
+        # Bin every buffered read except first mates still waiting for their mate
+        waiting = set() if final else set(pair for pair, _ in self.pending.values())
+        ready = [r for r in self.records if r[4] not in waiting]
+        self.records = [r for r in self.records if r[4] in waiting]
+        self.carried = len(self.records)
+        if final:
+            self.pending = {}
+        if len(ready) == 0:
+            return
+
+        seqs = []
+        quals = []
+        read_pair, read_rank, read_fav = [], [], []
+        # Aligned (match) and deleted (del/ref skip) cigar blocks of every read
+        m_ref, m_query, m_len, m_read = [], [], [], []
+        d_ref, d_query, d_len, d_read, d_is_del = [], [], [], [], []
+        # Where each read starts in the concatenated bases, where it ends on the
+        # reference, and the reads of each pair
+        read_offset, read_end, read_gaps = [], [], {}
+        mates = {}
+        offset = 0
+        for i, (seq, qual, pos, cigar, pair, rank, favoured, span, prev) in enumerate(ready):
+            seqs.append(seq)
+            quals.append(qual)
+            read_pair.append(pair)
+            read_rank.append(rank)
+            read_fav.append(favoured)
+            read_offset.append(offset)
+            if pair >= 0:
+                mates.setdefault(pair, [-1, -1])[rank] = i
+            if len(cigar) == 1 and cigar[0][0] == 0:
+                m_ref.append(pos)
+                m_query.append(offset)
+                m_len.append(cigar[0][1])
+                m_read.append(i)
+                read_end.append(pos + cigar[0][1])
+                offset += len(seq)
+                continue
+            q = offset
+            r = pos
+            for op, l in cigar:
+                if op == 0 or op == 7 or op == 8:
+                    m_ref.append(r)
+                    m_query.append(q)
+                    m_len.append(l)
+                    m_read.append(i)
+                    r += l
+                    q += l
+                elif op == 2 or op == 3:
+                    d_ref.append(r)
+                    # Deletions are filtered on the quality of the next base
+                    d_query.append(q if q < offset + len(seq) else -1)
+                    d_len.append(l)
+                    d_read.append(i)
+                    d_is_del.append(op == 2)
+                    if pair >= 0:
+                        read_gaps.setdefault(i, []).append((r, r + l))
+                    r += l
+                elif op == 1 or op == 4:
+                    q += l
+            read_end.append(r)
+            offset += len(seq)
+
+        raw = np.frombuffer(''.join(seqs).encode('ascii'), dtype=np.uint8)
+        qual = np.frombuffer(b''.join(quals), dtype=np.uint8).astype(np.int32)
+        read_pair = np.array(read_pair, dtype=np.int64)
+
+        m_len = np.array(m_len, dtype=np.int64)
+        m_query = np.array(m_query, dtype=np.int64)
+        m_qidx = _expand(m_query, m_len)
+        m_pos = m_qidx + np.repeat(np.array(m_ref, dtype=np.int64) - m_query, m_len)
+        d_len = np.array(d_len, dtype=np.int64)
+        d_pos = _expand(np.array(d_ref, dtype=np.int64), d_len)
+        d_qidx = np.repeat(np.array(d_query, dtype=np.int64), d_len)
+
+        paired = read_pair.max() >= 0
+        if paired or self.scheme is not None:
+            m_read = np.repeat(np.array(m_read, dtype=np.int64), m_len)
+            d_read = np.repeat(np.array(d_read, dtype=np.int64), d_len)
+            is_del = np.repeat(np.array(d_is_del, dtype=bool), d_len)
+        if self.scheme is not None:
+            # Primer masking, done before overlapping mates are compared, like trimming
+            spans = np.array([r[7] for r in ready], dtype=np.int64)
+            amplicon = self.scheme.assign_reads(spans[:, 0], spans[:, 1])
+            found = amplicon >= 0
+            lo = np.where(found, self.scheme.starts[np.maximum(amplicon, 0)], 0)
+            hi = np.where(found, self.scheme.stops[np.maximum(amplicon, 0)], 0)
+            keep = (m_pos >= lo[m_read]) & (m_pos < hi[m_read])
+            m_pos, m_qidx, m_read = m_pos[keep], m_qidx[keep], m_read[keep]
+            keep = (d_pos >= lo[d_read]) & (d_pos < hi[d_read])
+            d_pos, d_qidx, d_read, is_del = d_pos[keep], d_qidx[keep], d_read[keep], is_del[keep]
+
+        d_qual = np.where(d_qidx >= 0, qual[d_qidx], 0)
+        if paired:
+            # htslib lowers the qualities of a pair as the second mate is pushed, when
+            # every position before the read pushed ahead of it is already piled up,
+            # so deletions of the first mate there are filtered on their own qualities
+            mate_prev = np.full(len(ready), -1, dtype=np.int64)
+            exact = np.zeros(len(ready), dtype=bool)
+            for a, b in mates.values():
+                if a < 0 or b < 0:
+                    continue
+                mate_prev[a] = ready[b][8]
+                # Mates with a deletion or ref skip where they overlap take htslib's
+                # own walk, as it doesn't line their bases up by reference position
+                b_pos = ready[b][2]
+                if self.scheme is None and any(s < read_end[a] and e > b_pos for s, e in read_gaps.get(a, []) + read_gaps.get(b, [])):
+                    exact[a] = exact[b] = True
+                    _tweak_pair(qual, raw, (read_offset[a], ready[a][2], ready[a][3], len(ready[a][0])),
+                                (read_offset[b], b_pos, ready[b][3], len(ready[b][0])), read_fav[a])
+
+            # Ref skips are piled up like deletions but never adjusted for overlaps
+            del_pos = d_pos[is_del]
+            del_read = d_read[is_del]
+            m_sel = (read_pair[m_read] >= 0) & ~exact[m_read]
+            d_sel = (read_pair[del_read] >= 0) & ~exact[del_read]
+            self.tweak_overlaps(
+                qual,
+                raw,
+                np.concatenate((m_pos[m_sel], del_pos[d_sel])),
+                np.concatenate((m_qidx[m_sel], np.full(d_sel.sum(), -1, dtype=np.int64))),
+                np.concatenate((m_read[m_sel], del_read[d_sel])),
+                read_pair,
+                np.array(read_rank, dtype=np.int64),
+                np.array(read_fav, dtype=np.int64),
+            )
+            late = (d_qidx >= 0) & (d_pos >= mate_prev[d_read])
+            d_qual[late] = qual[d_qidx[late]]
+
+        keep = qual[m_qidx] >= self.min_base_quality
+        self.bin(m_pos[keep], BASE_CODES[raw[m_qidx[keep]]], start, stop)
+        keep = d_qual >= self.min_base_quality
+        self.bin(d_pos[keep], np.full(keep.sum(), DEL, dtype=np.uint8), start, stop)
+
+    def tweak_overlaps(self, qual, raw, ref, q_idx, read, read_pair, read_rank, read_fav):
+        # Lower base qualities in place where the two mates of a pair overlap, like
+        # htslib: one mate keeps the summed quality of matching bases, the higher
+        # quality base of a mismatch keeps 80%, and bases facing a deletion keep 80%
+        # on the mate favoured by the read name hash. q_idx is -1 for deletions.
+        key = read_pair[read] * (len(self.counts) + 1) + ref
+        order = np.lexsort((read_rank[read], key))
+        key = key[order]
+        dup = np.nonzero(key[1:] == key[:-1])[0]
+        a = order[dup]
+        b = order[dup + 1]
+        ia = q_idx[a]
+        ib = q_idx[b]
+        fa = read_fav[read[a]] > 0
+
+        for base, other, fav in ((ia, ib, fa), (ib, ia, ~fa)):
+            facing_del = (base >= 0) & (other < 0)
+            idx = base[facing_del]
+            qual[idx] = np.where(fav[facing_del], (0.8 * qual[idx]).astype(np.int32), 0)
+
+        both = (ia >= 0) & (ib >= 0)
+        ia = ia[both]
+        ib = ib[both]
+        fa = fa[both]
+        qa = qual[ia]
+        qb = qual[ib]
+        same = raw[ia] == raw[ib]
+        total = np.minimum(qa + qb, 200)
+        keep_a = np.where(same | (qa == qb), fa, qa > qb)
+        kept = np.where(same, total, (0.8 * np.maximum(qa, qb)).astype(np.int32))
+        qual[ia] = np.where(keep_a, kept, 0)
+        qual[ib] = np.where(keep_a, 0, kept)
+
+    def bin(self, ref, codes, start, stop):
+        inside = (ref >= start) & (ref < stop)
+        flat = ref[inside] * len(ALLELES) + codes[inside]
+        binned = np.bincount(flat, minlength=self.counts.size)
+        self.counts += binned.reshape(self.counts.shape).astype(np.int32)
+
+
+def _favours_first(name):
+    # htslib's choice of which overlapping mate keeps its qualities (X31 then Wang hash)
+    h = ord(name[0]) if len(name) else 0
+    for c in name[1:]:
+        h = ((h << 5) - h + ord(c)) & 0xffffffff
+    h = (h + ~(h << 15)) & 0xffffffff
+    h ^= h >> 10
+    h = (h + (h << 3)) & 0xffffffff
+    h ^= h >> 6
+    h = (h + ~(h << 11)) & 0xffffffff
+    h ^= h >> 16
+    return h & 1
+
+
+def _seek(cigar, walk):
+    # htslib's cigar_iref2iseq_set: moves walk ([cigar block, offset in the block,
+    # query offset, reference offset from the read's start]) to the first aligned base
+    # at or after reference offset walk[3]. False if there is none
+    left = walk[3]
+    walk[1] = walk[2] = walk[3] = 0
+    while walk[0] < len(cigar):
+        op, l = cigar[walk[0]]
+        if op == 0 or op == 7 or op == 8:
+            left -= l
+            if left < 0:
+                walk[1] = l + left
+                walk[2] += walk[1]
+                walk[3] += walk[1]
+                return True
+            walk[2] += l
+            walk[3] += l
+        elif op == 1 or op == 4:
+            walk[2] += l
+        elif op == 2 or op == 3:
+            left = max(left - l, 0)
+            walk[3] += l
+        walk[0] += 1
+        walk[1] = 0
+    return False
+
+
+def _step(cigar, walk):
+    # htslib's cigar_iref2iseq_next: moves walk on to the next aligned base
+    while walk[0] < len(cigar):
+        op, l = cigar[walk[0]]
+        if op == 0 or op == 7 or op == 8:
+            if walk[1] < l - 1:
+                walk[1] += 1
+                walk[2] += 1
+                walk[3] += 1
+                return True
+        elif op == 2 or op == 3:
+            walk[3] += l
+        elif op == 1 or op == 4:
+            walk[2] += l
+        walk[0] += 1
+        walk[1] = -1
+    return False
+
+
+def _tweak_pair(qual, raw, a, b, favours_a):
+    # htslib's tweak_overlap_quality, step for step, on the qualities of mates a and b
+    # ((offset of the read's bases, start, cigar, length)), a starting first
+    a_offset, a_pos, a_cigar, a_len = a
+    b_offset, b_pos, b_cigar, b_len = b
+    ref = b_pos
+    a_walk = [0, 0, 0, ref - a_pos]
+    b_walk = [0, 0, 0, 0]
+    if not _seek(a_cigar, a_walk) or not _seek(b_cigar, b_walk):
+        return
+    while True:
+        while a_walk[3] < ref - a_pos:
+            if not _step(a_cigar, a_walk):
+                return
+        while b_walk[3] < ref - b_pos:
+            if not _step(b_cigar, b_walk):
+                return
+        a_ref = a_walk[3] + a_pos
+        b_ref = b_walk[3] + b_pos
+        ref = max(ref, a_ref, b_ref) + 1
+        if a_ref != b_ref:
+            # A deletion in one mate moved it on, so the other catches up with 80% or
+            # none of its qualities. Anything else, like a ref skip, is passed over
+            if a_ref < b_ref and b_walk[0] > 0 and b_cigar[b_walk[0] - 1][0] == 2:
+                while True:
+                    i = a_offset + a_walk[2]
+                    qual[i] = int(qual[i] * 0.8) if favours_a else 0
+                    if not _step(a_cigar, a_walk):
+                        return
+                    if a_walk[3] + a_pos >= b_ref:
+                        break
+            elif a_walk[0] > 0 and a_cigar[a_walk[0] - 1][0] == 2:
+                while True:
+                    i = b_offset + b_walk[2]
+                    qual[i] = 0 if favours_a else int(qual[i] * 0.8)
+                    if not _step(b_cigar, b_walk):
+                        return
+                    if b_walk[3] + b_pos >= a_ref:
+                        break
+            else:
+                continue
+        if a_walk[2] >= a_len or b_walk[2] >= b_len:
+            return
+        i = a_offset + a_walk[2]
+        j = b_offset + b_walk[2]
+        qa = int(qual[i])
+        qb = int(qual[j])
+        if raw[i] == raw[j]:
+            total = min(qa + qb, 200)
+            qual[i] = total if favours_a else 0
+            qual[j] = 0 if favours_a else total
+        elif qa != qb:
+            qual[i] = int(qa * 0.8) if qa > qb else 0
+            qual[j] = int(qb * 0.8) if qb > qa else 0
+        else:
+            qual[i] = int(qa * 0.8) if favours_a else 0
+            qual[j] = 0 if favours_a else int(qb * 0.8)
+
+
+def _expand(starts, lengths):
+    # Concatenated ranges [start, start + length) for each block
+    total = lengths.sum()
+    if total == 0:
+        return np.zeros(0, dtype=np.int64)
+    block_starts = np.repeat(np.cumsum(lengths) - lengths, lengths)
+    return np.repeat(starts, lengths) + np.arange(total) - block_starts
+
+
+@profiled('decode_bam')
+def count_alleles(bam_path, regions=None, contig=None, min_base_quality=MIN_BASE_QUALITY, max_depth=0, scheme=None, threads=1):
+    """
+    Count every allele at every position of one reference in a single pass over the BAM.
+    regions is an optional list of 0-based half-open (start, stop) intervals, read through
+    the BAM index, outside of which nothing is counted. max_depth=0 means no depth cap.
+    With scheme (a PrimerScheme, see schemes.py), primer bases are masked as they are
+    counted, so the BAM needs no separate primer trimming.
+    With threads, an indexed BAM without a depth cap is split into shards counted in
+    that many processes (see count_shard), and the BAM is otherwise decompressed in
+    that many threads. Either way the counts are the same as with one thread.
+    """
+    import pysam
+
+    samfile = pysam.Samfile(bam_path, "rb", threads=threads)
+    if contig is None:
+        contig = samfile.references[0]
+    length = samfile.get_reference_length(contig)
+    tid = samfile.get_tid(contig)
+
+    outside = np.zeros(length, dtype=bool)
+    if not samfile.has_index():
+        regions = [(0, length)]
+        reads = lambda start, stop: (read for read in samfile.fetch(until_eof=True) if read.reference_id == tid)
+    else:
+        if regions is None:
+            regions = [(0, length)]
+        else:
+            # Overlapping mates lower each other's qualities anywhere they reach, so
+            # the reads are those from where the regions' mates start, and only the
+            # regions' rows are kept
+            outside = np.ones(length, dtype=bool)
+            for start, stop in regions:
+                outside[start:stop] = False
+            regions = merge_regions([_mate_span(samfile, contig, start, stop) for start, stop in regions])
+        reads = lambda start, stop: samfile.fetch(contig, start, stop)
+        if threads > 1 and not max_depth:
+            samfile.close()
+            counts = count_sharded(bam_path, contig, length, regions, min_base_quality, scheme, threads)
+            if counts is not None:
+                counts[outside] = 0
+                return AlleleCounts(counts, contig)
+            samfile = pysam.Samfile(bam_path, "rb", threads=threads)
+
+    tally = _Tally(length, min_base_quality, max_depth, scheme)
+    for start, stop in regions:
+        # Reads starting before start can only lower the qualities of deletions
+        # before it, which aren't counted
+        tally.prev = -1
+        for read in reads(start, stop):
+            tally.add(read, start, stop)
+        tally.flush(start, stop, final=True)
+        tally.active = []
+        tally.last_start = -1
+    samfile.close()
+    tally.counts[outside] = 0
+
+    return AlleleCounts(tally.counts, contig)
+
+
+def shard_regions(regions, num_shards):
+    # (region, shard) pairs splitting regions into about num_shards shards of equal length
+    size = max(ceil(sum(stop - start for start, stop in regions) / num_shards), SHARD_MARGIN)
+    return [((start, stop), (first, min(first + size, stop))) for start, stop in regions for first in range(start, stop, size)]
+
+
+def count_shard(bam_path, contig, region, shard, min_base_quality=MIN_BASE_QUALITY, scheme=None):
+    """
+    Counts within region from the reads of one shard of it: those starting in the
+    shard, except reads whose mate starts less than SHARD_MARGIN before them, which are
+    counted in the shard of their mate. Reads starting before the region belong to its
+    first shard. Returns the counts of the region's rows and the longest reference span
+    of a paired read, as the shards only add up to the serial counts when that is
+    shorter than SHARD_MARGIN.
+    """
+    import pysam
+
+    samfile = pysam.Samfile(bam_path, "rb")
+    tally = _Tally(samfile.get_reference_length(contig), min_base_quality, 0, scheme)
+    start, stop = region
+    first, last = shard
+    longest = 0
+    # Reads of the shard start at most SHARD_MARGIN after it
+    for read in samfile.fetch(contig, first, min(last + SHARD_MARGIN, stop)):
+        pos = read.reference_start
+        owner = pos
+        flag = read.flag
+        if flag & 2 and not flag & 8 and read.next_reference_id == read.reference_id:
+            mpos = read.next_reference_start
+            if mpos < pos and pos - mpos < SHARD_MARGIN:
+                owner = mpos
+            if not flag & 4 and read.reference_end is not None:
+                longest = max(longest, read.reference_end - pos)
+        if not first <= max(owner, start) < last:
+            # Reads of other shards still move the pileup on (see _Tally.add)
+            if not flag & 4:
+                tally.prev = pos
+            continue
+        tally.add(read, start, stop)
+    tally.flush(start, stop, final=True)
+    samfile.close()
+    return tally.counts[start:stop], longest
+
+
+def _mate_span(samfile, contig, start, stop):
+    # (start, stop) widened to the starts of the mates of the reads overlapping it
+    lo, hi = start, stop
+    for read in samfile.fetch(contig, start, stop):
+        flag = read.flag
+        if flag & 2 and not flag & 12 and read.next_reference_id == read.reference_id:
+            lo = min(lo, read.next_reference_start)
+            hi = max(hi, read.next_reference_start + 1)
+    return lo, min(hi, samfile.get_reference_length(contig))
+
+
+def count_sharded(bam_path, contig, length, regions, min_base_quality=MIN_BASE_QUALITY, scheme=None, threads=1):
+    # Counts from shards of regions in a pool of threads processes, or None if they
+    # can't be split exactly
+    from concurrent.futures import ProcessPoolExecutor
+
+    counts = np.zeros((length, len(ALLELES)), dtype=np.int32)
+    shards = shard_regions(regions, threads * SHARDS_PER_THREAD)
+    with ProcessPoolExecutor(max_workers=threads) as pool:
+        futures = [pool.submit(count_shard, bam_path, contig, region, shard, min_base_quality, scheme) for region, shard in shards]
+        results = [future.result() for future in futures]
+    longest = max(result[1] for result in results)
+    if longest >= SHARD_MARGIN:
+        print('Reads span up to {} bases, counting {} without shards'.format(longest, bam_path))
+        return None
+    for ((start, stop), _), (rows, _) in zip(shards, results):
+        counts[start:stop] += rows
+    return counts
+
+
+def _shared_blocks(first, second):
+    # Intersections of two sorted lists of disjoint (start, stop) blocks
+    shared = []
+    i = j = 0
+    while i < len(first) and j < len(second):
+        start = max(first[i][0], second[j][0])
+        stop = min(first[i][1], second[j][1])
+        if start < stop:
+            shared.append((start, stop))
+        if first[i][1] < second[j][1]:
+            i += 1
+        else:
+            j += 1
+    return shared
+
+
+def merge_regions(regions):
+    # Sorted, non-overlapping cover of 0-based half-open (start, stop) intervals
+    merged = []
+    for start, stop in sorted(regions):
+        if len(merged) and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], stop)
+        else:
+            merged.append([start, stop])
+    return [(start, stop) for start, stop in merged]
+
+
+@profiled('decode_bam')
+def count_depth(bam_path, regions=None, contig=None, threads=1):
+    """
+    Reads covering every position of one reference, deletions included, from the
+    alignment blocks of each read rather than a pileup of its bases. Only reads
+    overlapping regions (0-based half-open intervals) are read, through the BAM index.
+    The reference is contig, or the BAM's first if it has no contig.
+    A pair is counted once at the positions both of its mates cover (a ref skip covers
+    nothing), and there is no depth cap. Secondary, supplementary, duplicate and QC
+    failed alignments aren't counted. The BAM is decompressed in threads threads.
+    """
+    import pysam
+
+    samfile = pysam.Samfile(bam_path, "rb", threads=threads)
+    if contig is not None and contig not in samfile.references:
+        # Primer schemes name a reference (MN908947.3) that BAMs can call something
+        # else (NC_045512.2), with the same positions
+        print('Warning: {} is not a reference of {}, using {}'.format(contig, bam_path, samfile.references[0]))
+        contig = None
+    if contig is None:
+        contig = samfile.references[0]
+    length = samfile.get_reference_length(contig)
+    tid = samfile.get_tid(contig)
+
+    if not samfile.has_index():
+        regions = [(0, length)]
+        reads = lambda start, stop: (read for read in samfile.fetch(until_eof=True) if read.reference_id == tid)
+    else:
+        regions = merge_regions(regions) if regions is not None else [(0, length)]
+        reads = lambda start, stop: samfile.fetch(contig, start, stop)
+
+    # Depth is the running sum of +1 at the start and -1 at the end of every block
+    starts = []
+    ends = []
+    mates = {}
+    last_stop = 0
+    for start, stop in regions:
+        for read in reads(start, stop):
+            pos = read.reference_start
+            # Already read with the previous region
+            if pos < last_stop:
+                continue
+            flag = read.flag
+            cigar = read.cigartuples
+            # Unmapped, secondary, QC failed, duplicate and supplementary reads, as
+            # samtools depth leaves out
+            if flag & 0xF04 or not cigar:
+                continue
+            if len(cigar) == 1 and cigar[0][0] == 0:
+                blocks = [(pos, pos + cigar[0][1])]
+            else:
+                blocks = []
+                end = pos
+                for op, l in cigar:
+                    if op == 0 or op == 2 or op == 7 or op == 8:
+                        blocks.append((end, end + l))
+                    if op == 0 or op == 2 or op == 3 or op == 7 or op == 8:
+                        end += l
+            for block_start, block_end in blocks:
+                starts.append(block_start)
+                ends.append(block_end)
+            if flag & 2 and not flag & 8 and read.next_reference_id == read.reference_id:
+                name = read.query_name
+                if name in mates:
+                    # Take the positions both mates cover off the second one, which
+                    # leaves out those in a ref skip of either mate
+                    for shared_start, shared_end in _shared_blocks(mates.pop(name), blocks):
+                        starts.append(shared_end)
+                        ends.append(shared_start)
+                elif read.next_reference_start >= pos:
+                    mates[name] = blocks
+        last_stop = stop
+    samfile.close()
+
+    starts = np.array(starts, dtype=np.int64)
+    ends = np.array(ends, dtype=np.int64)
+    steps = np.bincount(starts, minlength=length + 1) - np.bincount(ends, minlength=length + 1)
+    return np.cumsum(steps[:length])
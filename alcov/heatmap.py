@@ -0,0 +1,118 @@
+import copy
+from math import ceil, sqrt
+
+import numpy as np
+
+
+# Heatmaps up to this size are drawn cell by cell with their values written in
+MAX_ANNOTATED_ROWS = 100
+MAX_ANNOTATED_CELLS = 2500
+# Larger ones are drawn as raster images, split into pages of at most this many rows
+ROWS_PER_PAGE = 500
+# Each label costs milliseconds to draw, so at most this many are drawn along the
+# columns of a page (every row of a page is labelled)
+MAX_COL_LABELS = 100
+# Point size of tick labels and the most pixels in one saved page
+LABEL_SIZE = 6
+MAX_PIXELS = 15e6
+
+
+def is_annotated(num_rows, num_cols):
+    # Whether cell values are small enough in number to be readable
+    return num_rows <= MAX_ANNOTATED_ROWS and num_rows * num_cols <= MAX_ANNOTATED_CELLS
+
+
+def page_paths(img_path, num_pages):
+    # samples.png, or samples_page1.png, samples_page2.png, ...
+    if num_pages == 1:
+        return [img_path]
+    stem, dot, ext = img_path.rpartition('.')
+    if not dot:
+        stem, ext = img_path, 'png'
+    return ['{}_page{}.{}'.format(stem, i + 1, ext) for i in range(num_pages)]
+
+
+def tick_step(num_labels, length_in, max_labels=None):
+    # Show every step-th label so that labels don't overlap along length_in inches
+    fits = max(int(length_in * 72 / (LABEL_SIZE + 2)), 1)
+    if max_labels is not None:
+        fits = min(fits, max_labels)
+    return max(ceil(num_labels / fits), 1)
+
+
+def label_length(labels):
+    # Rough length in inches of the longest label
+    return max((len(str(label)) for label in labels), default=0) * LABEL_SIZE * 0.6 / 72
+
+
+def plot_raster_heatmap(matrix, row_labels, col_labels, img_path=None, vmin=0, vmax=1, mask=None,
+                        cbar_format=None, xlabel=None, ylabel=None, rows_per_page=ROWS_PER_PAGE):
+    """
+    Draw a large heatmap (rows x columns) as raster images, one per page of rows, each
+    saved (or without img_path, shown) and closed before the next is drawn so memory is
+    bounded by one page. Cells in mask are left blank. Column labels are thinned to what
+    fits and saved pages are capped at MAX_PIXELS.
+    """
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+
+    matrix = np.asarray(matrix, dtype=float)
+    num_rows, num_cols = matrix.shape
+    cmap = copy.copy(sns.cm.rocket_r)
+    cmap.set_bad('white')
+    num_pages = max(ceil(num_rows / rows_per_page), 1)
+    paths = page_paths(img_path, num_pages) if img_path is not None else [None] * num_pages
+
+    # Every page has the size of a full one, so the pages line up. Margins are fixed
+    # from the label lengths rather than found by tight_layout, which draws the page twice
+    page_rows = min(num_rows, rows_per_page)
+    map_width = min(max(num_cols * 0.15, 4), 20)
+    map_height = min(max(page_rows * (LABEL_SIZE + 2) / 72, 3), 80)
+    left = label_length(row_labels) + (0.5 if ylabel is not None else 0.2)
+    bottom = label_length(col_labels) + (0.5 if xlabel is not None else 0.2)
+    top, right = 0.5, 1.2
+    width = left + map_width + right
+    height = bottom + map_height + top
+    row_step = tick_step(page_rows, map_height)
+    col_step = tick_step(num_cols, map_width, MAX_COL_LABELS)
+    cols = np.arange(0, num_cols, col_step)
+    dpi = min(300, sqrt(MAX_PIXELS / (width * height)))
+    for page, path in enumerate(paths):
+        first = page * rows_per_page
+        last = min(first + rows_per_page, num_rows)
+        data = matrix[first:last]
+        if mask is not None:
+            data = np.ma.masked_array(data, np.asarray(mask)[first:last])
+        fig = plt.figure(figsize=(width, height))
+        ax = fig.add_axes([left / width, bottom / height, map_width / width, map_height / height])
+        # A short page is drawn at the top, with rows the height of those on full pages
+        image = ax.imshow(data, cmap=cmap, vmin=vmin, vmax=vmax, aspect='auto', interpolation='nearest',
+                          extent=(-0.5, num_cols - 0.5, last - first - 0.5, -0.5))
+        ax.set_xlim(-0.5, num_cols - 0.5)
+        ax.set_ylim(page_rows - 0.5, -0.5)
+        ax.set_xticks([])
+        ax.set_yticks([])
+        # Labels are plain text rather than ticks, and axis labels and titles are placed
+        # on the figure, as ticks and axis labels are several times slower to lay out
+        row_transform = ax.get_yaxis_transform()
+        for i in range(0, last - first, row_step):
+            ax.text(-0.003, i, row_labels[first + i], transform=row_transform, fontsize=LABEL_SIZE, ha='right', va='center')
+        col_transform = ax.get_xaxis_transform()
+        for i in cols:
+            ax.text(i, -0.003, col_labels[i], transform=col_transform, fontsize=LABEL_SIZE, ha='center', va='top', rotation=90)
+        if xlabel is not None:
+            fig.text((left + map_width / 2) / width, 0.1 / height, xlabel, ha='center', va='bottom')
+        if ylabel is not None:
+            fig.text(0.1 / width, (bottom + map_height / 2) / height, ylabel, ha='left', va='center', rotation=90)
+        if num_pages > 1:
+            fig.text((left + map_width / 2) / width, (height - 0.15) / height, 'Rows {}-{} of {}'.format(first + 1, last, num_rows),
+                     ha='center', va='top')
+        cax = fig.add_axes([(left + map_width + 0.2) / width, bottom / height, 0.2 / width, map_height / height])
+        fig.colorbar(image, cax=cax, format=cbar_format)
+        if path is not None:
+            fig.savefig(path, dpi=dpi)
+        else:
+            plt.show()
+        plt.close(fig)
+    if img_path is not None:
+        print('Heatmap written to {}'.format(', '.join(paths)))
@@ -0,0 +1,175 @@
+import json
+import os
+from collections import defaultdict
+from itertools import chain
+
+import numpy as np
+
+
+ALIAS_PATH = os.path.join(os.path.dirname(__file__), 'alias_key.json')
+ALIAS_URL = 'https://raw.githubusercontent.com/cov-lineages/pango-designation/master/pango_designation/alias_key.json'
+
+
+def load_aliases(path=ALIAS_PATH):
+    """
+    The Pango alias key ({'BA': 'B.1.1.529', 'XBB': ['BA.2.10.1', 'BA.2.75'], ...}) as
+    published by pango-designation (see make_constellations.py). Without it every alias
+    would be a separate top level clade, so it is an error for it to be missing.
+    """
+    if not os.path.exists(path):
+        raise FileNotFoundError('No Pango alias key at {}, which hierarchical solving needs to find the clades of '
+                                'aliased lineages. Download it from {} there'.format(path, ALIAS_URL))
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def lineage_name(label):
+    # Catalogue labels are Pango names with a -like suffix
+    return label[:-len('-like')] if label.endswith('-like') else label
+
+
+def unalias(name, aliases):
+    # Full name of a lineage, e.g. JN.1.11 -> B.1.1.529.2.86.1.1.1.11. Recombinants
+    # (aliases of several parents) have no single ancestry and are left as they are.
+    while True:
+        prefix, dot, rest = name.partition('.')
+        full = aliases.get(prefix)
+        if not isinstance(full, str) or full == '':
+            return name
+        name = full + dot + rest
+
+
+def realias(full, reverse):
+    # Shortest Pango name for a full name, using the longest alias that is a proper prefix
+    parts = full.split('.')
+    for depth in range(len(parts) - 1, 0, -1):
+        alias = reverse.get('.'.join(parts[:depth]))
+        if alias is not None:
+            return '.'.join([alias] + parts[depth:])
+    return full
+
+
+class LineageTree(object):
+    """
+    Clades of the catalogue lineages, from their Pango names. Every dotted prefix of a
+    lineage's (unaliased) name is a clade, so BA.2.86.1 is in BA.2.86, BA.2 and BA
+    whether or not those are in the catalogue themselves.
+
+    The tree is cut into items, each either a clade (clade, True), standing for all its
+    lineages, or a single lineage (clade, False).
+    """
+
+    def __init__(self, lineages, aliases=None):
+        aliases = aliases or {}
+        reverse = {full: alias for alias, full in aliases.items() if isinstance(full, str) and full}
+        self.lineages = list(lineages)
+        self.lineage = {}  # clade -> index of the lineage with the clade's name
+        self.members = defaultdict(list)  # clade -> indices of all lineages in it
+        self.children = defaultdict(list)  # clade -> subclades, '' is the root
+        self.names = {}
+        for i, label in enumerate(self.lineages):
+            parts = unalias(lineage_name(label), aliases).split('.')
+            for depth in range(1, len(parts) + 1):
+                clade = '.'.join(parts[:depth])
+                if clade not in self.names:
+                    self.names[clade] = realias(clade, reverse)
+                    self.children['.'.join(parts[:depth-1])].append(clade)
+                self.members[clade].append(i)
+            self.lineage.setdefault('.'.join(parts), i)
+
+    def label(self, item):
+        clade, whole = item
+        if whole:
+            return self.names[clade] + '*'
+        return self.lineages[self.lineage[clade]]
+
+    def item_members(self, item):
+        clade, whole = item
+        if whole:
+            return self.members[clade]
+        return [self.lineage[clade]]
+
+    def representative(self, item, rank):
+        # The lineage of an item with the highest rank
+        return max(self.item_members(item), key=rank.__getitem__)
+
+    def contains(self, clade, item):
+        return item[0] == clade or item[0].startswith(clade + '.')
+
+    def expand(self, clade):
+        # The items a clade splits into: its own lineage, if it has one, and its
+        # subclades, passing over subclades that only hold a single smaller clade
+        items = []
+        if clade in self.lineage:
+            items.append((clade, False))
+        for child in self.children[clade]:
+            while child not in self.lineage and len(self.children[child]) == 1:
+                child = self.children[child][0]
+            items.append((child, len(self.children[child]) > 0))
+        return items
+
+    def initial_cut(self, num_clades):
+        # Split the largest clades until there are at least num_clades items
+        frontier = self.expand('')
+        while len(frontier) < num_clades:
+            clades = [item for item in frontier if item[1]]
+            if not clades:
+                break
+            largest = max(clades, key=lambda item: len(self.members[item[0]]))
+            i = frontier.index(largest)
+            frontier[i:i+1] = self.expand(largest[0])
+        return frontier
+
+
+def clade_totals(tree, clades, frontier, merged_lins, reg):
+    # Total abundance of each clade, from the fitted groups whose items are all in the clade
+    items = {tree.label(item): item for item in frontier}
+    totals = {}
+    for clade in clades:
+        total = 0
+        for lins, x in zip(merged_lins, reg):
+            if all(tree.contains(clade, items[lin]) for lin in lins.split(' or ')):
+                total += x
+        totals[tree.names[clade] + '*'] = round(total, 3)
+    return totals
+
+
+def solve_hierarchical(tree, bits, Y, solve, threshold=0.02, num_clades=50):
+    """
+    Coarse to fine abundance estimation over a LineageTree. Starts from a cut of about
+    num_clades clades and repeatedly splits the clades with an abundance of at least
+    threshold into their subclades and re-solves, until no clade clears the threshold.
+
+    Each clade is fitted with the profile of its lineage that best matches the sample:
+    the most mutations observed in Y at a frequency of at least threshold less those
+    that aren't, then the fewest mutations. Fixed clade profiles lose the sample's clade
+    to a sibling: the mutations most of EG.5's lineages share include EG.5.1's, and BE.1
+    itself has fewer of BQ.1.1's mutations than BE.9.
+
+    bits are the packed mutation profiles of tree.lineages, and solve(bits, labels)
+    fits a set of profiles, returning (profiles, merged labels, abundances).
+    Returns the last fit and the total abundance of each clade that was split.
+    """
+    observed = np.asarray(Y) >= threshold
+    lmps = np.unpackbits(bits, axis=1, count=len(observed)).astype(np.int64)
+    rank = (lmps @ np.where(observed, 1, -1)) * (len(observed) + 1) - lmps.sum(axis=1)
+    frontier = tree.initial_cut(num_clades)
+    split_clades = []
+    level = 0
+    while True:
+        level += 1
+        labels = [tree.label(item) for item in frontier]
+        clade_bits = bits[[tree.representative(item, rank) for item in frontier]]
+        print('Level {}: {} clades and lineages'.format(level, len(frontier)))
+        merged_lmps, merged_lins, reg = solve(clade_bits, labels)
+        abundances = {}
+        for lins, x in zip(merged_lins, reg):
+            for lin in lins.split(' or '):
+                abundances[lin] = x
+        split = set(item for item, label in zip(frontier, labels) if item[1] and abundances[label] >= threshold)
+        if len(split) == 0:
+            break
+        split_clades += [item[0] for item in frontier if item in split]
+        frontier = list(chain.from_iterable(tree.expand(item[0]) if item in split else [item] for item in frontier))
+    totals = clade_totals(tree, split_clades, frontier, merged_lins, reg)
+    return merged_lmps, merged_lins, reg, totals
@@ -1,15 +1,26 @@
-from collections import defaultdict
+import os
+import time
+from collections import defaultdict, namedtuple
+from functools import partial
+from itertools import chain
 from math import ceil, floor
 
-from .analyze import find_mutants_in_bam, print_mut_results
-from .convert_mutations import aa, nt
-from .mutations import mutations as mut_lins
+from .analyze import find_mutants_in_bam
+from .batch import map_samples, read_samples
+from .convert_mutations import aa_many
+from .heatmap import is_annotated, plot_raster_heatmap
+from .mutation_matrix import load_mutation_matrix
+from .profiling import profiled, sample, stage
+
+
+# Solver iterations and seconds spent building the model and solving, for one sample
+SolveStats = namedtuple('SolveStats', ['iterations', 'build_time', 'solve_time', 'warm_start'])
 
 
 def parse_mutations(mutations):
     nts = [mut for mut in mutations if ':' not in mut]
     aas = [mut for mut in mutations if ':' in mut]
-    return nts + sum([aa(mut) for mut in aas], [])
+    return nts + list(chain.from_iterable(aa_many(aas)))
 
 
 def parse_snv(snv):
@@ -19,28 +30,6 @@ def parse_snv(snv):
     return old_bp, pos, new_bp
 
 
-def mut_in_col(pileupcolumn, mut):
-    muts = 0
-    not_muts = 0
-    if mut == '-':
-        for pileupread in pileupcolumn.pileups:
-            if pileupread.is_del:
-                muts += 1
-            else:
-                not_muts += 1
-    else:
-        for pileupread in pileupcolumn.pileups:
-            qpos = pileupread.query_position
-            if qpos is None:
-                continue
-            base = pileupread.alignment.query_sequence[qpos]
-            if base == mut:
-                muts += 1
-            else:
-                not_muts += 1
-    return muts, not_muts
-
-
 def write_csv(sample_results, sample_names, home_lab):
     lin_names = set()
     for sr in sample_results:
@@ -57,6 +46,7 @@ def write_csv(sample_results, sample_names, home_lab):
         f.write('\n'.join(','.join(row) for row in [csv_headers] + csv_rows))
 
 
+@profiled('plot')
 def plot_lineages(sample_results, sample_names, img_path=None, all_lins=False):
     import numpy as np
     import matplotlib.pyplot as plt
@@ -70,6 +60,10 @@ def plot_lineages(sample_results, sample_names, img_path=None, all_lins=False):
     names.sort()
     # names = sample_results[0].keys()
     lin_fractions = np.array([[lin_results[lin]*100 if lin in lin_results else 0 for lin in names] for lin_results in sample_results]).T    
+    if not is_annotated(len(names), len(sample_names)):
+        plot_raster_heatmap(lin_fractions, names, sample_names, img_path, vmin=0, vmax=100, cbar_format='%.0f%%',
+                            xlabel='Frequency in sample', ylabel='SARS-CoV-2 Lineage')
+        return
     # no_reads = np.array([[f == -1 for f in fractions] for fractions in lin_fractions])
     # fig, ax = plt.subplots(figsize=(len(sample_names)/2,len(names)/2))
  
@@ -113,6 +107,7 @@ def plot_lineages(sample_results, sample_names, img_path=None, all_lins=False):
     else:
         plt.show()
     
+@profiled('plot')
 def plot_lineages_timeseries(sample_results, sample_names):
     from datetime import date
     import numpy as np
@@ -236,161 +231,237 @@ def show_lineage_pie(sample_results):
     plt.show()
 
 
-def do_regression(lmps, Y):
+def do_regression(lmps, Y, G=None, passive=None):
     # Perform linear regression and redo if sum(frequencies) > 1
     import numpy as np
-    from sklearn.linear_model import LinearRegression
-    from sklearn.linear_model import Lasso
-    X = np.array(lmps).T
-    reg = LinearRegression(fit_intercept=0, positive=True).fit(X, Y)
-    score = reg.score(X, Y)
-    best_score = score
-    best_reg = reg
-    if sum(reg.coef_) > 1:
-        # If there is no valid solution, drop uncovered mutations one at a time
-        # This allows for lineages with one missing mutation
-        valid = False
-        best_score = 0.8 # minimum valid score
-        for i in range(len(X)):
-            if Y[i] == 0:
-                new_X = np.concatenate((X[:i], X[i+1:]))
-                new_Y = np.concatenate((Y[:i], Y[i+1:]))
-                new_reg = LinearRegression(fit_intercept=0, positive=True).fit(new_X, new_Y)
-                new_score = new_reg.score(X, Y)
-                if sum(new_reg.coef_) <= 1 and new_score > best_score:
-                    valid = True
-                    best_score = new_score
-                    best_reg = new_reg
-        if not valid:
-            print('Warning: solutions sums to > 1')
-    return X, [frac for frac in best_reg.coef_]
-
-
-def do_regression_linear(lmps, Y, muts):
-    # Linear program for minimizing error of frequencies
+    from .solvers import nnls_sum_constrained
+
+    X = np.asarray(lmps, dtype=float).T
+    with stage('solve'):
+        solution = nnls_sum_constrained(X, Y, G=G, passive=passive)
+    if not solution.valid:
+        print('Warning: solutions sums to > 1')
+    return X, solution.x.tolist(), solution
+
+
+def do_regression_linear(lmps, Y, muts, solver='glop', time_limit=None, model=None, active=None):
+    # Linear program for minimizing error of frequencies, optionally with a model
+    # already built for lmps (only the lineages in active are fit)
     import numpy as np
-    # from sklearn.linear_model import LinearRegression
-    # from sklearn.linear_model import Lasso
-    from ortools.linear_solver import pywraplp
-    from ortools.init import pywrapinit
-    solver = pywraplp.Solver.CreateSolver('GLOP')
-    num_lins = len(lmps)
-    num_muts = len(lmps[0])
-    lins = [solver.NumVar(0, 1, 'x_{}'.format(i)) for i in range(num_lins)]
-    t = [solver.NumVar(0, solver.infinity(), 't_{}'.format(i)) for i in range(num_muts)]
-    # t = [solver.NumVar(0, 1, 't_{}'.format(i)) for i in range(num_muts)]
-    # t = [solver.NumVar(-1, 1, 't_{}'.format(i)) for i in range(num_muts)]
-    constraints_1 = []
-    constraints_2 = []
-    # print(lmps)
-    mut_freqs = list(Y)
-    # print(mut_freqs)
-    for j in range(num_muts):
-        constraints_1.append(solver.Constraint(-solver.infinity(), mut_freqs[j], 'c_{}_1'.format(j)))
-        constraints_2.append(solver.Constraint(mut_freqs[j], solver.infinity(), 'c_{}_2'.format(j)))
-        constraints_1[j].SetCoefficient(t[j], -1)
-        constraints_2[j].SetCoefficient(t[j], 1)
-        for i in range(num_lins):
-            constraints_1[j].SetCoefficient(lins[i], lmps[i][j])
-            constraints_2[j].SetCoefficient(lins[i], lmps[i][j])
-    # freqs = solver.Constraint(0, solver.infinity(), 'frequencies')
-    freqs = solver.Constraint(0, 1, 'frequencies')
-    for i in range(num_lins):
-        freqs.SetCoefficient(lins[i], 1)
-    objective = solver.Objective()
-    for j in range(num_muts):
-        objective.SetCoefficient(t[j], 1)
-    objective.SetMinimization()
-    status = solver.Solve()
-    # print('Lineage abundances:')
-    # for i in range(num_lins):
-    #     print(lins[i].solution_value())
+    from scipy.sparse import csr_matrix
+    from .solvers import l1_model
+
+    X = np.asarray(lmps, dtype=float).T
+    A = csr_matrix(X)
+    if model is None:
+        model = l1_model(A, solver)
+    with stage('solve'):
+        solution = model.solve(Y, time_limit, active)
+    if solution.status not in ['optimal', 'feasible']:
+        print('Warning: {} solver finished with status {}'.format(solver, solution.status))
+    diffs = (Y - A @ solution.x).tolist()
+    mut_diffs = {muts[j]: diffs[j] for j in range(len(muts))}
+
+    return X, solution.x.tolist(), mut_diffs, solution
+
+
+def print_residuals(muts, residuals, diffs):
+    # Mutations the fitted abundances explain poorly
     print('Residuals:')
-    sig_idxs = []
-    diffs = []
-    mut_diffs = {}
-    for j in range(num_muts):
-        res = t[j].solution_value()
-        yp = sum([lins[i].solution_value() * lmps[i][j] for i in range(num_lins)])
-        diffs.append(Y[j] - yp)
-        mut_diffs[muts[j]] = diffs[j]
-        if res > 0.1:
+    for j in range(len(muts)):
+        if residuals[j] > 0.1:
             print(muts[j])
-            print(res)
+            print(residuals[j])
             print(diffs[j])
-            sig_idxs.append(j)
-    if len(sig_idxs) > 0 and False:
-        d = {}
-        d['muts'] = [muts[i] for i in sig_idxs]
-        d['residuals'] = [diffs[i] for i in sig_idxs]
-        # d = {muts[i]: t[i].solution_value() for i in range(num_muts)}
-        import matplotlib.pyplot as plt
-        import pandas as pd
-        df = pd.DataFrame(data=d)
-        # df = df.loc[:, df.any()] # Delete all-zero lineages
-        df.plot.bar(x='muts', y='residuals')
-        plt.tight_layout()
-        plt.show()
-    X = np.array(lmps).T
 
-    return X, [lin.solution_value() for lin in lins], mut_diffs
 
+@profiled('profile_matrix')
+def merge_profiles(bits, lineages, num_muts):
+    """
+    Merge lineages with identical mutation profiles, given as one packed bit row per
+    lineage. Returns the distinct profiles as a 0/1 array and a label for each ('A or B'
+    for merged lineages), both in order of first appearance.
+    """
+    import numpy as np
 
-def find_lineages_in_bam(bam_path, return_data=False, min_depth=40, lineages=[], unique=False, l2=False):
+    # Group by the bytes of each row, keeping the first lineage of each group
+    groups = {}
+    first = []
+    members = []
+    for i, lin in enumerate(lineages):
+        key = bits[i].tobytes()
+        if key not in groups:
+            groups[key] = len(first)
+            first.append(i)
+            members.append([])
+        members[groups[key]].append(lin)
+    merged_lins = [' or '.join(lins) for lins in members]
+    merged_lmps = np.unpackbits(bits[first], axis=1, count=num_muts)
+    return merged_lmps, merged_lins
+
+
+def prune_lineages(lmps, Y, min_support=1, min_support_freq=0, min_support_fraction=0.9):
+    # Lineage profiles with at least min_support of their mutations, and at least
+    # min_support_fraction of them, observed at a frequency above min_support_freq.
+    # Most lineages share the mutations of their ancestors, which nearly every sample
+    # has, so it is the fraction that tells the lineages of a sample from the rest
     import numpy as np
-    import pysam
 
-    samfile = pysam.Samfile(bam_path, "rb")
+    lmps = np.asarray(lmps, dtype=np.int64)
+    observed = np.asarray(Y) > min_support_freq
+    support = lmps @ observed
+    return (support >= min_support) & (support >= min_support_fraction * lmps.sum(axis=1))
+
+
+def print_pruning(merged_lins, keep, min_support, min_support_freq, min_support_fraction):
+    pruned = [merged_lins[i] for i in range(len(merged_lins)) if not keep[i]]
+    num_pruned = sum(len(lins.split(' or ')) for lins in pruned)
+    num_lins = sum(len(lins.split(' or ')) for lins in merged_lins)
+    print('Pruned {} of {} lineages ({} of {} profiles) with fewer than {} mutations, or {:g}% of them, above frequency {}'.format(
+        num_pruned, num_lins, len(pruned), len(merged_lins), min_support, 100 * min_support_fraction, min_support_freq))
+
+
+class ProfileGroup(object):
+    """
+    Merged lineage profiles over one set of covered mutations, which every sample
+    covering those mutations is fit against. With shared=True the solver model (the LP,
+    or X'X for l2) is built once for all the profiles and re-used by each sample, with
+    the lineages pruned for a sample fixed at 0 instead of removed. Re-using the LP also
+    warm starts each solve from the last one.
+    """
+
+    def __init__(self, bits, lineages, muts, l2=False, solver='glop', shared=False):
+        # Merge indistinguishable lineages
+        self.merged_lmps, self.merged_lins = merge_profiles(bits, lineages, len(muts))
+        self.muts = muts
+        self.l2 = l2
+        self.solver = solver
+        self.shared = shared
+        self.build_time = 0
+        self.stats = []  # SolveStats of each solve
+        self.found = set()  # lineages with abundance > 0 in the last solve
+        self._model = None
+
+    def model(self):
+        if self._model is None:
+            import numpy as np
+            from .solvers import l1_model
+
+            start = time.perf_counter()
+            X = np.asarray(self.merged_lmps, dtype=float).T
+            with stage('build_model'):
+                self._model = X.T @ X if self.l2 else l1_model(X, self.solver)
+            self.build_time += time.perf_counter() - start
+        return self._model
+
+    def solve(self, Y, time_limit=None, min_support=1, min_support_freq=0, min_support_fraction=0.9, warm=None):
+        """
+        Fit Y, returning the merged profiles, their labels and their abundances. warm is
+        a set of lineages to start an l2 fit from, such as those found in the previous
+        sample of a time series.
+        """
+        import numpy as np
+
+        lmps = self.merged_lmps
+        muts = self.muts
+        # Lineages without enough of their mutations in the sample are left out of the solve
+        keep = prune_lineages(lmps, Y, min_support, min_support_freq, min_support_fraction)
+        print_pruning(self.merged_lins, keep, min_support, min_support_freq, min_support_fraction)
+        reg = np.zeros(len(self.merged_lins))
+        start = time.perf_counter()
+        build_time = self.build_time
+        iterations = 0
+        warm_started = False
+        if not keep.any():
+            if not self.l2:
+                print_residuals(muts, Y, Y)
+        elif self.l2:
+            G = self.model()[np.ix_(keep, keep)] if self.shared else None
+            passive = None
+            if warm:
+                passive = np.array([any(lin in warm for lin in lins.split(' or ')) for lins in self.merged_lins])[keep]
+                warm_started = True
+            _, reg[keep], solution = do_regression(lmps[keep], Y, G, passive)
+            iterations = solution.iterations
+        else:
+            if self.shared:
+                warm_started = self._model is not None
+                _, reg[:], mut_diffs, solution = do_regression_linear(lmps, Y, muts, self.solver, time_limit, self.model(), keep)
+            else:
+                _, reg[keep], mut_diffs, solution = do_regression_linear(lmps[keep], Y, muts, self.solver, time_limit)
+                self.build_time += solution.build_time
+            iterations = solution.iterations
+            print_residuals(muts, solution.residuals, [mut_diffs[m] for m in muts])
+        build_time = self.build_time - build_time
+        self.stats.append(SolveStats(iterations, build_time, time.perf_counter() - start - build_time, warm_started))
+        # Lineages found in the sample, to warm start the next one
+        self.found = set(lin for lins, x in zip(self.merged_lins, reg) if x > 0 for lin in lins.split(' or '))
+        return lmps, self.merged_lins, reg.tolist()
+
+
+def solve_profiles(bits, lineages, Y, muts, l2=False, solver='glop', time_limit=None, min_support=1, min_support_freq=0, min_support_fraction=0.9):
+    """
+    Fit abundances for lineages given their packed mutation profiles over muts.
+    Indistinguishable lineages are merged and lineages without enough support in Y are
+    left out of the fit with abundance 0. Returns the merged profiles, their labels and
+    their abundances.
+    """
+    return ProfileGroup(bits, lineages, muts, l2, solver).solve(Y, time_limit, min_support, min_support_freq, min_support_fraction)
+
+
+def solve_lineages(bits, lineages, Y, solve, tree=None, clade_threshold=0.02, num_clades=50):
+    # Fit with solve, over the lineage tree coarse to fine if one is given
+    if tree is None:
+        return solve(bits, lineages)
+    from .hierarchy import solve_hierarchical
 
-    aa_mutations = [m for m in mut_lins.keys()]
-    # aa_mutations = [m for m in mut_lins.keys() if m[0] in ['S']] # Only spike
-    # aa_mutations = [m for m in mut_lins.keys() if m[0] in ['N']] # Only N
+    merged_lmps, merged_lins, reg, clade_totals = solve_hierarchical(tree, bits, Y, solve, clade_threshold, num_clades)
+    print('Clade totals:')
+    print(clade_totals)
+    return merged_lmps, merged_lins, reg
+
+
+def lineage_catalogue(lineages=[], unique=False):
+    # The mutation matrix, the lineages to fit and the mutations to look for
+    with stage('load_catalogue'):
+        mut_mat = load_mutation_matrix()
+    aa_mutations = list(mut_mat.mutations)
+    # aa_mutations = [m for m in mut_mat.mutations if m[0] in ['S']] # Only spike
+    # aa_mutations = [m for m in mut_mat.mutations if m[0] in ['N']] # Only N
     aa_blacklist = ['S:D614G'] # all lineages contain this now
     aa_mutations = [m for m in aa_mutations if m not in aa_blacklist]
     # lineages = ['Delta', 'BA.1']
     if len(lineages) == 0:
-        lineages = list(mut_lins['C241T'].keys()) # arbitrary
+        lineages = mut_mat.lineages
     if unique:
-        aa_mutations = [mut for mut in aa_mutations if sum(mut_lins[mut][l] for l in lineages) == 1]
-    mutations = parse_mutations(aa_mutations)
+        sums = mut_mat.mutation_sums(lineages)
+        aa_mutations = [mut for mut in aa_mutations if sums[mut_mat.mut_index[mut]] == 1]
     vocs = ['B.1.1.7', 'B.1.617.2', 'P.1', 'B.1.351']
     vois = ['B.1.525', 'B.1.526', 'B.1.617.1', 'C.37']
     # if only_vocs:
     # lineages = vocs + vois
     # lineages = ['Omicron', 'BA.2', 'Delta']
+    return mut_mat, lineages, aa_mutations
 
-    mut_results = find_mutants_in_bam(bam_path, aa_mutations)
 
-    covered_muts = [m for m in aa_mutations if sum(mut_results[m]) >= min_depth]
-    if len(covered_muts) == 0:
-        print('No coverage')
-        return None
-    covered_lineages = set()
-    for m in covered_muts:
-        for l in mut_lins[m]:
-            if mut_results[m][0] > 0 and mut_lins[m][l] > 0.5:
-                covered_lineages.add(l)
-    covered_lineages = [l for l in lineages if l in covered_lineages]
+def sample_frequencies(bam_path, mutations, min_depth=40, cache_dir=None, mask_primers=None, threads=1):
+    # The mutations covered by at least min_depth reads and their frequencies
+    import numpy as np
+
+    mut_results = find_mutants_in_bam(bam_path, mutations, cache_dir, mask_primers, threads)
+    covered_muts = [m for m in mutations if sum(mut_results[m]) >= min_depth]
     Y = np.array([mut_results[m][0]/sum(mut_results[m]) if sum(mut_results[m]) > 0 else 0 for m in covered_muts])
-    lin_mut_profiles = [[round(mut_lins[mut][lin]) for mut in covered_muts] for lin in lineages]
-    # Merge indistinguishable lineages
-    merged_lmps = []
-    merged_lins = []
-    for i in range(len(lineages)):
-        lmp = lin_mut_profiles[i]
-        lin = lineages[i]
-        if lmp in merged_lmps:
-            lmp_idx = merged_lmps.index(lmp)
-            merged_lins[lmp_idx] += ' or '
-            merged_lins[lmp_idx] += lin
-        else:
-            merged_lmps.append(lmp)
-            merged_lins.append(lin)
-    if l2:
-        X, reg = do_regression(merged_lmps, Y)
-    else:
-        X, reg, mut_diffs = do_regression_linear(merged_lmps, Y, covered_muts)
+    return covered_muts, Y
+
+
+def lineage_tree(lineages, hierarchical):
+    if not hierarchical:
+        return None
+    from .hierarchy import LineageTree, load_aliases
+    return LineageTree(lineages, load_aliases())
 
+
+def report_lineages(merged_lins, reg):
     # print_mut_results(mut_results)
     sample_results = {merged_lins[i]: round(reg[i], 3) for i in range(len(merged_lins))}
     print(sample_results)
@@ -398,6 +469,25 @@ def find_lineages_in_bam(bam_path, return_data=False, min_depth=40, lineages=[],
     # freq_sum = sum(sample_results[lin] for lin in sample_results)
     # for lin in sample_results:
     #     sample_results[lin] = sample_results[lin] / freq_sum
+    return sample_results
+
+
+def find_lineages_in_bam(bam_path, return_data=False, min_depth=40, lineages=[], unique=False, l2=False, cache_dir=None, solver='glop', time_limit=None, min_support=1, min_support_freq=0, min_support_fraction=0.9, hierarchical=False, clade_threshold=0.02, num_clades=50, mask_primers=None, threads=1):
+    mut_mat, lineages, aa_mutations = lineage_catalogue(lineages, unique)
+    tree = lineage_tree(lineages, hierarchical)
+
+    covered_muts, Y = sample_frequencies(bam_path, aa_mutations, min_depth, cache_dir, mask_primers, threads)
+    if len(covered_muts) == 0:
+        print('No coverage')
+        return None
+    # A lineage has a mutation when its prevalence rounds to 1
+    with stage('profile_matrix'):
+        lin_mut_bits = mut_mat.profile_bits(covered_muts, lineages)
+    solve = partial(solve_profiles, Y=Y, muts=covered_muts, l2=l2, solver=solver, time_limit=time_limit,
+                    min_support=min_support, min_support_freq=min_support_freq, min_support_fraction=min_support_fraction)
+    merged_lmps, merged_lins, reg = solve_lineages(lin_mut_bits, lineages, Y, solve, tree, clade_threshold, num_clades)
+    X = merged_lmps.T.astype(float)
+    sample_results = report_lineages(merged_lins, reg)
 
     if return_data:
         return sample_results, X, Y, covered_muts
@@ -406,11 +496,131 @@ def find_lineages_in_bam(bam_path, return_data=False, min_depth=40, lineages=[],
     return sample_results
 
 
-def find_lineages(file_path, lineages_path, ts, csv, min_depth, show_stacked, unique, save_img, l2):
+def series_key(name):
+    # Time series samples are named SITE_YYYY-MM-DD
+    site, _, dt = name.rpartition('_')
+    return site, dt
+
+
+def find_lineages_in_bams(bam_paths, names=None, min_depth=40, lineages=[], unique=False, l2=False, cache_dir=None, solver='glop', time_limit=None, min_support=1, min_support_freq=0, min_support_fraction=0.9, hierarchical=False, clade_threshold=0.02, num_clades=50, workers=1, ts=False, mask_primers=None, threads=1):
+    """
+    Lineage abundances for a batch of BAM files, in input order (None for a sample
+    without coverage), with each sample's output printed under its name.
+    Samples are grouped by the mutations they cover. Each group's profiles are built
+    and merged once, and a group of several samples shares one solver model (see
+    ProfileGroup), so solver setup grows with the number of groups, not of samples.
+    Allele counting runs in a pool of workers processes, each of which uses threads
+    more to count its BAM.
+    With ts, samples named SITE_YYYY-MM-DD are solved site by site in date order, each
+    warm started from the previous sample of its site.
+    With mask_primers (a primer scheme, see schemes.py), bases in primers are not counted.
+    """
+    from collections import Counter
+
+    if names is None:
+        names = bam_paths
+    mut_mat, lineages, aa_mutations = lineage_catalogue(lineages, unique)
+    tree = lineage_tree(lineages, hierarchical)
+    count = partial(sample_frequencies, mutations=aa_mutations, min_depth=min_depth, cache_dir=cache_dir, mask_primers=mask_primers, threads=threads)
+    freqs = map_samples(count, [(bam_path,) for bam_path in bam_paths], workers, names)
+
+    remaining = Counter(tuple(covered_muts) for covered_muts, Y in freqs)
+    num_groups = len([key for key in remaining if len(key) > 0])
+    order = list(range(len(bam_paths)))
+    if ts:
+        order.sort(key=lambda i: series_key(names[i]))
+    groups = {}
+    found = {}  # site -> lineages found in its last sample
+    stats = []
+    results = [None] * len(bam_paths)
+    for i in order:
+        with sample(names[i]):
+            covered_muts, Y = freqs[i]
+            site = series_key(names[i])[0] if ts else None
+            print('{}:'.format(names[i]))
+            key = tuple(covered_muts)
+            if len(covered_muts) == 0:
+                print('No coverage')
+            elif hierarchical:
+                # Clade profiles depend on each sample's fit, so only the lineage profiles are shared
+                if key not in groups:
+                    with stage('profile_matrix'):
+                        groups[key] = mut_mat.profile_bits(covered_muts, lineages)
+                solve = partial(solve_profiles, Y=Y, muts=covered_muts, l2=l2, solver=solver, time_limit=time_limit,
+                                min_support=min_support, min_support_freq=min_support_freq, min_support_fraction=min_support_fraction)
+                merged_lmps, merged_lins, reg = solve_lineages(groups[key], lineages, Y, solve, tree, clade_threshold, num_clades)
+                results[i] = report_lineages(merged_lins, reg)
+            else:
+                if key not in groups:
+                    # A lineage has a mutation when its prevalence rounds to 1
+                    with stage('profile_matrix'):
+                        bits = mut_mat.profile_bits(covered_muts, lineages)
+                    groups[key] = ProfileGroup(bits, lineages, covered_muts, l2, solver, shared=remaining[key] > 1)
+                group = groups[key]
+                merged_lmps, merged_lins, reg = group.solve(Y, time_limit, min_support, min_support_freq, min_support_fraction, found.get(site) if ts else None)
+                found[site] = group.found
+                stats.append(group.stats[-1])
+                print_solve_stats([group.stats[-1]])
+                results[i] = report_lineages(merged_lins, reg)
+        # Groups are dropped after their last sample
+        remaining[key] -= 1
+        if remaining[key] == 0:
+            groups.pop(key, None)
+        print()
+    print('{} samples in {} groups of covered mutations'.format(len(bam_paths), num_groups))
+    if len(stats) > 0:
+        print_solve_stats(stats)
+    return results
+
+
+def print_solve_stats(stats):
+    warm = [s for s in stats if s.warm_start]
+    print('Solver: {} iterations, {:.3f}s building models, {:.3f}s solving'.format(
+        sum(s.iterations for s in stats), sum(s.build_time for s in stats), sum(s.solve_time for s in stats)), end='')
+    if len(stats) > 1:
+        print(' ({} of {} solves warm started, {:.0f} iterations per warm and {:.0f} per cold solve)'.format(
+            len(warm), len(stats),
+            sum(s.iterations for s in warm) / max(len(warm), 1),
+            sum(s.iterations for s in stats if not s.warm_start) / max(len(stats) - len(warm), 1)))
+    else:
+        print(' (warm start)' if len(warm) > 0 else '')
+
+
+def stored_lineages(store, samples, compute, lineages, min_depth, unique, l2, solver, time_limit, min_support, min_support_freq, min_support_fraction, hierarchical, clade_threshold, num_clades, mask_primers=None):
+    # Results of compute(samples) from the store, solving only the samples it doesn't
+    # have for these options and this version of the catalogue
+    from .mutation_matrix import catalogue_version
+    from .store import stored_results
+
+    params = {
+        'min_depth': min_depth, 'lineages': sorted(lineages), 'unique': unique, 'l2': l2, 'solver': solver,
+        'time_limit': time_limit, 'min_support': min_support, 'min_support_freq': min_support_freq,
+        'min_support_fraction': min_support_fraction,
+    }
+    if mask_primers is not None:
+        from .schemes import load_scheme
+        params['mask_primers'] = load_scheme(mask_primers).checksum
+    if hierarchical:
+        from .hierarchy import ALIAS_PATH
+        params.update(clade_threshold=clade_threshold, num_clades=num_clades,
+                      aliases=catalogue_version(ALIAS_PATH) if os.path.exists(ALIAS_PATH) else None)
+    analysis = store.analysis('hierarchical_lineages' if hierarchical else 'lineages', params, catalogue_version())
+    return stored_results(store, samples, compute,
+                          has=partial(store.is_computed, analysis=analysis),
+                          put=lambda fingerprint, result: store.put_lineages(fingerprint, analysis, result),
+                          get=partial(store.get_lineages, analysis=analysis))
+
+
+def find_lineages(file_path, lineages_path, ts, csv, min_depth, show_stacked, unique, save_img, l2, cache_dir=None, workers=1, solver='glop', time_limit=None, min_support=1, min_support_freq=0, min_support_fraction=0.9, hierarchical=False, clade_threshold=0.02, num_clades=50, store=None, no_plot=False, mask_primers=None, threads=1):
     """
     Accepts either a bam file or a tab delimited  txt file like
     s1.bam  Sample 1
     s2.bam  Sample 2
+    With a store (path of a SQLite file), results are kept in the store and only the
+    samples it doesn't have yet are solved. With no_plot, results are saved as JSON for
+    `alcov plot` instead of plotted, and the plotting libraries are never imported.
+    With mask_primers (a primer scheme, see schemes.py), bases in primers are not counted.
+    With threads, a single deep BAM is counted on that many cores (see count_alleles).
     """
 
     sample_results = []
@@ -423,29 +633,35 @@ def find_lineages(file_path, lineages_path, ts, csv, min_depth, show_stacked, un
         all_lins = True
         with open(lineages_path, 'r') as f:
             lineages = f.read().splitlines()
-    if file_path.endswith('.bam'):
-        sr, X, Y, covered_muts = find_lineages_in_bam(file_path, True, min_depth, lineages, unique, l2)
-        if show_stacked:
+    # The stacked plots need the fit itself, so a single BAM is always solved for them
+    if file_path.endswith('.bam') and (store is None or show_stacked):
+        sr, X, Y, covered_muts = find_lineages_in_bam(file_path, True, min_depth, lineages, unique, l2, cache_dir, solver, time_limit, min_support, min_support_freq, min_support_fraction, hierarchical, clade_threshold, num_clades, mask_primers, threads)
+        if show_stacked and not no_plot:
             show_lineage_predictions(sr, X, Y, covered_muts)
             show_lineage_pie(sr)
         sample_results.append(sr)
         sample_names.append('')
     else:
-        with open(file_path, 'r') as f:
-            samples = [line.split('\t') for line in f.read().split('\n')]
-        for sample in samples:
-            if sample[0].endswith('.bam'): # Mostly for filtering empty
-                print('{}:'.format(sample[1]))
-                # sample_result, mut_diffs = find_lineages_in_bam(sample[0], False, min_depth, lineages, unique)
-                sample_result = find_lineages_in_bam(sample[0], False, min_depth, lineages, unique, l2)
-                if sample_result is not None and sum(sample_result.values()) > 0:
-                    sample_results.append(sample_result)
-                    sample_names.append(sample[1])
-                    # for mut in mut_diffs:
-                    #     sample_mut_diffs[mut].append(mut_diffs[mut])
-                # sample_results.append(sample_result)
-                # sample_names.append(sample[1])
-                print()
+        samples = read_samples(file_path)
+
+        def compute(samples):
+            return find_lineages_in_bams([sample[0] for sample in samples], [sample[1] for sample in samples], min_depth, lineages, unique, l2, cache_dir,
+                                         solver, time_limit, min_support, min_support_freq, min_support_fraction, hierarchical, clade_threshold, num_clades, workers, ts, mask_primers, threads)
+
+        if store is None:
+            results = compute(samples)
+        else:
+            from .store import ResultStore
+            store = ResultStore(store)
+            results = stored_lineages(store, samples, compute, lineages, min_depth, unique, l2, solver, time_limit,
+                                      min_support, min_support_freq, min_support_fraction, hierarchical, clade_threshold, num_clades, mask_primers)
+            store.close()
+        for sample, sample_result in zip(samples, results):
+            if sample_result is not None and sum(sample_result.values()) > 0:
+                sample_results.append(sample_result)
+                sample_names.append(sample[1])
+                # for mut in mut_diffs:
+                #     sample_mut_diffs[mut].append(mut_diffs[mut])
     # print(sample_mut_diffs)
     for mut in sample_mut_diffs:
         diffs = sample_mut_diffs[mut]
@@ -454,6 +670,10 @@ def find_lineages(file_path, lineages_path, ts, csv, min_depth, show_stacked, un
             print(diffs)
     if csv:
         write_csv(sample_results, sample_names, home_lab)
+    if no_plot:
+        from .results import save_results
+        save_results('{}_lineages.json'.format(home_lab), 'find_lineages', sample_names, sample_results, ts=ts, all_lins=all_lins)
+        return
     img_path = file_path.replace('.txt', '.png') if save_img else None
     if ts:
         plot_lineages_timeseries(sample_results, sample_names)
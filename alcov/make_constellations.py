@@ -70,6 +70,15 @@ if response:
 else:
     raise RuntimeError("Failed to download lineage list.")
 
+# Alias key, used to resolve the ancestry of aliased lineages (JN.1 is BA.2.86.1.1.1)
+alias_url = "https://raw.githubusercontent.com/cov-lineages/pango-designation/master/pango_designation/alias_key.json"
+response = requests.get(alias_url)
+if response:
+    with open("alias_key.json", "w") as file:
+        file.write(response.text)
+else:
+    print("⚠️ Failed to download alias key, find_lineages --hierarchical needs it.")
+
 # Read lineage list
 with open("lineages.txt", "r") as file:
     lineages = file.read().splitlines()
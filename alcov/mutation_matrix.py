@@ -0,0 +1,149 @@
+import os
+from functools import lru_cache
+
+import numpy as np
+
+# precompute.py imports this as a top-level module, so it must not use relative
+# imports; callers mark its work as profiling stages instead
+
+MATRIX_PATH = os.path.join(os.path.dirname(__file__), 'mutations.npz')
+
+
+class MutationMatrix(object):
+    """Prevalence of each mutation (rows) in each lineage (columns), stored sparse"""
+
+    def __init__(self, matrix, mutations, lineages):
+        self.matrix = matrix.tocsr()
+        self.mutations = list(mutations)
+        self.lineages = list(lineages)
+        self.mut_index = {mut: i for i, mut in enumerate(self.mutations)}
+        self.lin_index = {lin: i for i, lin in enumerate(self.lineages)}
+        self._csc = None
+
+    def __contains__(self, mut):
+        return mut in self.mut_index
+
+    def __len__(self):
+        return len(self.mutations)
+
+    @property
+    def csc(self):
+        # Column-major copy for lineage slices, built on first use
+        if self._csc is None:
+            self._csc = self.matrix.tocsc()
+        return self._csc
+
+    def mut_idxs(self, mutations):
+        return np.array([self.mut_index[mut] for mut in mutations], dtype=np.int64)
+
+    def lin_idxs(self, lineages):
+        return np.array([self.lin_index[lin] for lin in lineages], dtype=np.int64)
+
+    def submatrix(self, mutations=None, lineages=None):
+        # Sparse rows of mutations restricted to the columns of lineages
+        m = self.matrix
+        if mutations is not None:
+            m = m[self.mut_idxs(mutations)]
+        if lineages is not None:
+            m = m[:, self.lin_idxs(lineages)]
+        return m
+
+    def rows(self, mutations, lineages=None):
+        # Dense len(mutations) x len(lineages) prevalence array
+        return self.submatrix(mutations, lineages).toarray()
+
+    def column(self, lineage):
+        # Dense prevalence of every mutation in one lineage
+        return self.csc[:, self.lin_index[lineage]].toarray().ravel()
+
+    def lineage_mutations(self, lineage):
+        # Mutations present in a lineage, in catalogue order
+        col = self.csc[:, self.lin_index[lineage]]
+        idxs = np.sort(col.indices[col.data > 0])
+        return [self.mutations[i] for i in idxs]
+
+    def profile_bits(self, mutations, lineages=None, threshold=0.5):
+        # Which mutations each lineage has (prevalence > threshold), one row per lineage
+        # with the mutations packed 8 to a byte like np.packbits
+        if lineages is None:
+            lineages = self.lineages
+        m = self.submatrix(mutations, lineages).tocoo()
+        present = m.data > threshold
+        rows = m.col[present]
+        cols = m.row[present].astype(np.int64)
+        bits = np.zeros((len(lineages), (len(mutations) + 7) // 8), dtype=np.uint8)
+        np.bitwise_or.at(bits, (rows, cols >> 3), (128 >> (cols & 7)).astype(np.uint8))
+        return bits
+
+    def mutation_sums(self, lineages=None):
+        # Total prevalence of each mutation across the given lineages (all by default)
+        return np.asarray(self.submatrix(None, lineages).sum(axis=1)).ravel()
+
+    def save(self, path=MATRIX_PATH):
+        m = self.matrix
+        np.savez_compressed(
+            path,
+            data=m.data.astype(np.float32),
+            indices=m.indices,
+            indptr=m.indptr,
+            shape=np.array(m.shape),
+            mutations=np.array(self.mutations),
+            lineages=np.array(self.lineages),
+        )
+
+    @classmethod
+    def load(cls, path=MATRIX_PATH):
+        from scipy.sparse import csr_matrix
+
+        with np.load(path) as data:
+            matrix = csr_matrix((data['data'], data['indices'], data['indptr']), shape=tuple(data['shape']))
+            return cls(matrix, data['mutations'].tolist(), data['lineages'].tolist())
+
+    @classmethod
+    def from_dict(cls, mut_lins, lineages=None):
+        """
+        Build from a {mutation: {lineage: prevalence}} dict. Lineages missing from a
+        mutation's dict have prevalence 0.
+        """
+        from scipy.sparse import csr_matrix
+
+        mutations = list(mut_lins.keys())
+        if lineages is None:
+            lineages = []
+            seen = set()
+            for mut in mutations:
+                for lin in mut_lins[mut]:
+                    if lin not in seen:
+                        seen.add(lin)
+                        lineages.append(lin)
+        lin_index = {lin: i for i, lin in enumerate(lineages)}
+        indptr = [0]
+        indices = []
+        data = []
+        for mut in mutations:
+            for lin, prev in mut_lins[mut].items():
+                if prev != 0:
+                    indices.append(lin_index[lin])
+                    data.append(prev)
+            indptr.append(len(indices))
+        matrix = csr_matrix(
+            (np.array(data, dtype=np.float32), np.array(indices, dtype=np.int32), np.array(indptr, dtype=np.int64)),
+            shape=(len(mutations), len(lineages)),
+        )
+        matrix.sort_indices()
+        return cls(matrix, mutations, lineages)
+
+
+@lru_cache(maxsize=None)
+def load_mutation_matrix(path=MATRIX_PATH):
+    # Loaded once per process, on first use
+    return MutationMatrix.load(path)
+
+
+@lru_cache(maxsize=None)
+def catalogue_version(path=MATRIX_PATH):
+    # Checksum of the catalogue, recorded with results computed from it
+    import hashlib
+
+    with open(path, 'rb') as f:
+        return hashlib.md5(f.read()).hexdigest()
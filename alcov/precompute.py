@@ -2,6 +2,8 @@ import json
 
 from Bio import SeqIO
 
+from mutation_matrix import MutationMatrix
+
 
 def process_reference():
     cov = list(SeqIO.parse("sequence.gb", "genbank"))[0]
@@ -19,21 +21,6 @@ def process_reference():
         f.write('genes = {}\n\nseq = \'{}\''.format(genes, cov.seq))
 
 
-def get_amplicons():
-    cov = list(SeqIO.parse("sequence.gb", "genbank"))[0]
-    with open('nCoV-2019.insert.bed', 'r') as f:
-        inserts = [l.split('\t') for l in f.read().split('\n')[:-1]]
-
-    for i in range(len(inserts)):
-        insert = inserts[i]
-        section = cov.seq[int(insert[1]):int(insert[2])]
-        gc = (section.count('G') + section.count('C')) / len(section)
-        inserts[i].append(gc)
-
-    with open('artic_amplicons.py', 'w') as f:
-        f.write('inserts = {}'.format(inserts))
-
-
 def fix_mut_name(old_mut_name):
     mut_name = old_mut_name.upper()
     if '/' in mut_name:
@@ -62,8 +49,7 @@ def get_mutations():
         prev = raw_m['prevalence']
         mut_lins[mut][lin] = prev
 
-    with open('mutations.py', 'w') as f:
-         f.write('mutations = {}'.format(mut_lins))
+    MutationMatrix.from_dict(mut_lins, lins).save('mutations.npz')
 
 
 def get_who_mutations():
@@ -129,8 +115,7 @@ def get_who_mutations():
                 mutations[mut_name] = {who_name: 0 for who_name in who_names}
             mutations[mut_name][who_name] = 1
 
-    with open('mutations.py', 'w') as f:
-         f.write('mutations = {}'.format(mutations))
+    MutationMatrix.from_dict(mutations, who_names).save('mutations.npz')
 
 
 def get_constellations():
@@ -187,16 +172,14 @@ def get_constellations():
                 continue
             if mut_name.startswith('NSP'): # TODO: support
                 continue
+            # Only nonzero prevalences are stored
             if mut_name not in mutations:
-                mutations[mut_name] = {voc: 0 for voc in vocs}
+                mutations[mut_name] = {}
             mutations[mut_name][voc] = 1
-    with open('mutations.py', 'w') as f:
-         # f.write('mutations = {}'.format(mutations))
-         f.write('mutations = ' + json.dumps(mutations, separators=(',', ':')))
+    MutationMatrix.from_dict(mutations, vocs).save('mutations.npz')
 
 if __name__ == '__main__':
     # process_reference()
-    # get_amplicons()
     # get_mutations()
     # get_who_mutations()
     get_constellations()
@@ -0,0 +1,262 @@
+"""
+Wall time, CPU time and memory of each pipeline stage, for each sample.
+
+Stages are marked in the code with `with stage('solve'):` (or the @profiled('solve')
+decorator) and cost nothing unless a Profile is active:
+
+    from alcov import profiling
+    with profiling.profile('profile.json') as p:
+        find_lineages_in_bams(bam_paths, names)
+    p.summary()  # {stage: {'calls', 'wall', 'cpu', 'max_rss_mb'}}
+
+Memory is the peak resident set size of the process, read at the end of each stage,
+and how much the stage raised it, so the stage that sets the peak stands out without
+the overhead of tracing allocations. Stages run in worker processes (see
+batch.map_samples) are recorded there and sent back with their results.
+"""
+import json
+import os
+import platform
+import sys
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from functools import wraps
+
+
+# Bump when the layout of the JSON output changes
+PROFILE_VERSION = 1
+
+_active = None  # the Profile recording in this process
+
+
+def max_rss_mb():
+    try:
+        import resource
+    except ImportError:  # Windows
+        return 0.0
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kB on Linux, bytes on macOS
+    return rss / 1024 ** 2 if sys.platform == 'darwin' else rss / 1024
+
+
+class Profile(object):
+    """
+    Records of the stages run while active, as dicts of stage, sample, wall and cpu
+    seconds, max_rss_mb and rss_growth_mb. on_record, if given, is called with each
+    record as it is made. With cprofile_sample, that sample is also run under cProfile
+    and its stats written to cprofile_path.
+    """
+
+    def __init__(self, on_record=None, cprofile_sample=None, cprofile_path=None):
+        self.records = []
+        self.on_record = on_record
+        self.cprofile_sample = cprofile_sample
+        self.cprofile_path = cprofile_path
+        self.sample = None
+        self.cprofiler = None  # cProfile of cprofile_sample, across all its stages in this process
+        self.cprofile_parts = []  # cProfile stats dumped by worker processes
+        self.started = None
+        self.wall = 0
+        self.cpu = 0
+
+    def add(self, record):
+        self.records.append(record)
+        if self.on_record is not None:
+            self.on_record(record)
+
+    def summary(self):
+        # Totals per stage, in the order stages first ran
+        stages = {}
+        for record in self.records:
+            total = stages.setdefault(record['stage'], {'calls': 0, 'wall': 0, 'cpu': 0, 'max_rss_mb': 0})
+            total['calls'] += 1
+            total['wall'] += record['wall']
+            total['cpu'] += record['cpu']
+            total['max_rss_mb'] = max(total['max_rss_mb'], record['max_rss_mb'])
+        for total in stages.values():
+            total['wall'] = round(total['wall'], 4)
+            total['cpu'] = round(total['cpu'], 4)
+        return stages
+
+    def to_dict(self):
+        return {
+            'version': PROFILE_VERSION,
+            'command': sys.argv,
+            'started': self.started,
+            'host': platform.node(),
+            'platform': platform.platform(),
+            'python': platform.python_version(),
+            'cpus': os.cpu_count(),
+            'wall': round(self.wall, 4),
+            'cpu': round(self.cpu, 4),
+            'max_rss_mb': round(max_rss_mb(), 1),
+            'stages': self.summary(),
+            'records': self.records,
+        }
+
+    def save(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.to_dict(), f, indent=1)
+
+    def save_cprofile(self, path):
+        # Stats of cprofile_sample from this process and the workers, if it was run
+        import pstats
+
+        if self.cprofiler is None and len(self.cprofile_parts) == 0:
+            print('Sample {} was not run, no cProfile stats written'.format(self.cprofile_sample))
+            return
+        stats = pstats.Stats()
+        if self.cprofiler is not None:
+            stats.add(self.cprofiler)
+        for part in self.cprofile_parts:
+            stats.add(part)
+        stats.dump_stats(path)
+        for part in self.cprofile_parts:
+            os.remove(part)
+        print('cProfile stats of {} written to {}'.format(self.cprofile_sample, path))
+
+
+def enabled():
+    return _active is not None
+
+
+@contextmanager
+def stage(name):
+    # Record the time and memory of the enclosed code as stage name
+    if _active is None:
+        yield
+        return
+    rss = max_rss_mb()
+    wall = time.perf_counter()
+    cpu = time.process_time()
+    try:
+        yield
+    finally:
+        end_rss = max_rss_mb()
+        _active.add({
+            'stage': name,
+            'sample': _active.sample,
+            'wall': round(time.perf_counter() - wall, 6),
+            'cpu': round(time.process_time() - cpu, 6),
+            'max_rss_mb': round(end_rss, 1),
+            'rss_growth_mb': round(end_rss - rss, 1),
+        })
+
+
+def profiled(name):
+    # Decorator recording every call of a function as stage name
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+@contextmanager
+def sample(name):
+    # Attribute the stages run in the enclosed code to sample name, and time the whole
+    # sample as the stage 'sample'
+    if _active is None:
+        yield
+        return
+    previous = _active.sample
+    _active.sample = name
+    cprofiler = None
+    if name is not None and name == _active.cprofile_sample:
+        if _active.cprofiler is None:
+            import cProfile
+            _active.cprofiler = cProfile.Profile()
+        cprofiler = _active.cprofiler
+        cprofiler.enable()
+    try:
+        with stage('sample'):
+            yield
+    finally:
+        if cprofiler is not None:
+            cprofiler.disable()
+        _active.sample = previous
+
+
+def start(on_record=None, cprofile_sample=None, cprofile_path=None):
+    global _active
+    _active = Profile(on_record, cprofile_sample, cprofile_path)
+    _active.started = datetime.now().isoformat(timespec='seconds')
+    return _active
+
+
+def stop():
+    global _active
+    p, _active = _active, None
+    return p
+
+
+@contextmanager
+def profile(path=None, cprofile_sample=None, cprofile_path=None, on_record=None):
+    """
+    Profile the enclosed code, writing the records and per stage totals to path as JSON
+    if given. cProfile stats of cprofile_sample go to cprofile_path (by default path
+    with a .prof extension).
+    """
+    if cprofile_path is None and cprofile_sample is not None:
+        cprofile_path = os.path.splitext(path)[0] + '.prof' if path is not None else 'alcov.prof'
+    p = start(on_record, cprofile_sample, cprofile_path)
+    wall = time.perf_counter()
+    cpu = time.process_time()
+    try:
+        yield p
+    finally:
+        stop()
+        p.wall = time.perf_counter() - wall
+        # Includes worker processes that have finished
+        p.cpu = time.process_time() - cpu + sum(r['cpu'] for r in p.records if r.get('worker') and r['stage'] == 'sample')
+        if path is not None:
+            p.save(path)
+            print('Profile written to {}'.format(path))
+        if cprofile_sample is not None:
+            p.save_cprofile(cprofile_path)
+
+
+@contextmanager
+def command(path=None, cprofile_sample=None):
+    # Profile a CLI command if it was given --profile or --profile_sample
+    if path is None and cprofile_sample is None:
+        yield
+        return
+    with profile(path, cprofile_sample):
+        yield
+
+
+def worker_options():
+    # What a worker process needs to profile like this one
+    return _active.cprofile_sample, _active.cprofile_path
+
+
+def run_in_worker(func, args, name, options):
+    # Call func(*args) in a worker process under a fresh Profile, returning the result
+    # and what to merge into the parent's Profile
+    cprofile_sample, cprofile_path = options
+    p = start(cprofile_sample=cprofile_sample, cprofile_path=cprofile_path)
+    try:
+        with sample(name):
+            result = func(*args)
+    finally:
+        stop()
+    for record in p.records:
+        record['worker'] = os.getpid()
+    part = None
+    if p.cprofiler is not None:
+        part = '{}.{}.part'.format(cprofile_path, os.getpid())
+        p.cprofiler.dump_stats(part)
+    return result, (p.records, part)
+
+
+def merge(worker_profile):
+    records, part = worker_profile
+    if _active is not None:
+        for record in records:
+            _active.add(record)
+        if part is not None:
+            _active.cprofile_parts.append(part)
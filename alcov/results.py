@@ -0,0 +1,60 @@
+import json
+
+
+# Bump when the layout of saved results changes
+RESULTS_VERSION = 1
+
+
+def save_results(path, command, sample_names, sample_results, **options):
+    """
+    Save the per-sample results of a command as JSON, with the options its plot needs,
+    for `alcov plot` to render later
+    """
+    results = {
+        'version': RESULTS_VERSION,
+        'command': command,
+        'samples': list(sample_names),
+        'results': list(sample_results),
+        'options': options,
+    }
+    with open(path, 'w') as f:
+        json.dump(results, f, indent=1)
+    print('Results written to {}'.format(path))
+
+
+def load_results(path):
+    with open(path, 'r') as f:
+        results = json.load(f)
+    if results.get('version') != RESULTS_VERSION:
+        raise ValueError('{} is not a results file of this version of alcov'.format(path))
+    return results
+
+
+def plot_results(results_path, save_img=False):
+    """
+    Render the plot of results saved by a command run with no_plot, saving it next to
+    the results as a PNG with save_img (where the plot supports it)
+    """
+    results = load_results(results_path)
+    command = results['command']
+    sample_results = results['results']
+    sample_names = results['samples']
+    options = results['options']
+    img_path = results_path.replace('.json', '') + '.png' if save_img else None
+    if command == 'find_lineages':
+        from .lineages import plot_lineages, plot_lineages_timeseries
+        if options.get('ts'):
+            plot_lineages_timeseries(sample_results, sample_names)
+        else:
+            plot_lineages(sample_results, sample_names, img_path, options.get('all_lins', False))
+    elif command == 'find_mutants':
+        from .analyze import plot_mutations
+        plot_mutations(sample_results, sample_names, options['min_depth'], img_path)
+    elif command == 'amplicon_coverage':
+        from .amplicon_coverage import plot_depths
+        plot_depths(sample_results, sample_names)
+    elif command == 'gc_depth':
+        from .amplicon_coverage import plot_depths_gc
+        plot_depths_gc(sample_results, sample_names, options.get('schemes'))
+    else:
+        raise ValueError('Unknown command {} in {}'.format(command, results_path))
@@ -0,0 +1,146 @@
+import hashlib
+import os
+from functools import lru_cache
+
+import numpy as np
+
+
+SCHEME_DIR = os.path.dirname(__file__)
+
+# Insert BED files shipped with alcov, by scheme name. Any other scheme (e.g. ARTIC
+# V5.3.2) is used by passing the path to its insert BED instead of a name.
+SCHEMES = {
+    'artic-v3': os.path.join(SCHEME_DIR, 'nCoV-2019.insert.bed'),
+    'artic-v4.1': os.path.join(SCHEME_DIR, 'SARS-CoV-2.insert.bed'),
+}
+DEFAULT_SCHEME = 'artic-v3'
+
+
+class PrimerScheme(object):
+    """
+    The amplicon inserts of a primer scheme, sorted by start, as arrays: 0-based
+    half-open insert coordinates, names from the BED, pools and GC content. Amplicons
+    are labelled '1', '2', ... in order along the genome.
+    """
+
+    def __init__(self, name, contig, starts, stops, names, pools, checksum=None):
+        order = np.argsort(starts, kind='stable')
+        self.name = name
+        self.contig = contig
+        self.starts = np.asarray(starts, dtype=np.int64)[order]
+        self.stops = np.asarray(stops, dtype=np.int64)[order]
+        self.names = [names[i] for i in order]
+        self.pools = np.asarray(pools, dtype=np.int64)[order]
+        self.labels = [str(i + 1) for i in range(len(order))]
+        self.checksum = checksum
+        # Amplicons overlapping an interval are then a contiguous run (see amplicons_overlapping)
+        self.tiled = bool(np.all(self.stops[1:] >= self.stops[:-1]))
+        self._gc = None
+
+    def __len__(self):
+        return len(self.starts)
+
+    @property
+    def gc(self):
+        # GC content of each insert in the reference, computed on first use
+        if self._gc is None:
+            from .sars_cov_2 import seq
+            self._gc = np.array([gc_content(seq[start:stop]) for start, stop in zip(self.starts, self.stops)])
+        return self._gc
+
+    def regions(self):
+        # (start, stop) of every insert
+        return [(int(start), int(stop)) for start, stop in zip(self.starts, self.stops)]
+
+    def amplicons_overlapping(self, starts, stops):
+        # First and one past the last amplicon overlapping each 0-based half-open interval
+        starts = np.asarray(starts, dtype=np.int64)
+        stops = np.asarray(stops, dtype=np.int64)
+        if not self.tiled:
+            raise ValueError('Scheme {} has nested amplicons, which cannot be looked up by interval'.format(self.name))
+        first = np.searchsorted(self.stops, starts, side='right')
+        last = np.searchsorted(self.starts, stops, side='left')
+        return first, np.maximum(last, first)
+
+    def amplicon_at(self, positions):
+        """
+        Index of the amplicon whose insert covers each 0-based position, or -1. Where
+        two inserts overlap, the one starting later is given.
+        """
+        positions = np.asarray(positions, dtype=np.int64)
+        idx = np.searchsorted(self.starts, positions, side='right') - 1
+        inside = (idx >= 0) & (positions < self.stops[np.maximum(idx, 0)])
+        return np.where(inside, idx, -1)
+
+    def assign_reads(self, starts, stops):
+        """
+        Index of the amplicon each read (0-based half-open reference span) overlaps the
+        most, or -1 for reads outside every insert
+        """
+        starts = np.asarray(starts, dtype=np.int64)
+        stops = np.asarray(stops, dtype=np.int64)
+        first, last = self.amplicons_overlapping(starts, stops)
+        best = np.full(len(starts), -1, dtype=np.int64)
+        best_overlap = np.zeros(len(starts), dtype=np.int64)
+        # Tiled amplicons overlap a read a few at a time, so this loops only a few times
+        width = int((last - first).max()) if len(starts) else 0
+        for k in range(width):
+            idx = first + k
+            valid = idx < last
+            safe = np.where(valid, idx, 0)
+            overlap = np.minimum(stops, self.stops[safe]) - np.maximum(starts, self.starts[safe])
+            better = valid & (overlap > best_overlap)
+            best[better] = idx[better]
+            best_overlap[better] = overlap[better]
+        return best
+
+
+def gc_content(section):
+    return (section.count('G') + section.count('C')) / len(section) if len(section) else 0
+
+
+def read_insert_bed(path, name=None):
+    """
+    A PrimerScheme from an insert BED file (contig, start, end, name, pool, strand),
+    as published with the ARTIC and primalscheme primer schemes
+    """
+    with open(path, 'rb') as f:
+        data = f.read()
+    rows = [line.split('\t') for line in data.decode().splitlines() if line.strip() and not line.startswith(('#', 'track', 'browser'))]
+    if len(rows) == 0:
+        raise ValueError('No amplicons in {}'.format(path))
+    contigs = set(row[0] for row in rows)
+    if len(contigs) > 1:
+        raise ValueError('{} has amplicons on more than one reference: {}'.format(path, ', '.join(sorted(contigs))))
+    pools = [int(''.join(c for c in row[4] if c.isdigit()) or 1) if len(row) > 4 else 1 for row in rows]
+    return PrimerScheme(
+        name if name is not None else os.path.basename(path),
+        rows[0][0],
+        [int(row[1]) for row in rows],
+        [int(row[2]) for row in rows],
+        [row[3] if len(row) > 3 else str(i + 1) for i, row in enumerate(rows)],
+        pools,
+        hashlib.md5(data).hexdigest(),
+    )
+
+
+def register_scheme(name, bed_path):
+    # Make an insert BED loadable by name
+    SCHEMES[name] = bed_path
+    load_scheme.cache_clear()
+
+
+@lru_cache(maxsize=None)
+def load_scheme(scheme=DEFAULT_SCHEME):
+    """
+    The PrimerScheme named scheme (see SCHEMES), or read from scheme if it is the path
+    to an insert BED file. Schemes are loaded once per process.
+    """
+    if scheme is None:
+        scheme = DEFAULT_SCHEME
+    if scheme in SCHEMES:
+        return read_insert_bed(SCHEMES[scheme], scheme)
+    if os.path.exists(scheme):
+        return read_insert_bed(scheme)
+    raise ValueError('Unknown primer scheme {}, expected one of {} or the path to an insert BED file'.format(
+        scheme, ', '.join(sorted(SCHEMES))))
@@ -0,0 +1,332 @@
+import time
+from collections import namedtuple
+
+import numpy as np
+
+from .profiling import profiled
+
+
+SOLVERS = ['glop', 'highs']
+
+# x: lineage abundances, residuals: |Ax - y| per mutation (the t variables),
+# status: 'optimal', 'feasible' (stopped early with a solution) or the backend's failure
+LPSolution = namedtuple('LPSolution', ['x', 'residuals', 'objective', 'status', 'iterations', 'build_time', 'solve_time'])
+
+# x: lineage abundances, valid: whether they sum to at most 1, passive: the coefficients
+# left free by the fit to all mutations (a warm start for a similar fit), iterations: of
+# all the Lawson-Hanson fits tried
+NNLSSolution = namedtuple('NNLSSolution', ['x', 'valid', 'passive', 'iterations', 'solve_time'])
+
+
+class GlopL1(object):
+    """
+    The L1 abundance LP as an OR-Tools GLOP model:
+        min sum(t)  s.t.  -t <= Ax - y <= t,  0 <= x <= 1,  sum(x) <= 1
+    A is a mutations x lineages (sparse) matrix; only its nonzeros are added to the model.
+    The model can be re-solved for a new y by updating the constraint bounds only, and
+    lineages can be left out of a solve by fixing them at 0.
+    """
+
+    def __init__(self, A):
+        from ortools.linear_solver import linear_solver_pb2, pywraplp
+
+        start = time.perf_counter()
+        A = _as_csr(A)
+        num_muts, num_lins = A.shape
+        inf = float('inf')
+        # Filled in as a model proto so each constraint's nonzeros are added in one call
+        model = linear_solver_pb2.MPModelProto()
+        for i in range(num_lins):
+            var = model.variable.add()
+            var.name = 'x_{}'.format(i)
+            var.lower_bound = 0
+            var.upper_bound = 1
+        for j in range(num_muts):
+            var = model.variable.add()
+            var.name = 't_{}'.format(j)
+            var.lower_bound = 0
+            var.upper_bound = inf
+            var.objective_coefficient = 1
+        indptr = A.indptr.tolist()
+        indices = A.indices.tolist()
+        data = A.data.tolist()
+        for j in range(num_muts):
+            lins = indices[indptr[j]:indptr[j+1]] + [num_lins + j]
+            coefs = data[indptr[j]:indptr[j+1]]
+            for name, lb, ub, t_coef in (('c_{}_1', -inf, 0, -1.0), ('c_{}_2', 0, inf, 1.0)):
+                constraint = model.constraint.add()
+                constraint.name = name.format(j)
+                constraint.lower_bound = lb
+                constraint.upper_bound = ub
+                constraint.var_index.extend(lins)
+                constraint.coefficient.extend(coefs + [t_coef])
+        freqs = model.constraint.add()
+        freqs.name = 'frequencies'
+        freqs.lower_bound = 0
+        freqs.upper_bound = 1
+        freqs.var_index.extend(range(num_lins))
+        freqs.coefficient.extend([1.0] * num_lins)
+
+        solver = pywraplp.Solver.CreateSolver('GLOP')
+        error = solver.LoadModelFromProto(model)
+        if error:
+            raise ValueError('Could not build LP: {}'.format(error))
+        variables = solver.variables()
+        constraints = solver.constraints()
+        self.lins = variables[:num_lins]
+        self.t = variables[num_lins:]
+        self.upper = constraints[0:2*num_muts:2]
+        self.lower = constraints[1:2*num_muts:2]
+        self.solver = solver
+        self.build_time = time.perf_counter() - start
+
+    def solve(self, Y, time_limit=None, active=None):
+        from ortools.linear_solver import pywraplp
+
+        start = time.perf_counter()
+        for j, y in enumerate(np.asarray(Y, dtype=float).tolist()):
+            self.upper[j].SetUb(y)
+            self.lower[j].SetLb(y)
+        if active is not None:
+            for lin, a in zip(self.lins, active):
+                lin.SetUb(1 if a else 0)
+        if time_limit is not None:
+            self.solver.SetTimeLimit(int(time_limit * 1000))
+        status = self.solver.Solve()
+        statuses = {
+            pywraplp.Solver.OPTIMAL: 'optimal',
+            pywraplp.Solver.FEASIBLE: 'feasible',
+            pywraplp.Solver.INFEASIBLE: 'infeasible',
+            pywraplp.Solver.UNBOUNDED: 'unbounded',
+            pywraplp.Solver.NOT_SOLVED: 'not solved',
+        }
+        x = np.array([lin.solution_value() for lin in self.lins])
+        residuals = np.array([t.solution_value() for t in self.t])
+        return LPSolution(
+            x,
+            residuals,
+            self.solver.Objective().Value(),
+            statuses.get(status, 'abnormal'),
+            self.solver.iterations(),
+            self.build_time,
+            time.perf_counter() - start,
+        )
+
+
+class HighsL1(object):
+    """The same LP as GlopL1, solved with scipy's HiGHS interface from one sparse constraint matrix"""
+
+    def __init__(self, A):
+        from scipy.sparse import bmat, csr_matrix, identity
+
+        start = time.perf_counter()
+        A = _as_csr(A)
+        num_muts, num_lins = A.shape
+        eye = identity(num_muts, format='csr')
+        # Variables are [x, t]
+        self.A_ub = bmat([
+            [A, -eye],
+            [-A, -eye],
+            [csr_matrix(np.ones((1, num_lins))), None],
+        ], format='csr')
+        self.c = np.concatenate((np.zeros(num_lins), np.ones(num_muts)))
+        self.bounds = [(0, 1)] * num_lins + [(0, None)] * num_muts
+        self.num_lins = num_lins
+        self.build_time = time.perf_counter() - start
+
+    def solve(self, Y, time_limit=None, active=None):
+        from scipy.optimize import linprog
+
+        start = time.perf_counter()
+        Y = np.asarray(Y, dtype=float)
+        b_ub = np.concatenate((Y, -Y, [1]))
+        bounds = self.bounds
+        if active is not None:
+            bounds = [(0, 1) if a else (0, 0) for a in active] + bounds[self.num_lins:]
+        options = {}
+        if time_limit is not None:
+            options['time_limit'] = float(time_limit)
+        res = linprog(self.c, A_ub=self.A_ub, b_ub=b_ub, bounds=bounds, method='highs', options=options)
+        if res.x is None:
+            x = np.zeros(self.num_lins)
+            residuals = np.abs(Y)
+        else:
+            x = res.x[:self.num_lins]
+            residuals = res.x[self.num_lins:]
+        statuses = {0: 'optimal', 1: 'feasible', 2: 'infeasible', 3: 'unbounded'}
+        return LPSolution(
+            x,
+            residuals,
+            res.fun if res.fun is not None else float(residuals.sum()),
+            statuses.get(res.status, 'abnormal'),
+            res.nit,
+            self.build_time,
+            time.perf_counter() - start,
+        )
+
+
+def _as_csr(A):
+    from scipy.sparse import csr_matrix, issparse
+
+    if issparse(A):
+        return A.tocsr()
+    return csr_matrix(A)
+
+
+@profiled('build_model')
+def l1_model(A, solver='glop'):
+    # Build the abundance LP for a mutations x lineages matrix with the named backend
+    if solver == 'glop':
+        return GlopL1(A)
+    if solver == 'highs':
+        return HighsL1(A)
+    raise ValueError('Unknown solver {}, expected one of {}'.format(solver, ', '.join(SOLVERS)))
+
+
+def solve_l1(A, Y, solver='glop', time_limit=None):
+    """
+    Lineage abundances x minimizing sum(|Ax - Y|) with x >= 0 and sum(x) <= 1, where
+    A is a mutations x lineages matrix and Y the observed mutation frequencies
+    """
+    return l1_model(A, solver).solve(Y, time_limit)
+
+
+class _Gram(object):
+    # X'X, optionally with one row r of X removed (X'X - rr'), without forming the update
+
+    def __init__(self, G, drop=None):
+        self.G = G
+        self.drop = drop
+
+    def sub(self, idx):
+        G_p = self.G[np.ix_(idx, idx)]
+        if self.drop is not None:
+            G_p = G_p - np.outer(self.drop[idx], self.drop[idx])
+        return G_p
+
+    def dot(self, x):
+        # Only the nonzero coefficients of x contribute
+        idx = np.nonzero(x)[0]
+        # G is symmetric, and gathering rows is cheaper than columns
+        v = x[idx] @ self.G[idx]
+        if self.drop is not None:
+            v -= self.drop * (self.drop[idx] @ x[idx])
+        return v
+
+    def solve(self, b, passive):
+        # Unconstrained least squares on the passive set, from the normal equations
+        s = np.zeros(len(b))
+        idx = np.nonzero(passive)[0]
+        if len(idx):
+            G_p = self.sub(idx)
+            try:
+                s[idx] = np.linalg.solve(G_p, b[idx])
+            except np.linalg.LinAlgError:
+                s[idx] = np.linalg.lstsq(G_p, b[idx], rcond=None)[0]
+        return s
+
+
+def nnls_tolerance(G):
+    return 10 * np.finfo(float).eps * max(np.abs(G).sum(axis=0).max(initial=0), 1) * max(len(G), 1)
+
+
+def nnls_gram(G, b, passive=None, drop=None, tol=None, max_iter=None):
+    """
+    Non-negative least squares min ||Xx - y|| s.t. x >= 0 in Gram form (G = X'X, b = X'y),
+    by the Lawson-Hanson active set method. drop is a row of X to leave out of G.
+    passive optionally warm starts the method with a guess of which coefficients are
+    positive, e.g. from a closely related problem. Returns the solution, its passive set
+    and the number of iterations.
+    """
+    n = len(b)
+    gram = _Gram(G, drop)
+    if tol is None:
+        tol = nnls_tolerance(G)
+    if max_iter is None:
+        max_iter = 3 * n + 10
+    x = np.zeros(n)
+    P = np.zeros(n, dtype=bool) if passive is None else np.array(passive, dtype=bool)
+    # Shrink a warm start to a set with a positive unconstrained solution
+    while P.any():
+        s = gram.solve(b, P)
+        if (s[P] > tol).all():
+            x = s
+            break
+        P &= s > tol
+    x[~P] = 0
+
+    w = b - gram.dot(x)
+    iterations = 0
+    for _ in range(max_iter):
+        if P.all() or w[~P].max() <= tol:
+            break
+        iterations += 1
+        P[np.argmax(np.where(P, -np.inf, w))] = True
+        s = gram.solve(b, P)
+        while (s[P] <= tol).any():
+            # Step back to the boundary and drop the coefficients that reach zero
+            neg = P & (s <= tol)
+            alpha = (x[neg] / (x[neg] - s[neg])).min()
+            x = x + alpha * (s - x)
+            P &= x > tol
+            x[~P] = 0
+            s = gram.solve(b, P)
+        x = s
+        w = b - gram.dot(x)
+    return x, P, iterations
+
+
+def r2_score_gram(x, G, b, yy, ss_tot):
+    # R^2 of the fit Xx to y, with ||y - Xx||^2 expanded as y'y - 2x'b + x'Gx
+    ss_res = max(yy - 2 * x @ b + x @ G @ x, 0)
+    if ss_tot == 0:
+        return 1.0 if ss_res == 0 else 0.0
+    return 1 - ss_res / ss_tot
+
+
+def nnls_sum_constrained(X, Y, min_score=0.8, G=None, passive=None):
+    """
+    Non-negative least squares fit of Y ~ Xx. When the abundances sum to more than 1,
+    refit without each zero frequency mutation in turn (allowing a lineage to miss one
+    mutation) and keep the best scoring refit that sums to at most 1 and scores above
+    min_score on all mutations. Refits update the Gram matrix by removing the row's
+    outer product (X'y is unchanged since its y is 0), are warm started from the full
+    fit and are shared by mutations with identical rows. G = X'X can be passed in when
+    it is shared by several fits, and passive warm starts the first fit (see nnls_gram).
+    Returns an NNLSSolution.
+    """
+
+    start = time.perf_counter()
+    X = np.asarray(X, dtype=float)
+    Y = np.asarray(Y, dtype=float)
+    if G is None:
+        G = X.T @ X
+    b = X.T @ Y
+    yy = Y @ Y
+    ss_tot = ((Y - Y.mean()) ** 2).sum() if len(Y) else 0
+
+    tol = nnls_tolerance(G)
+    x, passive, iterations = nnls_gram(G, b, passive, tol=tol)
+    if x.sum() <= 1:
+        return NNLSSolution(x, True, passive, iterations, time.perf_counter() - start)
+
+    best_x = x
+    best_score = min_score
+    valid = False
+    tried = set()
+    for i in np.nonzero(Y == 0)[0]:
+        # A row the fit doesn't use leaves the same solution optimal, which sums to > 1
+        if X[i] @ x <= 0:
+            continue
+        key = X[i].tobytes()
+        if key in tried:
+            continue
+        tried.add(key)
+        refit, _, refit_iterations = nnls_gram(G, b, passive, drop=X[i], tol=tol)
+        iterations += refit_iterations
+        score = r2_score_gram(refit, G, b, yy, ss_tot)
+        if refit.sum() <= 1 and score > best_score:
+            valid = True
+            best_score = score
+            best_x = refit
+    return NNLSSolution(best_x, valid, passive, iterations, time.perf_counter() - start)
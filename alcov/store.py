@@ -0,0 +1,185 @@
+import hashlib
+import json
+import os
+import sqlite3
+from datetime import datetime
+
+from .cache import bam_fingerprint
+
+
+# Bump when the layout of the tables changes
+STORE_VERSION = 3
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS samples (
+    fingerprint TEXT PRIMARY KEY,
+    bam TEXT NOT NULL,
+    name TEXT,
+    added TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS analyses (
+    analysis TEXT PRIMARY KEY,
+    command TEXT NOT NULL,
+    catalogue TEXT,
+    params TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS computed (
+    fingerprint TEXT NOT NULL,
+    analysis TEXT NOT NULL,
+    covered INTEGER NOT NULL,
+    computed TEXT NOT NULL,
+    PRIMARY KEY (fingerprint, analysis)
+);
+CREATE TABLE IF NOT EXISTS lineage_abundances (
+    fingerprint TEXT NOT NULL,
+    analysis TEXT NOT NULL,
+    rank INTEGER NOT NULL,
+    lineage TEXT NOT NULL,
+    abundance REAL NOT NULL,
+    PRIMARY KEY (fingerprint, analysis, rank)
+);
+CREATE TABLE IF NOT EXISTS mutation_counts (
+    fingerprint TEXT NOT NULL,
+    primers TEXT NOT NULL,
+    mutation TEXT NOT NULL,
+    muts INTEGER NOT NULL,
+    not_muts INTEGER NOT NULL,
+    PRIMARY KEY (fingerprint, primers, mutation)
+);
+CREATE TABLE IF NOT EXISTS amplicon_depths (
+    fingerprint TEXT NOT NULL,
+    analysis TEXT NOT NULL,
+    amplicon TEXT NOT NULL,
+    depth INTEGER NOT NULL,
+    mean_depth REAL NOT NULL,
+    median_depth REAL NOT NULL,
+    covered REAL NOT NULL,
+    PRIMARY KEY (fingerprint, analysis, amplicon)
+);
+'''
+
+
+def now():
+    return datetime.now().isoformat(timespec='seconds')
+
+
+class ResultStore(object):
+    """
+    Per-sample results in a SQLite file: lineage abundances, mutation counts and
+    amplicon depths. Samples are identified by their BAM fingerprint (see cache.py), so
+    a re-aligned BAM is a new sample. Lineage abundances and amplicon depths are stored
+    per analysis, the command with its parameters and catalogue version, so results
+    from an updated catalogue sit next to the old ones. Mutation counts only depend on
+    the BAM and are stored per mutation.
+    """
+
+    def __init__(self, path):
+        self.path = os.path.expanduser(path)
+        self.db = sqlite3.connect(self.path)
+        version = self.db.execute('PRAGMA user_version').fetchone()[0]
+        if version not in (0, 1, 2, STORE_VERSION):
+            raise ValueError('{} is a version {} results store, expected version {}'.format(path, version, STORE_VERSION))
+        with self.db:
+            if version == 1:
+                # Version 1 only had midpoint depths, which are read again
+                self.db.execute('DROP TABLE amplicon_depths')
+                self.db.execute("DELETE FROM computed WHERE analysis IN (SELECT analysis FROM analyses WHERE command = 'amplicon_depths')")
+            if version in (1, 2):
+                # Mutation counts are now also keyed on the primers masked, none until version 3
+                self.db.execute('ALTER TABLE mutation_counts RENAME TO old_mutation_counts')
+            self.db.executescript(SCHEMA)
+            if version in (1, 2):
+                self.db.execute("INSERT INTO mutation_counts SELECT fingerprint, '', mutation, muts, not_muts FROM old_mutation_counts")
+                self.db.execute('DROP TABLE old_mutation_counts')
+            self.db.execute('PRAGMA user_version = {}'.format(STORE_VERSION))
+
+    def close(self):
+        self.db.close()
+
+    def analysis(self, command, params, catalogue=None):
+        # Key of a command run with params against a catalogue version, recorded on first use
+        params = json.dumps(params, sort_keys=True)
+        key = hashlib.sha1(json.dumps([command, catalogue, params]).encode()).hexdigest()
+        with self.db:
+            self.db.execute('INSERT OR IGNORE INTO analyses VALUES (?, ?, ?, ?)', (key, command, catalogue, params))
+        return key
+
+    def add_sample(self, fingerprint, bam_path, name):
+        with self.db:
+            self.db.execute('INSERT OR IGNORE INTO samples VALUES (?, ?, ?, ?)', (fingerprint, os.path.abspath(bam_path), name, now()))
+            self.db.execute('UPDATE samples SET name = ? WHERE fingerprint = ?', (name, fingerprint))
+
+    def is_computed(self, fingerprint, analysis):
+        row = self.db.execute('SELECT 1 FROM computed WHERE fingerprint = ? AND analysis = ?', (fingerprint, analysis)).fetchone()
+        return row is not None
+
+    def _mark_computed(self, fingerprint, analysis, covered):
+        self.db.execute('INSERT OR REPLACE INTO computed VALUES (?, ?, ?, ?)', (fingerprint, analysis, int(covered), now()))
+
+    def put_lineages(self, fingerprint, analysis, sample_result):
+        # sample_result is None for a sample without coverage
+        with self.db:
+            self.db.execute('DELETE FROM lineage_abundances WHERE fingerprint = ? AND analysis = ?', (fingerprint, analysis))
+            if sample_result is not None:
+                self.db.executemany('INSERT INTO lineage_abundances VALUES (?, ?, ?, ?, ?)', [
+                    (fingerprint, analysis, rank, lin, float(x)) for rank, (lin, x) in enumerate(sample_result.items())])
+            self._mark_computed(fingerprint, analysis, sample_result is not None)
+
+    def get_lineages(self, fingerprint, analysis):
+        row = self.db.execute('SELECT covered FROM computed WHERE fingerprint = ? AND analysis = ?', (fingerprint, analysis)).fetchone()
+        if row is None or not row[0]:
+            return None
+        rows = self.db.execute(
+            'SELECT lineage, abundance FROM lineage_abundances WHERE fingerprint = ? AND analysis = ? ORDER BY rank',
+            (fingerprint, analysis))
+        return {lin: x for lin, x in rows}
+
+    def put_depths(self, fingerprint, analysis, depths):
+        # depths is {amplicon: {'midpoint', 'mean', 'median', 'covered'}}
+        with self.db:
+            self.db.execute('DELETE FROM amplicon_depths WHERE fingerprint = ? AND analysis = ?', (fingerprint, analysis))
+            self.db.executemany('INSERT INTO amplicon_depths VALUES (?, ?, ?, ?, ?, ?, ?)', [
+                (fingerprint, analysis, amplicon, int(stats['midpoint']), float(stats['mean']), float(stats['median']), float(stats['covered']))
+                for amplicon, stats in depths.items()])
+            self._mark_computed(fingerprint, analysis, True)
+
+    def get_depths(self, fingerprint, analysis):
+        # In amplicon order, as inserted
+        rows = self.db.execute(
+            'SELECT amplicon, depth, mean_depth, median_depth, covered FROM amplicon_depths '
+            'WHERE fingerprint = ? AND analysis = ? ORDER BY rowid',
+            (fingerprint, analysis))
+        return {amplicon: {'midpoint': depth, 'mean': mean, 'median': median, 'covered': covered}
+                for amplicon, depth, mean, median, covered in rows}
+
+    def put_mutations(self, fingerprint, mut_results, primers=''):
+        # primers is the checksum of the primer scheme masked while counting, if any
+        with self.db:
+            self.db.executemany('INSERT OR REPLACE INTO mutation_counts VALUES (?, ?, ?, ?, ?)', [
+                (fingerprint, primers, mut, int(counts[0]), int(counts[1])) for mut, counts in mut_results.items()])
+
+    def get_mutations(self, fingerprint, mutations, primers=''):
+        # Counts of each of mutations, or None unless all of them are stored
+        rows = self.db.execute('SELECT mutation, muts, not_muts FROM mutation_counts WHERE fingerprint = ? AND primers = ?', (fingerprint, primers))
+        counts = {mut: [muts, not_muts] for mut, muts, not_muts in rows}
+        if any(mut not in counts for mut in mutations):
+            return None
+        return {mut: counts[mut] for mut in mutations}
+
+
+def stored_results(store, samples, compute, has, put, get):
+    """
+    Results for each (bam path, sample name) in samples, computing only those that are
+    not in store yet. compute(samples) returns the results of a list of samples, and
+    has(fingerprint), put(fingerprint, result) and get(fingerprint) read and write store.
+    """
+    fingerprints = [bam_fingerprint(sample[0]) for sample in samples]
+    missing = [i for i, fingerprint in enumerate(fingerprints) if not has(fingerprint)]
+    print('{} of {} samples already in {}'.format(len(samples) - len(missing), len(samples), store.path))
+    if len(missing) > 0:
+        results = compute([samples[i] for i in missing])
+        for i, result in zip(missing, results):
+            store.add_sample(fingerprints[i], samples[i][0], samples[i][1])
+            put(fingerprints[i], result)
+    # Outputs are always made from the store, so they are the same on every run
+    return [get(fingerprint) for fingerprint in fingerprints]
@@ -0,0 +1,166 @@
+import json
+import os
+import signal
+import time
+from datetime import datetime
+
+from .batch import _run_captured
+from .cache import bam_fingerprint, index_path
+
+
+def find_bams(directory):
+    # Every BAM under directory, in a stable order (runs may be in subdirectories)
+    for root, dirs, files in os.walk(directory):
+        dirs.sort()
+        for fn in sorted(files):
+            if fn.endswith('.bam'):
+                yield os.path.join(root, fn)
+
+
+def bam_state(bam_path):
+    """
+    (size, mtime) of a BAM and the mtime of its index, or None if it has no index yet
+    (or either file went away)
+    """
+    idx = index_path(bam_path)
+    if idx is None:
+        return None
+    try:
+        bam_stat = os.stat(bam_path)
+        idx_mtime = os.stat(idx).st_mtime
+    except OSError:
+        return None
+    return bam_stat.st_size, bam_stat.st_mtime, idx_mtime
+
+
+def is_finished(state, settle, now=None):
+    # Indexing comes after the BAM is written, so a BAM is taken as finished when its
+    # index is at least as new as it and neither has changed for settle seconds
+    if state is None:
+        return False
+    if now is None:
+        now = time.time()
+    size, bam_mtime, idx_mtime = state
+    return idx_mtime >= bam_mtime and now - max(bam_mtime, idx_mtime) >= settle
+
+
+def load_processed(output):
+    # Fingerprints of the BAMs already in the output
+    processed = set()
+    if not os.path.exists(output):
+        return processed
+    with open(output, 'r') as f:
+        for line in f:
+            try:
+                processed.add(json.loads(line)['fingerprint'])
+            except (ValueError, KeyError):
+                # e.g. a line cut short when a previous watcher was killed
+                continue
+    return processed
+
+
+def append_record(output, record):
+    with open(output, 'a') as f:
+        f.write(json.dumps(record) + '\n')
+        f.flush()
+
+
+def process_bam(bam_path, fingerprint, mutations=None, min_depth=40, l2=False, solver='glop', cache_dir=None, mask_primers=None, threads=1):
+    """
+    Lineage abundances of one BAM, and its counts of mutations if given, as an output
+    record. Errors are recorded instead of raised so one bad file can't stop a watcher.
+    """
+    from .analyze import find_mutants_in_bam
+    from .lineages import find_lineages_in_bam
+
+    start = time.perf_counter()
+    name = os.path.basename(bam_path)[:-len('.bam')]
+    record = {'name': name, 'bam': os.path.abspath(bam_path), 'fingerprint': fingerprint}
+    print('{}:'.format(name))
+    try:
+        record['lineages'] = find_lineages_in_bam(bam_path, min_depth=min_depth, l2=l2, cache_dir=cache_dir, solver=solver, mask_primers=mask_primers, threads=threads)
+        if mutations is not None:
+            record['mutations'] = find_mutants_in_bam(bam_path, mutations, cache_dir, mask_primers, threads)
+    except Exception as e:
+        print('Error processing {}: {}'.format(bam_path, e))
+        record['error'] = repr(e)
+    print()
+    record['seconds'] = round(time.perf_counter() - start, 3)
+    record['processed'] = datetime.now().isoformat(timespec='seconds')
+    return record
+
+
+def watch(directory, output=None, mutations_path=None, min_depth=40, l2=False, solver='glop', cache_dir=None, workers=1, interval=1, settle=2, once=False, mask_primers=None, threads=1):
+    """
+    Process every finished BAM under directory once. A BAM is finished when its index
+    exists and neither has changed for settle seconds. One JSON line per BAM, with its
+    lineage abundances (and mutation counts, with mutations_path), is appended to output
+    (alcov_watch.jsonl in directory by default), which also records which BAMs are done
+    so a restarted watcher carries on where it stopped. A BAM that is rewritten is
+    processed again.
+
+    The directory is polled every interval seconds, and BAMs are processed in a pool of
+    workers processes as soon as they are finished. With once, the BAMs that are
+    finished now are processed and the watcher returns. With mask_primers (a primer
+    scheme, see schemes.py), bases in primers are not counted. threads are used by each
+    worker for its BAM.
+    """
+    if output is None:
+        output = os.path.join(directory, 'alcov_watch.jsonl')
+    mutations = None
+    if mutations_path is not None:
+        from .analyze import read_mutations
+        mutations = read_mutations(mutations_path)
+    processed = load_processed(output)
+    try:
+        # Stop cleanly when run as a service too
+        signal.signal(signal.SIGTERM, signal.default_int_handler)
+    except ValueError:
+        pass  # not the main thread
+    print('Watching {} ({} BAMs already processed), writing to {}'.format(directory, len(processed), output))
+
+    pool = None
+    if workers > 1:
+        from concurrent.futures import ProcessPoolExecutor
+        pool = ProcessPoolExecutor(max_workers=workers)
+    running = {}  # future -> bam path
+    checked = {}  # bam path -> state when last fingerprinted, to skip unchanged BAMs
+    num_done = 0
+    try:
+        while True:
+            now = time.time()
+            for bam_path in find_bams(directory):
+                state = bam_state(bam_path)
+                if checked.get(bam_path) == state or not is_finished(state, settle, now):
+                    continue
+                checked[bam_path] = state
+                fingerprint = bam_fingerprint(bam_path)
+                if fingerprint in processed:
+                    continue
+                processed.add(fingerprint)
+                args = (bam_path, fingerprint, mutations, min_depth, l2, solver, cache_dir, mask_primers, threads)
+                if pool is None:
+                    append_record(output, process_bam(*args))
+                    num_done += 1
+                else:
+                    running[pool.submit(_run_captured, process_bam, args)] = bam_path
+            if len(running) > 0:
+                from concurrent.futures import FIRST_COMPLETED, wait
+
+                done, _ = wait(running, timeout=None if once else interval, return_when=FIRST_COMPLETED)
+                for future in done:
+                    del running[future]
+                    record, log = future.result()
+                    print(log, end='')
+                    append_record(output, record)
+                    num_done += 1
+            elif once:
+                break
+            else:
+                time.sleep(interval)
+    except KeyboardInterrupt:
+        print('Stopping, {} BAMs still running'.format(len(running)))
+    finally:
+        if pool is not None:
+            pool.shutdown(wait=False)
+    print('Processed {} BAMs'.format(num_done))
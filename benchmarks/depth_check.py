@@ -0,0 +1,144 @@
+"""
+Check count_depth against the coverage of each fragment, counted read by read.
+
+The reads are simulated paired-end reads (see simulate_pairs_bam in
+benchmarks/synthetic.py) aligned to NC_045512.2, the name RefSeq gives the reference
+that primer schemes call MN908947.3, with some pairs marked as duplicates or QC failed
+and some reads given secondary and supplementary alignments, none of which count. A
+pair counts once at the positions either mate covers, outside ref skips. Depths are
+compared at every position, within the amplicons of the default primer scheme, and
+as find_depths_in_bam summarises them.
+
+    python benchmarks/depth_check.py [--pairs 10000] [--seed 0]
+
+Exits with status 1 if any position differs, so it can gate CI.
+"""
+import argparse
+import os
+import sys
+import tempfile
+
+import numpy as np
+
+from synthetic import ROOT, simulate_pairs_bam
+
+
+CONTIG = 'NC_045512.2'
+
+
+def add_flagged(path, out_path, seed=0):
+    # A copy of path with 5% of pairs duplicates, 2% QC failed, and a secondary or
+    # supplementary alignment for 5% of reads each, a few bases off the primary one
+    import pysam
+
+    rng = np.random.default_rng(seed)
+    with pysam.AlignmentFile(path, 'rb') as f:
+        header = f.header
+        reads = list(f.fetch(until_eof=True))
+    names = sorted(set(read.query_name for read in reads))
+    duplicates = set(rng.choice(names, len(names) // 20, replace=False))
+    failed = set(rng.choice(names, len(names) // 50, replace=False))
+    out = []
+    for read in reads:
+        if read.query_name in duplicates:
+            read.flag |= 0x400
+        if read.query_name in failed:
+            read.flag |= 0x200
+        out.append(read)
+        u = rng.random()
+        if u < 0.1:
+            other = pysam.AlignedSegment(header)
+            other.query_name = read.query_name
+            other.query_sequence = read.query_sequence
+            other.query_qualities = read.query_qualities
+            other.flag = read.flag | (0x100 if u < 0.05 else 0x800)
+            other.reference_id = read.reference_id
+            other.reference_start = max(read.reference_start + int(rng.integers(-50, 50)), 0)
+            other.mapping_quality = 0
+            other.cigartuples = read.cigartuples
+            other.next_reference_id = read.next_reference_id
+            other.next_reference_start = read.next_reference_start
+            out.append(other)
+    out.sort(key=lambda read: read.reference_start)
+    with pysam.AlignmentFile(out_path, 'wb', header=header) as f:
+        for read in out:
+            f.write(read)
+    pysam.index(out_path)
+
+
+def fragment_depth(bam_path):
+    # Fragments covering every position, from the alignment blocks of each primary read
+    import pysam
+
+    with pysam.AlignmentFile(bam_path, 'rb') as f:
+        length = f.lengths[0]
+        fragments = {}
+        for i, read in enumerate(f.fetch(until_eof=True)):
+            if read.flag & 0xF04:
+                continue
+            blocks = []
+            pos = read.reference_start
+            for op, l in read.cigartuples:
+                if op in (0, 2, 7, 8):
+                    blocks.append((pos, pos + l))
+                if op in (0, 2, 3, 7, 8):
+                    pos += l
+            key = read.query_name if read.flag & 2 else i
+            fragments.setdefault(key, []).extend(blocks)
+    depth = np.zeros(length, dtype=np.int64)
+    covered = np.zeros(length, dtype=bool)
+    for blocks in fragments.values():
+        covered[:] = False
+        for start, stop in blocks:
+            covered[start:stop] = True
+        depth += covered
+    return depth
+
+
+def compare(name, expected, found):
+    differ = np.nonzero(expected != found)[0]
+    print('{}: {} positions differ'.format(name, len(differ)))
+    for i in differ[:5]:
+        print('  {}: expected {}, counted {}'.format(i + 1, expected[i], found[i]))
+    return len(differ) == 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Check read depths against per-fragment coverage on paired-end reads')
+    parser.add_argument('--pairs', type=int, default=10000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--data', default=os.path.join(tempfile.gettempdir(), 'alcov-bench'), help='where the BAM is made')
+    args = parser.parse_args()
+
+    sys.path.insert(0, ROOT)
+    from alcov.amplicon_coverage import amplicon_stats, find_depths_in_bam
+    from alcov.counts import count_depth
+    from alcov.schemes import load_scheme
+
+    os.makedirs(args.data, exist_ok=True)
+    pairs_path = os.path.join(args.data, 'pairs{}_{}_refseq.bam'.format(args.pairs, args.seed))
+    bam_path = os.path.join(args.data, 'flagged{}_{}_refseq.bam'.format(args.pairs, args.seed))
+    if not os.path.exists(bam_path + '.bai'):
+        simulate_pairs_bam(pairs_path, args.pairs, seed=args.seed, contig=CONTIG)
+        add_flagged(pairs_path, bam_path, args.seed)
+    expected = fragment_depth(bam_path)
+    ok = compare('count_depth', expected, count_depth(bam_path))
+
+    scheme = load_scheme()
+    inside = np.zeros(len(expected), dtype=bool)
+    for start, stop in scheme.regions():
+        inside[start:stop] = True
+    found = count_depth(bam_path, regions=scheme.regions(), contig=scheme.contig)
+    ok = compare('count_depth in the amplicons of {}'.format(scheme.name), np.where(inside, expected, 0), np.where(inside, found, 0)) and ok
+
+    stats = amplicon_stats(expected, scheme)
+    depths = find_depths_in_bam(bam_path)
+    differ = [amplicon for i, amplicon in enumerate(stats['amplicon'])
+              if depths[amplicon]['median'] != float(stats['median'][i]) or depths[amplicon]['covered'] != round(float(stats['covered'][i]), 4)]
+    print('find_depths_in_bam: {} of {} amplicons differ'.format(len(differ), len(depths)))
+    ok = ok and len(differ) == 0
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+"""
+Check count_alleles against pysam's pileup on simulated paired-end reads.
+
+The reads (see simulate_pairs_bam in benchmarks/synthetic.py) have overlapping mates
+with deletions, insertions and ref skips, where htslib lowers the qualities of one mate
+as the pileup goes. Every position is compared with pileup(stepper='nofilter') at the
+same min_base_quality, serially and with threads, and so are the positions counted
+through the BAM index from the regions around --sites random sites, as find_mutants does.
+
+    python benchmarks/pileup_check.py [--pairs 10000] [--seed 0] [--min_base_quality 13] [--threads 2] [--sites 300]
+
+Exits with status 1 if any position differs, so it can gate CI.
+"""
+import argparse
+import os
+import sys
+import tempfile
+
+import numpy as np
+
+from synthetic import ROOT, simulate_pairs_bam
+
+
+def pileup_counts(bam_path, min_base_quality):
+    # Allele counts from pysam's pileup, deletions and ref skips counted as deletions
+    import pysam
+    from alcov.counts import ALLELES, DEL, OTHER
+
+    with pysam.AlignmentFile(bam_path, 'rb') as f:
+        counts = np.zeros((f.lengths[0], len(ALLELES)), dtype=np.int32)
+        for column in f.pileup(f.references[0], stepper='nofilter', max_depth=10 ** 9, min_base_quality=min_base_quality):
+            for read in column.pileups:
+                if read.is_del or read.is_refskip:
+                    counts[column.reference_pos, DEL] += 1
+                else:
+                    base = read.alignment.query_sequence[read.query_position]
+                    counts[column.reference_pos, ALLELES.index(base) if base in 'ACGT' else OTHER] += 1
+    return counts
+
+
+def compare(name, expected, found):
+    differ = np.nonzero((expected != found).any(axis=1))[0]
+    print('{}: {} positions differ'.format(name, len(differ)))
+    for i in differ[:5]:
+        print('  {}: pileup {}, counted {}'.format(i + 1, expected[i], found[i]))
+    return len(differ) == 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Check allele counts against pysam pileup on paired-end reads')
+    parser.add_argument('--pairs', type=int, default=10000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--min_base_quality', type=int, default=13)
+    parser.add_argument('--threads', type=int, default=2)
+    parser.add_argument('--sites', type=int, default=300, help='random sites counted through the BAM index')
+    parser.add_argument('--data', default=os.path.join(tempfile.gettempdir(), 'alcov-bench'), help='where the BAM is made')
+    args = parser.parse_args()
+
+    sys.path.insert(0, ROOT)
+    from alcov.analyze import merge_positions
+    from alcov.counts import count_alleles
+
+    os.makedirs(args.data, exist_ok=True)
+    bam_path = os.path.join(args.data, 'pairs{}_{}.bam'.format(args.pairs, args.seed))
+    if not os.path.exists(bam_path + '.bai'):
+        simulate_pairs_bam(bam_path, args.pairs, seed=args.seed)
+    expected = pileup_counts(bam_path, args.min_base_quality)
+    ok = compare('count_alleles', expected, count_alleles(bam_path, min_base_quality=args.min_base_quality).counts)
+    if args.threads > 1:
+        found = count_alleles(bam_path, min_base_quality=args.min_base_quality, threads=args.threads).counts
+        ok = compare('count_alleles with {} threads'.format(args.threads), expected, found) and ok
+
+    # Nothing is counted outside the regions
+    sites = np.random.default_rng(args.seed).integers(1, len(expected) + 1, args.sites)
+    regions = merge_positions(sites, max_gap=50)
+    inside = np.zeros(len(expected), dtype=bool)
+    for start, stop in regions:
+        inside[start:stop] = True
+    for threads in sorted(set([1, args.threads])):
+        found = count_alleles(bam_path, regions=regions, min_base_quality=args.min_base_quality, threads=threads).counts
+        name = 'count_alleles in {} regions with {} thread{}'.format(len(regions), threads, 's' if threads > 1 else '')
+        ok = compare(name, np.where(inside[:, None], expected, 0), found) and ok
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
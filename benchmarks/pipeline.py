@@ -0,0 +1,249 @@
+"""
+Time, peak memory and accuracy of the alcov hot paths on synthetic BAM files.
+
+Each stage (find_mutants_in_bam, find_lineages_in_bam, do_regression_linear and
+find_depths_in_bam) runs repeat times on every sample, without the allele count cache.
+Times are the median over repeats, summed over samples, and peak memory is the largest
+tracemalloc peak of one call (numpy and Python allocations, not pysam's). Accuracy is
+the distance between the abundances found by find_lineages_in_bam and the simulated
+mixture (see benchmarks/synthetic.py).
+
+    python benchmarks/pipeline.py run [--samples 4] [--depth 500] [--read_length 150] [--repeat 3] [--out new.json]
+
+benchmarks the working tree. With --revision, any git revision is benchmarked instead
+(from a temporary worktree, on the same BAMs), and two results are compared with
+
+    python benchmarks/pipeline.py run --revision v0.3 --out base.json
+    python benchmarks/pipeline.py compare base.json new.json [--threshold 0.1]
+
+which exits with status 1 if a stage got slower by more than threshold, or less
+accurate by more than --accuracy_threshold, so it can gate CI.
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from contextlib import redirect_stdout
+
+from synthetic import CONSTELLATIONS, PANEL, make_samples
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STAGES = ['find_mutants_in_bam', 'find_lineages_in_bam', 'do_regression_linear', 'find_depths_in_bam']
+
+
+def panel_mutations(panel=PANEL):
+    # The SNVs of the panel's constellations, the mutations counted by find_mutants_in_bam
+    mutations = set()
+    for lineage in panel:
+        with open(os.path.join(CONSTELLATIONS, lineage + '.json'), 'r') as f:
+            mutations.update(site for site in json.load(f)['sites'] if ':' not in site and site[1:-1].isdigit())
+    return sorted(mutations, key=lambda mut: int(mut[1:-1]))
+
+
+def lineage_name(label):
+    return label[:-len('-like')] if label.endswith('-like') else label
+
+
+def abundance_error(sample_result, mixture):
+    """
+    Total variation distance between the abundances found and the true mixture. Merged
+    lineages ('BA.2-like or BA.2.3-like') are credited with the sum of their members.
+    """
+    if sample_result is None:
+        return 1.0
+    error = 0
+    found = set()
+    for lins, x in sample_result.items():
+        members = [lineage_name(lin) for lin in lins.split(' or ')]
+        found.update(members)
+        error += abs(x - sum(mixture.get(lin, 0) for lin in members))
+    error += sum(w for lin, w in mixture.items() if lin not in found)
+    return round(error / 2, 4)
+
+
+def run_stage(func, args, repeat):
+    # Median seconds over repeat calls, and the tracemalloc peak of one more call
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        with redirect_stdout(io.StringIO()):
+            result = func(*args)
+        times.append(time.perf_counter() - start)
+    tracemalloc.start()
+    with redirect_stdout(io.StringIO()):
+        func(*args)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    times.sort()
+    return result, times[len(times) // 2], peak
+
+
+def run(samples, repeat):
+    # Benchmark the alcov found first on sys.path
+    from alcov.amplicon_coverage import find_depths_in_bam
+    from alcov.analyze import find_mutants_in_bam
+    from alcov.lineages import do_regression_linear, find_lineages_in_bam
+
+    mutations = panel_mutations()
+    stages = {stage: {'seconds': 0, 'peak_mb': 0} for stage in STAGES}
+    accuracy = {}
+
+    def record(stage, func, args):
+        result, seconds, peak = run_stage(func, args, repeat)
+        stages[stage]['seconds'] += seconds
+        stages[stage]['peak_mb'] = max(stages[stage]['peak_mb'], peak / 1024 ** 2)
+        return result
+
+    # Load the catalogue and solvers outside of the timings
+    with redirect_stdout(io.StringIO()):
+        find_lineages_in_bam(samples[0][0])
+    for bam_path, name, mixture in samples:
+        print('{}: {}'.format(name, ', '.join('{} {}'.format(lin, w) for lin, w in mixture.items())))
+        record('find_mutants_in_bam', find_mutants_in_bam, (bam_path, mutations))
+        result = record('find_lineages_in_bam', find_lineages_in_bam, (bam_path, True))
+        if result is None:
+            accuracy[name] = abundance_error(None, mixture)
+            continue
+        sample_result, X, Y, covered_muts = result
+        accuracy[name] = abundance_error(sample_result, mixture)
+        record('do_regression_linear', do_regression_linear, (X.T, Y, covered_muts))
+        record('find_depths_in_bam', find_depths_in_bam, (bam_path,))
+    for stage in STAGES:
+        stages[stage] = {key: round(value, 4) for key, value in stages[stage].items()}
+    return stages, accuracy
+
+
+def git_revision(path):
+    try:
+        out = subprocess.run(['git', '-C', path, 'rev-parse', 'HEAD'], check=True, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+        return out.stdout.decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_revision(revision, argv):
+    # Run this benchmark in a child process against a temporary worktree of revision
+    tmp = tempfile.mkdtemp(prefix='alcov-bench-')
+    worktree = os.path.join(tmp, 'alcov')
+    subprocess.run(['git', '-C', ROOT, 'worktree', 'add', '--detach', worktree, revision], check=True)
+    try:
+        subprocess.run([sys.executable, os.path.abspath(__file__)] + argv + ['--alcov', worktree], check=True)
+    finally:
+        subprocess.run(['git', '-C', ROOT, 'worktree', 'remove', '--force', worktree])
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def without_option(argv, option):
+    # argv less option and its value, given as --option value or --option=value
+    out = []
+    skip = False
+    for arg in argv:
+        if skip:
+            skip = False
+        elif arg == option:
+            skip = True
+        elif not arg.startswith(option + '='):
+            out.append(arg)
+    return out
+
+
+def print_results(results):
+    for stage in STAGES:
+        print('{:<28} {:>9.3f}s {:>9.1f} MB'.format(stage, results['stages'][stage]['seconds'], results['stages'][stage]['peak_mb']))
+    print('{:<28} {:>9.4f} mean abundance error'.format('accuracy', results['mean_error']))
+
+
+def run_command(args, argv):
+    if args.revision is not None:
+        # The BAMs are made here, so both revisions see the same reads
+        make_samples(args.data, args.samples, args.depth, args.read_length, args.error_rate, args.seed)
+        run_revision(args.revision, without_option(argv, '--revision'))
+        return
+
+    sys.path.insert(0, args.alcov)
+    os.environ.pop('ALCOV_CACHE_DIR', None)
+    samples = make_samples(args.data, args.samples, args.depth, args.read_length, args.error_rate, args.seed)
+    start = time.perf_counter()
+    stages, accuracy = run(samples, args.repeat)
+    import resource
+    results = {
+        'revision': git_revision(args.alcov),
+        'python': platform.python_version(),
+        'params': {'samples': args.samples, 'depth': args.depth, 'read_length': args.read_length,
+                   'error_rate': args.error_rate, 'seed': args.seed, 'repeat': args.repeat},
+        'stages': stages,
+        'accuracy': accuracy,
+        'mean_error': round(sum(accuracy.values()) / len(accuracy), 4),
+        # ru_maxrss is in kB on Linux
+        'max_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        'seconds': round(time.perf_counter() - start, 3),
+    }
+    print_results(results)
+    if args.out is not None:
+        with open(args.out, 'w') as f:
+            json.dump(results, f, indent=1)
+
+
+def compare_command(args):
+    with open(args.base, 'r') as f:
+        base = json.load(f)
+    with open(args.new, 'r') as f:
+        new = json.load(f)
+    if base['params'] != new['params']:
+        print('Warning: results are for different parameters')
+    print('{:<28} {:>10} {:>10} {:>8}'.format('', (base['revision'] or 'base')[:10], (new['revision'] or 'new')[:10], 'ratio'))
+    failed = False
+    for stage in STAGES:
+        b, n = base['stages'][stage]['seconds'], new['stages'][stage]['seconds']
+        ratio = n / b if b > 0 else 1
+        slower = ratio > 1 + args.threshold
+        failed = failed or slower
+        print('{:<28} {:>9.3f}s {:>9.3f}s {:>7.2f}x{}'.format(stage, b, n, ratio, ' slower' if slower else ''))
+    for stage in STAGES:
+        b, n = base['stages'][stage]['peak_mb'], new['stages'][stage]['peak_mb']
+        print('{:<28} {:>8.1f}MB {:>8.1f}MB'.format(stage + ' peak', b, n))
+    b, n = base['mean_error'], new['mean_error']
+    worse = n - b > args.accuracy_threshold
+    failed = failed or worse
+    print('{:<28} {:>10.4f} {:>10.4f}{}'.format('mean abundance error', b, n, ' less accurate' if worse else ''))
+    sys.exit(1 if failed else 0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the alcov hot paths on synthetic BAM files')
+    commands = parser.add_subparsers(dest='command')
+    commands.required = True
+    run_parser = commands.add_parser('run', help='benchmark the working tree or a git revision')
+    run_parser.add_argument('--samples', type=int, default=4)
+    run_parser.add_argument('--depth', type=float, default=500, help='mean read depth')
+    run_parser.add_argument('--read_length', type=int, default=150)
+    run_parser.add_argument('--error_rate', type=float, default=0.002)
+    run_parser.add_argument('--seed', type=int, default=0)
+    run_parser.add_argument('--repeat', type=int, default=3)
+    run_parser.add_argument('--data', default=os.path.join(tempfile.gettempdir(), 'alcov-bench'), help='where the BAMs are made')
+    run_parser.add_argument('--revision', help='git revision to benchmark instead of the working tree')
+    run_parser.add_argument('--alcov', default=ROOT, help=argparse.SUPPRESS)
+    run_parser.add_argument('--out', help='write the results to a JSON file')
+    compare_parser = commands.add_parser('compare', help='compare two results files')
+    compare_parser.add_argument('base')
+    compare_parser.add_argument('new')
+    compare_parser.add_argument('--threshold', type=float, default=0.1, help='fraction slower that counts as a regression')
+    compare_parser.add_argument('--accuracy_threshold', type=float, default=0.01)
+    argv = sys.argv[1:]
+    args = parser.parse_args(argv)
+    if args.command == 'run':
+        run_command(args, argv)
+    else:
+        compare_command(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+"""
+Startup time of the lightweight alcov subcommands.
+
+Runs each command a number of times in a fresh interpreter and compares the median
+wall time, less the time to start a bare interpreter, against a target. Exits with
+status 1 if any command is over target, so it can gate CI.
+
+    python benchmarks/startup.py [--runs 15] [--target 0.15]
+"""
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+
+COMMANDS = [
+    ['nt', 'A23063T'],
+    ['aa', 'S:E484K'],
+]
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CLI = 'from alcov.command_line import main; main()'
+
+
+def median_time(args, runs):
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join([ROOT, env.get('PYTHONPATH', '')])
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable] + args, env=env, check=True, stdout=subprocess.DEVNULL)
+        times.append(time.perf_counter() - start)
+    times.sort()
+    return times[len(times) // 2]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure alcov CLI startup time')
+    parser.add_argument('--runs', type=int, default=15)
+    parser.add_argument('--target', type=float, default=0.15, help='seconds over bare interpreter startup')
+    args = parser.parse_args()
+
+    base = median_time(['-c', 'pass'], args.runs)
+    print('interpreter: {:.0f} ms'.format(base * 1000))
+    failed = False
+    for cmd in COMMANDS:
+        t = median_time(['-c', CLI] + cmd, args.runs) - base
+        ok = t <= args.target
+        failed = failed or not ok
+        print('alcov {}: {:.0f} ms ({})'.format(' '.join(cmd), t * 1000, 'ok' if ok else 'over target'))
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,239 @@
+"""
+Reproducible synthetic SARS-CoV-2 BAM files for benchmarking.
+
+Reads are drawn from a mixture of lineage genomes (the reference with the SNVs of each
+lineage's constellation in alcov/data/constellations applied), uniformly over the
+genome, on random strands, with substitution errors. The same arguments and seed always
+give the same reads.
+
+    python benchmarks/synthetic.py out_dir [--samples 4] [--depth 500] [--read_length 150] [--seed 0]
+
+writes out_dir/sample{i}.bam (indexed), out_dir/samples.txt and out_dir/mixtures.json
+with the true abundance of each lineage in each sample.
+"""
+import argparse
+import json
+import os
+import sys
+
+import numpy as np
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CONSTELLATIONS = os.path.join(ROOT, 'alcov', 'data', 'constellations')
+CONTIG = 'MN908947.3'
+
+# Lineages that mixtures are drawn from by default, far enough apart to be told apart
+PANEL = ['B.1.1.7', 'B.1.617.2', 'BA.1', 'BA.2', 'BA.5', 'BQ.1.1', 'XBB.1.5', 'EG.5', 'JN.1', 'KP.3']
+
+
+def reference():
+    # Appended, not prepended, so that the alcov being benchmarked is not shadowed
+    if ROOT not in sys.path:
+        sys.path.append(ROOT)
+    from alcov.sars_cov_2 import seq
+    return seq
+
+
+def lineage_genome(lineage, ref, constellations=CONSTELLATIONS):
+    # The reference with the SNVs of a lineage's constellation applied, as bytes
+    with open(os.path.join(constellations, lineage + '.json'), 'r') as f:
+        sites = json.load(f)['sites']
+    genome = bytearray(ref.encode())
+    for site in sites:
+        if ':' in site or not site[1:-1].isdigit() or site[-1] not in 'ACGT':
+            continue
+        genome[int(site[1:-1]) - 1] = ord(site[-1])
+    return bytes(genome)
+
+
+def random_mixtures(num_samples, panel=PANEL, max_lineages=3, seed=0):
+    # A few lineages from panel per sample, with Dirichlet distributed abundances
+    rng = np.random.default_rng(seed)
+    mixtures = []
+    for _ in range(num_samples):
+        k = rng.integers(1, max_lineages + 1)
+        lineages = rng.choice(panel, size=k, replace=False)
+        weights = np.round(rng.dirichlet(np.ones(k)), 3)
+        weights[-1] = max(round(1 - weights[:-1].sum(), 3), 0)
+        mixtures.append({str(lin): float(w) for lin, w in zip(lineages, weights)})
+    return mixtures
+
+
+def simulate_bam(path, mixture, depth=500, read_length=150, error_rate=0.002, seed=0, chunk=20000):
+    """
+    Write a sorted, indexed BAM of reads from mixture ({lineage: abundance}) with a mean
+    depth of depth
+    """
+    import pysam
+
+    ref = reference()
+    rng = np.random.default_rng(seed)
+    lineages = sorted(mixture)
+    weights = np.array([mixture[lin] for lin in lineages], dtype=float)
+    genomes = np.array([np.frombuffer(lineage_genome(lin, ref), dtype=np.uint8) for lin in lineages])
+
+    num_reads = int(depth * len(ref) / read_length)
+    starts = np.sort(rng.integers(0, len(ref) - read_length + 1, num_reads))
+    sources = rng.choice(len(lineages), size=num_reads, p=weights / weights.sum())
+    reverse = rng.random(num_reads) < 0.5
+    bases = np.frombuffer(b'ACGT', dtype=np.uint8)
+    qualities = pysam.qualitystring_to_array('F' * read_length)
+    offsets = np.arange(read_length)
+
+    header = {'HD': {'VN': '1.0', 'SO': 'coordinate'}, 'SQ': [{'LN': len(ref), 'SN': CONTIG}]}
+    with pysam.AlignmentFile(path, 'wb', header=header) as f:
+        for first in range(0, num_reads, chunk):
+            last = min(first + chunk, num_reads)
+            seqs = genomes[sources[first:last, None], starts[first:last, None] + offsets]
+            errors = rng.random(seqs.shape) < error_rate
+            seqs[errors] = bases[rng.integers(0, 4, errors.sum())]
+            for i in range(last - first):
+                read = pysam.AlignedSegment()
+                read.query_name = 'r{}'.format(first + i)
+                read.query_sequence = seqs[i].tobytes().decode()
+                read.flag = 16 if reverse[first + i] else 0
+                read.reference_id = 0
+                read.reference_start = int(starts[first + i])
+                read.mapping_quality = 60
+                read.cigartuples = [(0, read_length)]
+                read.query_qualities = qualities
+                f.write(read)
+    pysam.index(path)
+
+
+def simulate_read(ref, pos, read_length, events, rng, error_rate=0.002):
+    # A read from pos with the fragment's indels and ref skips (events, {ref position:
+    # (cigar op, length)}), random soft clips and qualities, as (sequence, cigar)
+    bases = 'ACGT'
+    seq = []
+    cigar = []
+
+    def push(op, length):
+        if len(cigar) and cigar[-1][0] == op:
+            cigar[-1] = (op, cigar[-1][1] + length)
+        else:
+            cigar.append((op, length))
+
+    if rng.random() < 0.1:
+        clip = int(rng.integers(1, 10))
+        seq.extend(rng.choice(list(bases), clip))
+        push(4, clip)
+    r = pos
+    while len(seq) < read_length and r < len(ref):
+        op, length = events.get(r, (0, 0))
+        # Aligners don't always agree on the indels of both mates
+        if op and rng.random() < 0.9 and len(cigar) and cigar[-1][0] in (0, 1):
+            if op == 1 and len(seq) + length < read_length:
+                seq.extend(rng.choice(list(bases), length))
+                push(1, length)
+            elif op != 1:
+                push(op, length)
+                r += length
+                continue
+        seq.append(bases[rng.integers(0, 4)] if rng.random() < error_rate else ref[r])
+        push(0, 1)
+        r += 1
+    return ''.join(seq), cigar
+
+
+def simulate_pairs_bam(path, num_pairs=10000, read_length=150, error_rate=0.01, seed=0, contig=CONTIG):
+    """
+    Write a sorted, indexed BAM of num_pairs read pairs from the reference, with mates
+    that overlap, deletions, insertions and ref skips shared by both mates of most
+    fragments, soft clips and random qualities. These are the cases where overlapping
+    mates make pileups hard to reproduce (see benchmarks/pileup_check.py). The reads are
+    aligned to contig, which is the reference under another name with NC_045512.2.
+    """
+    import pysam
+
+    ref = reference()
+    rng = np.random.default_rng(seed)
+    reads = []
+    for i in range(num_pairs):
+        start = int(rng.integers(0, len(ref) - 2 * read_length))
+        events = {}
+        for x in range(start, start + 2 * read_length):
+            u = rng.random()
+            if u < 0.01:
+                events[x] = (2, int(rng.integers(1, 6)))
+            elif u < 0.015:
+                events[x] = (1, int(rng.integers(1, 4)))
+            elif u < 0.017:
+                events[x] = (3, int(rng.integers(5, 50)))
+        mate_start = start + int(rng.integers(0, read_length))
+        pair = []
+        for pos in (start, mate_start):
+            seq, cigar = simulate_read(ref, pos, read_length, events, rng, error_rate)
+            read = pysam.AlignedSegment()
+            read.query_name = 'p{}'.format(i)
+            read.query_sequence = seq
+            read.reference_id = 0
+            read.reference_start = pos
+            read.mapping_quality = 60
+            read.cigartuples = cigar
+            read.query_qualities = pysam.qualitystring_to_array(''.join(chr(33 + q) for q in rng.integers(2, 42, len(seq))))
+            pair.append(read)
+        first, second = pair
+        tlen = max(first.reference_end, second.reference_end) - start
+        for read, mate, flag, sign in ((first, second, 0x63, 1), (second, first, 0x93, -1)):
+            read.flag = flag
+            read.next_reference_id = 0
+            read.next_reference_start = mate.reference_start
+            read.template_length = sign * tlen
+        reads.extend(pair)
+
+    reads.sort(key=lambda read: read.reference_start)
+    header = {'HD': {'VN': '1.0', 'SO': 'coordinate'}, 'SQ': [{'LN': len(ref), 'SN': contig}]}
+    with pysam.AlignmentFile(path, 'wb', header=header) as f:
+        for read in reads:
+            f.write(read)
+    pysam.index(path)
+
+
+def make_samples(out_dir, num_samples=4, depth=500, read_length=150, error_rate=0.002, seed=0, panel=PANEL):
+    """
+    Simulate num_samples BAMs in out_dir, reusing those already made with the same
+    arguments. Returns [(bam path, sample name, mixture)].
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    params = {'depth': depth, 'read_length': read_length, 'error_rate': error_rate, 'seed': seed}
+    mixtures = random_mixtures(num_samples, panel, seed=seed)
+    manifest_path = os.path.join(out_dir, 'mixtures.json')
+    manifest = {}
+    if os.path.exists(manifest_path):
+        with open(manifest_path, 'r') as f:
+            manifest = json.load(f)
+
+    samples = []
+    for i, mixture in enumerate(mixtures):
+        name = 'sample{}'.format(i)
+        path = os.path.join(out_dir, name + '.bam')
+        entry = dict(params, mixture=mixture)
+        if manifest.get(name) != entry or not os.path.exists(path + '.bai'):
+            print('Simulating {} ({})'.format(name, ', '.join('{} {}'.format(lin, w) for lin, w in mixture.items())))
+            simulate_bam(path, mixture, depth, read_length, error_rate, seed=seed * 1000 + i)
+            manifest[name] = entry
+        samples.append((path, name, mixture))
+
+    with open(manifest_path, 'w') as f:
+        json.dump(manifest, f, indent=1)
+    with open(os.path.join(out_dir, 'samples.txt'), 'w') as f:
+        f.write('\n'.join('{}\t{}'.format(path, name) for path, name, mixture in samples))
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Simulate SARS-CoV-2 BAM files from lineage mixtures')
+    parser.add_argument('out_dir')
+    parser.add_argument('--samples', type=int, default=4)
+    parser.add_argument('--depth', type=float, default=500, help='mean read depth')
+    parser.add_argument('--read_length', type=int, default=150)
+    parser.add_argument('--error_rate', type=float, default=0.002, help='substitution errors per base')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    make_samples(args.out_dir, args.samples, args.depth, args.read_length, args.error_rate, args.seed)
+
+
+if __name__ == '__main__':
+    main()
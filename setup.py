@@ -14,6 +14,9 @@ setup(
     maintainer='Jenn Knapp',
     maintainer_email='jenn.knapp@uwaterloo.ca',
     packages=['alcov'],
+    package_data={
+	'alcov': ['mutations.npz', 'alias_key.json', 'nCoV-2019.insert.bed', 'SARS-CoV-2.insert.bed'],
+	},
     exclude_package_data={
 	'alcov': ['data'],
 	},
@@ -22,10 +25,10 @@ setup(
         'fire',
         'numpy',
         'pandas',
-        'scikit-learn>=0.24',
         'matplotlib',
         'seaborn',
         'pysam',
+        'scipy',
     ],
     entry_points={
         'console_scripts': ['alcov=alcov.command_line:main'],